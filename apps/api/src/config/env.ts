@@ -11,6 +11,8 @@ const envSchema = z.object({
 
   // Redis (queue)
   REDIS_URL: z.string().default('redis://localhost:6379'),
+  // 'list' (RPUSH) or 'stream' (XADD, for workers with QUEUE_TRANSPORT=stream)
+  QUEUE_TRANSPORT: z.enum(['list', 'stream']).default('list'),
 
   // Internal auth (worker -> API callbacks)
   WORKER_API_KEY: z.string().min(16).optional(),
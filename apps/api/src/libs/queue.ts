@@ -3,6 +3,7 @@ import { env } from '../config/env';
 import { logger } from './logger';
 
 export const JOB_QUEUE_KEY_V1 = 'imagepivot:jobs:v1';
+export const JOB_STREAM_KEY_V1 = 'imagepivot:jobs:stream:v1';
 
 type RedisClient = ReturnType<typeof createClient>;
 let redisClient: RedisClient | null = null;
@@ -41,8 +42,9 @@ export interface QueueJobV1 {
   metadata: {
     utmSource: string | null;
     utmCampaign: string | null;
-    priority: number;
+    priority: number; // 0-10, higher is more urgent
     queuedAt: string; // ISO8601
+    deadlineSeconds: number | null; // relative to queuedAt; null = worker default for the priority
     attempt: number;
     maxAttempts: number;
     idempotencyKey: string | null;
@@ -60,6 +62,18 @@ export async function enqueueJobV1(payload: QueueJobV1): Promise<void> {
     queueKey: JOB_QUEUE_KEY_V1,
   });
   
+  if (env.QUEUE_TRANSPORT === 'stream') {
+    const entryId = await client.xAdd(JOB_STREAM_KEY_V1, '*', { payload: payloadStr });
+
+    logger.info('[QUEUE] Job enqueued', {
+      jobId: payload.jobId,
+      queueKey: JOB_STREAM_KEY_V1,
+      entryId,
+      queueLength: await client.xLen(JOB_STREAM_KEY_V1),
+    });
+    return;
+  }
+
   await client.rPush(JOB_QUEUE_KEY_V1, payloadStr);
   
   logger.info('[QUEUE] Job enqueued', {
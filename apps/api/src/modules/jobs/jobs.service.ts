@@ -135,6 +135,7 @@ export class JobsService {
           utmCampaign: input.utmCampaign || null,
           priority: input.priority,
           queuedAt: new Date().toISOString(),
+          deadlineSeconds: input.deadlineSeconds ?? null,
           attempt: 0,
           maxAttempts: input.maxAttempts,
           idempotencyKey,
@@ -117,7 +117,8 @@ export const createJobSchema = z
     params: z.record(z.string(), z.unknown()).default({}),
     utmSource: z.string().min(1).optional(),
     utmCampaign: z.string().min(1).optional(),
-    priority: z.number().int().min(0).max(10).default(5),
+    priority: z.number().int().min(0).max(10).default(5), // higher is more urgent
+    deadlineSeconds: z.number().int().min(1).max(7 * 24 * 3600).optional(), // from enqueue; default derives from priority
     maxAttempts: z.number().int().min(1).max(10).default(3),
   })
   .superRefine((val, ctx) => {
@@ -1,7 +1,66 @@
+"""
+Job status callbacks to the API.
+
+Every process keeps one keep-alive requests.Session, so a status update
+reuses a pooled connection instead of opening a new TCP/TLS connection.
+
+PROCESSING updates are sent by a background reporter thread, so a job
+doesn't wait on API latency for them. They go onto a bounded queue and are
+dropped when it is full. A newer PROCESSING update for a job replaces one
+still waiting to be sent.
+
+Terminal updates (COMPLETED/FAILED/CANCELLED) are sent inline, before the
+task returns and Celery acks its message (acks_late), so a child killed
+right after a job can't lose its outcome. They are retried with exponential
+backoff on connection errors, 5xx, 408 and 429, and first cancel or wait
+out any PROCESSING update for the same job so it can't land afterwards.
+
+drain() sends queued PROCESSING updates; it runs at job-process shutdown
+and at exit.
+
+Env:
+    API_STATUS_ASYNC: send PROCESSING from the reporter thread (default: true)
+    API_STATUS_QUEUE_SIZE: PROCESSING updates that may wait (default: 1000)
+    API_STATUS_MAX_ATTEMPTS: attempts for a terminal update (default: 5)
+    API_STATUS_DRAIN_TIMEOUT_SECONDS: how long drain() waits (default: 10)
+    API_POOL_MAXSIZE: pooled connections per process (default: 4)
+"""
+import atexit
 import os
-from typing import Any, Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+RETRYABLE_STATUS_CODES = (408, 429)
+REQUEST_TIMEOUT_SECONDS = 10
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+_reporter: Optional["StatusReporter"] = None
+_reporter_lock = threading.Lock()
+
+# Last job this process sent (or tried to send) a terminal status for.
+_last_terminal_job: Optional[str] = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def is_async() -> bool:
+    return os.getenv("API_STATUS_ASYNC", "true").lower() in ("1", "true", "yes")
 
 
 def _api_base_url() -> str:
@@ -16,6 +75,165 @@ def _worker_api_key() -> str:
     return key
 
 
+def _get_session() -> requests.Session:
+    """The process-wide keep-alive session, created on first use (and again after fork)."""
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            pool_size = max(1, _env_int("API_POOL_MAXSIZE", 4))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, pid
+        return _session
+
+
+def _reset_after_fork() -> None:
+    # The parent's sockets, reporter thread and any lock they held don't belong to the child.
+    global _session, _session_pid, _session_lock, _reporter, _reporter_lock
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+    _reporter = None
+    _reporter_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _send(job_id: str, payload: Dict[str, Any]) -> None:
+    url = f"{_api_base_url()}/jobs/internal/{job_id}/status"
+    headers = {"x-worker-api-key": _worker_api_key()}
+
+    print(f"[API_CLIENT] Updating job status: jobId={job_id}, status={payload['status']}, url={url}")
+
+    try:
+        resp = _get_session().post(url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+        resp.raise_for_status()
+        print(f"[API_CLIENT] Job status updated successfully: jobId={job_id}, status={payload['status']}")
+    except requests.exceptions.RequestException as e:
+        print(f"[API_CLIENT] ERROR: Failed to update job status: jobId={job_id}, error={e}")
+        if hasattr(e, 'response') and e.response is not None:
+            print(f"[API_CLIENT] Response status: {e.response.status_code}")
+            print(f"[API_CLIENT] Response body: {e.response.text}")
+        raise
+
+
+def _is_retryable(e: Exception) -> bool:
+    response = getattr(e, "response", None)
+    if response is None:
+        return isinstance(e, requests.exceptions.RequestException)
+    return response.status_code >= 500 or response.status_code in RETRYABLE_STATUS_CODES
+
+
+def _send_with_retry(job_id: str, payload: Dict[str, Any]) -> None:
+    """Send an update, retrying transient failures with exponential backoff; raises the last error."""
+    attempts = max(1, _env_int("API_STATUS_MAX_ATTEMPTS", 5))
+    for attempt in range(1, attempts + 1):
+        try:
+            _send(job_id, payload)
+            return
+        except Exception as e:
+            if attempt == attempts or not _is_retryable(e):
+                raise
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            print(f"[API_CLIENT] Retrying {payload['status']} for jobId={job_id} in {delay:.1f}s (attempt {attempt}/{attempts})")
+            time.sleep(delay)
+
+
+class StatusReporter:
+    """Background thread sending queued PROCESSING updates, oldest job first."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        # jobId -> latest update not yet sent
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sending: Optional[str] = None
+        self._cond = threading.Condition()
+        self._stats: Dict[str, int] = {"sent": 0, "failed": 0, "coalesced": 0, "dropped": 0, "cancelled": 0}
+        self._thread = threading.Thread(target=self._run, name="api-status-reporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, job_id: str, payload: Dict[str, Any]) -> None:
+        with self._cond:
+            if job_id in self._pending:
+                self._stats["coalesced"] += 1
+                self._pending[job_id] = payload
+                return
+            if len(self._pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                print(f"[API_CLIENT] WARNING: Status queue full, dropping {payload['status']} for jobId={job_id}")
+                return
+            self._pending[job_id] = payload
+            self._cond.notify()
+
+    def cancel(self, job_id: str, timeout: float) -> None:
+        """Drop the job's queued update and wait (up to timeout) for one being sent."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._pending.pop(job_id, None) is not None:
+                self._stats["cancelled"] += 1
+            while self._sending == job_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+    def _next(self) -> Tuple[str, Dict[str, Any]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            job_id, payload = self._pending.popitem(last=False)
+            self._sending = job_id
+            return job_id, payload
+
+    def _run(self) -> None:
+        while True:
+            job_id, payload = self._next()
+            try:
+                _send(job_id, payload)
+                outcome = "sent"
+            except Exception:
+                # PROCESSING is advisory; the terminal update follows inline.
+                outcome = "failed"
+            with self._cond:
+                self._stats[outcome] += 1
+                self._sending = None
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> int:
+        """Wait for queued updates to be sent; returns how many are still pending."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._sending is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return len(self._pending) + int(self._sending is not None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+def _get_reporter() -> StatusReporter:
+    global _reporter
+    reporter = _reporter
+    if reporter is not None:
+        return reporter
+    with _reporter_lock:
+        if _reporter is None:
+            _reporter = StatusReporter(max_pending=max(1, _env_int("API_STATUS_QUEUE_SIZE", 1000)))
+        return _reporter
+
+
 def post_job_status(
     job_id: str,
     status: str,
@@ -23,8 +241,11 @@ def post_job_status(
     output: Optional[Dict[str, Any]] = None,
     worker_id: Optional[str] = None,
 ) -> None:
-    url = f"{_api_base_url()}/jobs/internal/{job_id}/status"
-    headers = {"x-worker-api-key": _worker_api_key()}
+    """
+    Report a job's status to the API. PROCESSING is queued for the reporter
+    thread (unless API_STATUS_ASYNC is off); terminal states are sent inline
+    with retries and raise if they still fail.
+    """
     payload: Dict[str, Any] = {"status": status}
 
     if error:
@@ -34,19 +255,47 @@ def post_job_status(
     if worker_id:
         payload["workerId"] = worker_id
 
-    print(f"[API_CLIENT] Updating job status: jobId={job_id}, status={status}, url={url}")
-    
-    try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
-        print(f"[API_CLIENT] Job status updated successfully: jobId={job_id}, status={status}")
-    except requests.exceptions.RequestException as e:
-        print(f"[API_CLIENT] ERROR: Failed to update job status: jobId={job_id}, error={e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"[API_CLIENT] Response status: {e.response.status_code}")
-            print(f"[API_CLIENT] Response body: {e.response.text}")
-        raise
+    if status not in TERMINAL_STATUSES:
+        if is_async():
+            _get_reporter().submit(job_id, payload)
+        else:
+            _send(job_id, payload)
+        return
+
+    global _last_terminal_job
+    _last_terminal_job = job_id
+    reporter = _reporter
+    if reporter is not None:
+        reporter.cancel(job_id, timeout=REQUEST_TIMEOUT_SECONDS)
+    _send_with_retry(job_id, payload)
+
+
+def terminal_status_sent(job_id: Optional[str]) -> bool:
+    """Whether this process already sent (or tried to send) the job's final status."""
+    return job_id is not None and job_id == _last_terminal_job
+
+
+def drain(timeout: Optional[float] = None) -> int:
+    """
+    Send queued PROCESSING updates before the process exits.
+
+    Returns:
+        Number of updates still unsent when the timeout ran out
+    """
+    reporter = _reporter
+    if reporter is None:
+        return 0
+    if timeout is None:
+        timeout = _env_int("API_STATUS_DRAIN_TIMEOUT_SECONDS", 10)
+    left = reporter.drain(timeout)
+    if left:
+        print(f"[API_CLIENT] WARNING: {left} job status update(s) unsent at shutdown: {reporter.stats()}", flush=True)
+    return left
 
 
+def reporter_stats() -> Dict[str, int]:
+    reporter = _reporter
+    return reporter.stats() if reporter is not None else {}
 
 
+atexit.register(drain)
@@ -0,0 +1,124 @@
+"""
+Backlog-aware backpressure between the queue consumer and Celery.
+
+The consumer stops pulling from the job list once the Celery backlog
+(messages waiting in the broker queues plus tasks reserved or running on
+workers) reaches a high-water mark, and resumes once it falls to the
+low-water mark. Work that can't start soon stays in Redis, where fair
+scheduling, coalescing and reordering still apply.
+
+Both numbers come straight from the Redis broker: LLEN of each queue (and
+its priority sub-lists) and HLEN of kombu's "unacked" hash, which with
+task_acks_late holds every task a worker has taken but not finished.
+
+Env:
+    CELERY_BACKLOG_HIGH: stop pulling at this backlog (default: 200, 0 disables)
+    CELERY_BACKLOG_LOW: resume at this backlog (default: HIGH / 4)
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+
+# Kombu's Redis transport keeps non-zero priorities in sibling lists named
+# <queue>\x06\x16<priority>.
+PRIORITY_SEPARATOR = "\x06\x16"
+PRIORITY_STEPS = (3, 6, 9)
+UNACKED_KEY = "unacked"
+CHECK_INTERVAL_SECONDS = 0.5
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_high_water() -> int:
+    return _env_int("CELERY_BACKLOG_HIGH", 200)
+
+
+def get_low_water() -> int:
+    return min(_env_int("CELERY_BACKLOG_LOW", get_high_water() // 4), get_high_water())
+
+
+def is_enabled() -> bool:
+    return get_high_water() > 0
+
+
+def measure_backlog(client: redis.Redis, queues: List[str]) -> Dict[str, int]:
+    """Messages waiting per Celery queue (all priorities), plus "unacked" across workers."""
+    pipe = client.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+        for priority in PRIORITY_STEPS:
+            pipe.llen(f"{queue}{PRIORITY_SEPARATOR}{priority}")
+    pipe.hlen(UNACKED_KEY)
+    results = pipe.execute()
+
+    per_list = 1 + len(PRIORITY_STEPS)
+    backlog = {
+        queue: sum(results[i * per_list:(i + 1) * per_list])
+        for i, queue in enumerate(queues)
+    }
+    backlog["unacked"] = results[-1]
+    return backlog
+
+
+class Backpressure:
+    def __init__(self, broker_url: str, queues: List[str]):
+        self.client = redis.Redis.from_url(broker_url, decode_responses=True)
+        self.queues = queues
+        self.high = get_high_water()
+        self.low = get_low_water()
+        self.paused = False
+        self._last_check = 0.0
+        self._backlog: Dict[str, int] = {}
+        self._paused_since: Optional[float] = None
+        self._stats: Dict[str, Any] = {"pauses": 0, "paused_seconds": 0.0}
+
+    def _measure(self) -> Dict[str, int]:
+        return measure_backlog(self.client, self.queues)
+
+    def headroom(self) -> int:
+        """
+        How many more jobs may be dispatched now; 0 while paused. Re-measures
+        at most every CHECK_INTERVAL_SECONDS.
+        """
+        now = time.monotonic()
+        if now - self._last_check >= CHECK_INTERVAL_SECONDS:
+            self._last_check = now
+            self._backlog = self._measure()
+            total = sum(self._backlog.values())
+
+            if not self.paused and total >= self.high:
+                self.paused = True
+                self._paused_since = now
+                self._stats["pauses"] += 1
+                print(f"[WORKER] Backpressure: pausing, Celery backlog {total} >= {self.high} ({self._backlog})")
+            elif self.paused and total <= self.low:
+                self.paused = False
+                paused_for = now - (self._paused_since or now)
+                self._stats["paused_seconds"] += paused_for
+                self._paused_since = None
+                print(f"[WORKER] Backpressure: resuming after {paused_for:.1f}s, Celery backlog {total} <= {self.low}")
+
+        if self.paused:
+            return 0
+        return max(0, self.high - sum(self._backlog.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        paused_seconds = self._stats["paused_seconds"]
+        if self._paused_since is not None:
+            paused_seconds += time.monotonic() - self._paused_since
+        return {
+            "enabled": True,
+            "paused": self.paused,
+            "high_water": self.high,
+            "low_water": self.low,
+            "backlog": dict(self._backlog),
+            "pauses": self._stats["pauses"],
+            "paused_seconds": round(paused_seconds, 1),
+        }
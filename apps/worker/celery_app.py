@@ -1,20 +1,66 @@
 import os
 import sys
 import logging
+from typing import Any, Dict
 
 from celery import Celery
-from celery.signals import setup_logging
+from celery.signals import (
+    setup_logging,
+    task_received,
+    task_revoked,
+    worker_process_init,
+    worker_process_shutdown,
+)
+
+from services import memory, prefetch
 
 
 def _redis_url() -> str:
     return os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 
+# One queue (and one worker pool, see project.json / docker-compose) per cost
+# class, so long audio jobs never sit in front of quick image jobs.
+IMAGE_QUEUE = "imagepivot.image"
+AUDIO_QUEUE = "imagepivot.audio"
+HEAVY_QUEUE = "imagepivot.heavy"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def queue_for_job(payload: Dict[str, Any]) -> str:
+    """
+    Pick the Celery queue for a job at enqueue time.
+
+    Inputs at or above the heavy threshold for their media type go to the
+    heavy queue regardless of feature.
+
+    Env:
+        HEAVY_IMAGE_INPUT_BYTES: image heavy threshold (default: 20 MiB)
+        HEAVY_AUDIO_INPUT_BYTES: audio heavy threshold (default: 50 MiB)
+    """
+    media_type = str(payload.get("mediaType", "")).upper()
+    size_bytes = int((payload.get("input") or {}).get("sizeBytes") or 0)
+
+    if media_type == "AUDIO":
+        if size_bytes >= _env_int("HEAVY_AUDIO_INPUT_BYTES", 50 * 1024 * 1024):
+            return HEAVY_QUEUE
+        return AUDIO_QUEUE
+    if media_type == "IMAGE" and size_bytes >= _env_int("HEAVY_IMAGE_INPUT_BYTES", 20 * 1024 * 1024):
+        return HEAVY_QUEUE
+    return IMAGE_QUEUE
+
+
 celery_app = Celery(
     "imagepivot_worker",
     broker=_redis_url(),
     backend=_redis_url(),
-    include=["tasks.process_job", "tasks.image"],
+    include=["tasks.process_job", "tasks.image", "tasks.audio"],
 )
 
 # Windows doesn't support prefork pool, use solo pool instead
@@ -25,8 +71,17 @@ celery_app.conf.update(
     accept_content=["json"],
     result_serializer="json",
     task_acks_late=True,
-    worker_prefetch_multiplier=1,
+    task_default_queue=IMAGE_QUEUE,
+    # Kombu's Redis transport keeps priorities 0 (most urgent) to 9 in
+    # separate lists per queue; messages without one would land in 0.
+    task_default_priority=5,
+    # With input prefetch on, reserve one extra job per child so there is a
+    # next job whose input can download while the current one computes.
+    worker_prefetch_multiplier=2 if prefetch.is_enabled() else 1,
     worker_pool=pool_type,
+    # Replace a prefork child after any job that leaves it above its memory
+    # budget's recycle line (see services/memory.py).
+    worker_max_memory_per_child=memory.get_recycle_kib(),
     worker_hijack_root_logger=False,
     worker_log_color=False,
 )
@@ -55,5 +110,57 @@ def config_loggers(*args, **kwargs):
         root_logger.addHandler(handler)
 
 
+@worker_process_init.connect
+def _init_worker_process(*args, **kwargs):
+    """
+    Drop any R2 client inherited from the parent (each child builds its own
+    lazily), then warm the child up before it takes its first job.
+    """
+    from r2_storage import reset_client
+    from services import warmup
+
+    reset_client()
+    warmup.warm_up()
+    memory.record_baseline()
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(*args, **kwargs):
+    import api_client
+    from r2_storage import client_stats
+
+    # PROCESSING updates still queued for the API would die with the child.
+    api_client.drain()
+    print(f"[CELERY] R2 client pool stats at child shutdown: {client_stats()}", flush=True)
+    print(f"[CELERY] API status reporter stats at child shutdown: {api_client.reporter_stats()}", flush=True)
+
+
+def _all_children_busy(consumer: Any) -> bool:
+    """True when a newly reserved job will wait: earlier reserved jobs already fill every child."""
+    from celery.worker import state as worker_state
+
+    concurrency = getattr(getattr(consumer, "controller", None), "concurrency", None)
+    concurrency = concurrency or celery_app.conf.worker_concurrency or os.cpu_count() or 1
+    # task_received fires before the new request joins reserved_requests.
+    return len(worker_state.reserved_requests) >= concurrency
+
+
+@task_received.connect
+def _prefetch_reserved_job(sender=None, request=None, **kwargs):
+    """
+    Runs in the worker's main process as soon as a job is reserved. A job a
+    free child starts right away would only download its input twice.
+    """
+    args = getattr(request, "args", None) or ()
+    if args and isinstance(args[0], dict) and prefetch.is_enabled() and _all_children_busy(sender):
+        try:
+            prefetch.schedule(args[0])
+        except Exception as e:
+            print(f"[CELERY] WARNING: Could not schedule input prefetch: {e}", flush=True)
 
 
+@task_revoked.connect
+def _release_revoked_job(request=None, **kwargs):
+    args = getattr(request, "args", None) or ()
+    if args and isinstance(args[0], dict) and args[0].get("jobId"):
+        prefetch.release(args[0]["jobId"])
@@ -0,0 +1,172 @@
+"""
+Direct execution mode (WORKER_MODE=direct).
+
+Jobs popped from imagepivot:jobs:v1 run in a local process pool instead of
+being re-published to the Celery broker, which saves a second Redis hop per
+job. Celery is never imported in this mode.
+
+The consumer only pops as many jobs as there are free slots, so work not
+started here stays in Redis for other nodes. On shutdown the pool drains:
+running jobs get DIRECT_DRAIN_TIMEOUT_SECONDS to finish, and jobs that never
+started are handed back for requeueing.
+
+Env:
+    DIRECT_CONCURRENCY: worker processes (default: CPU count)
+    DIRECT_START_METHOD: multiprocessing start method (default: spawn)
+    DIRECT_DRAIN_TIMEOUT_SECONDS: graceful drain budget (default: 60)
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_concurrency() -> int:
+    return max(1, _env_int("DIRECT_CONCURRENCY", os.cpu_count() or 1))
+
+
+def get_drain_timeout() -> int:
+    return _env_int("DIRECT_DRAIN_TIMEOUT_SECONDS", 60)
+
+
+def _init_process() -> None:
+    from multiprocessing.util import Finalize
+
+    import api_client
+    from services import warmup
+
+    print(f"[DIRECT] Worker process started: pid={os.getpid()}", flush=True)
+    # Pool processes exit without running atexit hooks, only multiprocessing finalizers.
+    Finalize(None, api_client.drain, exitpriority=10)
+    warmup.warm_up()
+
+
+def _run(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from tasks.job_runner import run_job
+
+    return run_job(payload)
+
+
+class DirectExecutor:
+    """Bounded process pool running tasks.job_runner.run_job."""
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        on_finished: Optional[Callable[[str, Dict[str, Any], Optional[BaseException]], None]] = None,
+    ):
+        """
+        Args:
+            concurrency: Worker processes (default: DIRECT_CONCURRENCY)
+            on_finished: Called with (raw, payload, error) when a job ends;
+                error is None on success. Not called for cancelled jobs.
+        """
+        self.concurrency = concurrency or get_concurrency()
+        self._on_finished = on_finished
+        self._pool = self._new_pool()
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._inflight: Dict[Future, str] = {}
+        self._stats: Dict[str, Any] = {"submitted": 0, "completed": 0, "failed": 0, "total_run_ms": 0.0}
+        print(f"[DIRECT] Process pool started: concurrency={self.concurrency}", flush=True)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context(os.getenv("DIRECT_START_METHOD", "spawn"))
+        return ProcessPoolExecutor(
+            max_workers=self.concurrency,
+            mp_context=context,
+            initializer=_init_process,
+        )
+
+    def free_slots(self) -> int:
+        with self._lock:
+            return self.concurrency - len(self._inflight)
+
+    def wait_for_slot(self, timeout: float) -> bool:
+        """Block until at least one slot is free; False on timeout."""
+        with self._slot_freed:
+            return self._slot_freed.wait_for(lambda: len(self._inflight) < self.concurrency, timeout=timeout)
+
+    def submit(self, payload: Dict[str, Any], raw: str) -> None:
+        job_id = payload.get("jobId", "unknown")
+        started = time.monotonic()
+        try:
+            future = self._pool.submit(_run, payload)
+        except BrokenProcessPool:
+            # A child died (e.g. OOM-killed); start a fresh pool rather than
+            # dropping every job popped from now on.
+            print("[DIRECT] WARNING: Process pool is broken, restarting it", flush=True)
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            future = self._pool.submit(_run, payload)
+        with self._lock:
+            self._inflight[future] = raw
+            self._stats["submitted"] += 1
+        print(f"[DIRECT] Job submitted: jobId={job_id}", flush=True)
+        future.add_done_callback(lambda f: self._done(f, raw, payload, started))
+
+    def inflight_raws(self) -> List[str]:
+        with self._lock:
+            return list(self._inflight.values())
+
+    def _done(self, future: Future, raw: str, payload: Dict[str, Any], started: float) -> None:
+        job_id = payload.get("jobId", "unknown")
+        run_ms = (time.monotonic() - started) * 1000
+        error = None if future.cancelled() else future.exception()
+        with self._slot_freed:
+            self._inflight.pop(future, None)
+            if not future.cancelled():
+                self._stats["failed" if error is not None else "completed"] += 1
+                self._stats["total_run_ms"] += run_ms
+            self._slot_freed.notify_all()
+
+        if future.cancelled():
+            return
+        if error is not None:
+            # run_job already reported FAILED to the API.
+            print(f"[DIRECT] Job failed: jobId={job_id}, error={error}, runMs={run_ms:.0f}", flush=True)
+        else:
+            print(f"[DIRECT] Job completed: jobId={job_id}, runMs={run_ms:.0f}", flush=True)
+
+        if self._on_finished is not None:
+            try:
+                self._on_finished(raw, payload, error)
+            except Exception as e:
+                print(f"[DIRECT] ERROR: on_finished callback failed for jobId={job_id}: {e}", flush=True)
+
+    def drain(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Stop the pool gracefully. Waits for running jobs up to timeout and
+        returns the raw payloads of jobs that never started, for requeueing.
+        """
+        timeout = get_drain_timeout() if timeout is None else timeout
+        with self._lock:
+            pending = dict(self._inflight)
+        print(f"[DIRECT] Draining {len(pending)} job(s), timeout={timeout}s", flush=True)
+
+        not_started = [raw for future, raw in pending.items() if future.cancel()]
+        _done, still_running = wait([f for f in pending if not f.cancelled()], timeout=timeout)
+        if still_running:
+            print(f"[DIRECT] WARNING: {len(still_running)} job(s) still running after drain timeout", flush=True)
+        self._pool.shutdown(wait=not still_running, cancel_futures=True)
+        return not_started
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._stats["completed"] + self._stats["failed"]
+            return {
+                "concurrency": self.concurrency,
+                "inflight": len(self._inflight),
+                **self._stats,
+                "avg_run_ms": (self._stats["total_run_ms"] / finished) if finished else 0.0,
+            }
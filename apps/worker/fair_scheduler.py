@@ -0,0 +1,290 @@
+"""
+Per-org fair scheduling on top of ReliableQueue.
+
+The API still pushes to the single FIFO job list. Consumers first ingest it
+into per-org sub-queues ordered by deadline (services/deadlines.py), then
+pick from those with deficit round-robin (DRR), so one org's burst of
+thousands of jobs can't hold back everyone else.
+
+Each round an org's deficit grows by its weight (jobs per round, fractional
+allowed) and it may take that many jobs; orgs whose sub-queue runs dry leave
+the round and lose their deficit. Within those limits the next job is always
+the earliest deadline among orgs that still have a turn, so urgent jobs
+don't wait for a bulk import's turn to end. Weights come from the org's plan:
+
+    plan = metadata.plan in the payload, else the Q:org-plans hash
+           (orgId -> plan code), else ORG_DEFAULT_PLAN
+    weight = ORG_PLAN_WEIGHTS[plan]
+
+A job's deadline is metadata.queuedAt plus its slack (deadlines.deadline_at),
+the same one the consumer sorts dispatches by, so a job the reaper requeues
+keeps the time it already waited. Jobs without queuedAt fall back to ingest
+time plus slack.
+
+Keys (for queue key Q):
+    Q:org:<orgId>   ZSET raw payload -> deadline (us)
+    Q:ingest-seq    last ingest time handed out to a job without queuedAt
+    Q:orgs          SET of orgs with queued jobs
+    Q:org-plans     HASH orgId -> plan code
+
+Claiming a job moves it straight into the consumer's processing list with a
+lease, so reaping and acks work exactly as without fair scheduling.
+
+Env:
+    FAIR_SCHEDULING: enable per-org sub-queues (default: false)
+    ORG_PLAN_WEIGHTS: e.g. "FREE=1,PREMIUM=4,ENTERPRISE=8" (the default)
+    ORG_DEFAULT_PLAN: plan for orgs with no known plan (default: FREE)
+    FAIR_INGEST_BATCH: max jobs moved into sub-queues per call (default: 500)
+"""
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from reliable_queue import ReliableQueue
+from services import deadlines
+
+PLAN_CACHE_SECONDS = 60
+WAIT_SAMPLES = 200
+
+# Move jobs from the head of the FIFO list into per-org ZSETs, scored by
+# deadlines worked out in Python (FairScheduler.ingest). For job n (from 0),
+# KEYS[5 + n] is its org sub-queue and ARGV[5n + 1 .. 5n + 5] are raw
+# payload, orgId, plan ('' for none), deadline in us ('' without queuedAt)
+# and slack in us. A job only moves while it is still at the head, so
+# consumers ingesting at the same time never move it twice. Jobs without a
+# deadline get ingest time + slack; Q:ingest-seq keeps those ingest times
+# strictly increasing so they stay FIFO within an org.
+_INGEST_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local seq = math.max(now, tonumber(redis.call('GET', KEYS[4]) or 0) + 1)
+local moved = 0
+for n = 0, #KEYS - 5 do
+    local raw = ARGV[5 * n + 1]
+    if redis.call('LINDEX', KEYS[1], 0) ~= raw then break end
+    redis.call('LPOP', KEYS[1])
+    local org, plan, deadline = ARGV[5 * n + 2], ARGV[5 * n + 3], ARGV[5 * n + 4]
+    if plan ~= '' then
+        redis.call('HSET', KEYS[3], org, plan)
+    end
+    if deadline == '' then
+        deadline = string.format('%.0f', seq + tonumber(ARGV[5 * n + 5]))
+        seq = seq + 1
+    else
+        -- queuedAt has millisecond precision; n us keeps a batch's ties FIFO.
+        deadline = string.format('%.0f', tonumber(deadline) + n)
+    end
+    redis.call('ZADD', KEYS[5 + n], deadline, raw)
+    redis.call('SADD', KEYS[2], org)
+    moved = moved + 1
+end
+redis.call('SET', KEYS[4], string.format('%.0f', seq - 1))
+return moved
+"""
+
+# Claim the earliest-deadline job of one org into a processing list with a
+# lease. Returns {raw, deadline us, next deadline us or nothing}, or nil when
+# the sub-queue is empty.
+_CLAIM_SCRIPT = """
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    return nil
+end
+redis.call('RPUSH', KEYS[3], popped[1])
+redis.call('ZADD', KEYS[4], ARGV[2], popped[1])
+local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #head == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    return popped
+end
+return {popped[1], popped[2], head[2]}
+"""
+
+
+def is_enabled() -> bool:
+    return os.getenv("FAIR_SCHEDULING", "false").lower() in ("1", "true", "yes")
+
+
+def get_plan_weights() -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for item in os.getenv("ORG_PLAN_WEIGHTS", "FREE=1,PREMIUM=4,ENTERPRISE=8").split(","):
+        plan, _, weight = item.partition("=")
+        try:
+            weights[plan.strip().upper()] = float(weight)
+        except ValueError:
+            continue
+    return weights
+
+
+def get_default_plan() -> str:
+    return os.getenv("ORG_DEFAULT_PLAN", "FREE").upper()
+
+
+def get_ingest_batch() -> int:
+    try:
+        return max(1, int(os.getenv("FAIR_INGEST_BATCH", "500")))
+    except ValueError:
+        return 500
+
+
+class FairScheduler:
+    """Drop-in replacement for ReliableQueue.pop_batch that picks jobs per org with DRR."""
+
+    def __init__(self, queue: ReliableQueue):
+        self.queue = queue
+        self.client = queue.client
+        self.org_prefix = f"{queue.queue_key}:org:"
+        self.orgs_key = f"{queue.queue_key}:orgs"
+        self.plans_key = f"{queue.queue_key}:org-plans"
+        self.seq_key = f"{queue.queue_key}:ingest-seq"
+        self._ingest = self.client.register_script(_INGEST_SCRIPT)
+        self._claim = self.client.register_script(_CLAIM_SCRIPT)
+        self._weights = get_plan_weights()
+        self._deficit: Dict[str, float] = {}
+        self._plans: Dict[str, Tuple[str, float]] = {}
+        self._waits: Dict[str, Deque[float]] = {}
+        self._dispatched: Dict[str, int] = {}
+
+    def ingest(self) -> int:
+        """Move up to FAIR_INGEST_BATCH jobs from the FIFO list into their org sub-queues."""
+        raws = self.client.lrange(self.queue.queue_key, 0, get_ingest_batch() - 1)
+        if not raws:
+            return 0
+        keys = [self.queue.queue_key, self.orgs_key, self.plans_key, self.seq_key]
+        args: List[Any] = []
+        for raw in raws:
+            try:
+                payload = json.loads(raw)
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                payload = {}
+            org_id = payload.get("orgId") if isinstance(payload.get("orgId"), str) else "_unknown"
+            metadata = payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {}
+            plan = metadata.get("plan") if isinstance(metadata.get("plan"), str) else ""
+            deadline = deadlines.deadline_at(payload)
+            keys.append(self.org_prefix + org_id)
+            args += [
+                raw,
+                org_id,
+                plan,
+                f"{deadline.timestamp() * 1_000_000:.0f}" if deadline is not None else "",
+                f"{deadlines.deadline_seconds(payload) * 1_000_000:.0f}",
+            ]
+        return int(self._ingest(keys=keys, args=args))
+
+    def plan_for(self, org_id: str) -> str:
+        cached = self._plans.get(org_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        plan = (self.client.hget(self.plans_key, org_id) or get_default_plan()).upper()
+        self._plans[org_id] = (plan, time.monotonic() + PLAN_CACHE_SECONDS)
+        return plan
+
+    def weight_for(self, org_id: str) -> float:
+        weight = self._weights.get(self.plan_for(org_id), self._weights.get(get_default_plan(), 1.0))
+        # A zero weight would never earn a turn and stall the round.
+        return max(weight, 0.01)
+
+    def _heads(self) -> Dict[str, float]:
+        """Earliest deadline (us) of every org with queued jobs."""
+        orgs = sorted(self.client.smembers(self.orgs_key))
+        pipe = self.client.pipeline(transaction=False)
+        for org_id in orgs:
+            pipe.zrange(self.org_prefix + org_id, 0, 0, withscores=True)
+        heads = {org_id: head[0][1] for org_id, head in zip(orgs, pipe.execute()) if head}
+        for org_id in list(self._deficit):
+            if org_id not in heads:
+                del self._deficit[org_id]
+        return heads
+
+    def _claim_one(self, org_id: str) -> Optional[Tuple[str, Optional[float]]]:
+        """Claim the org's next job; returns (raw, next deadline or None if the org ran dry)."""
+        claimed = self._claim(
+            keys=[self.org_prefix + org_id, self.orgs_key, self.queue.processing_key, self.queue.leases_key],
+            args=[org_id, time.time()],
+        )
+        if not claimed:
+            return None
+        raw = claimed[0]
+        next_deadline = float(claimed[2]) if len(claimed) > 2 else None
+        try:
+            queued = deadlines.queued_at(json.loads(raw))
+        except (ValueError, AttributeError):
+            queued = None
+        if queued is not None:
+            wait_ms = (datetime.now(timezone.utc) - queued).total_seconds() * 1000
+            self._waits.setdefault(org_id, deque(maxlen=WAIT_SAMPLES)).append(wait_ms)
+        self._dispatched[org_id] = self._dispatched.get(org_id, 0) + 1
+        return raw, next_deadline
+
+    def _pick(self, max_items: int) -> List[str]:
+        heads = self._heads()
+        picked: List[str] = []
+        while len(picked) < max_items and heads:
+            eligible = [org_id for org_id in heads if self._deficit.get(org_id, 0.0) >= 1]
+            if not eligible:
+                # Everyone has used their turn: start a new round.
+                for org_id in heads:
+                    self._deficit[org_id] = self._deficit.get(org_id, 0.0) + self.weight_for(org_id)
+                continue
+
+            org_id = min(eligible, key=heads.__getitem__)
+            claimed = self._claim_one(org_id)
+            if claimed is None:
+                heads.pop(org_id)
+                self._deficit.pop(org_id, None)
+                continue
+
+            raw, next_deadline = claimed
+            self._deficit[org_id] -= 1
+            picked.append(raw)
+            if next_deadline is None:
+                heads.pop(org_id)
+                self._deficit.pop(org_id, None)
+            else:
+                heads[org_id] = next_deadline
+        return picked
+
+    def pop_batch(self, timeout: int = 5, max_items: int = 1) -> Tuple[List[str], float]:
+        """Same contract as ReliableQueue.pop_batch."""
+        self.ingest()
+        raws = self._pick(max_items)
+        if not raws:
+            # Nothing anywhere: block until the FIFO list gets a job. Moving
+            # LEFT->LEFT on the same list leaves it untouched.
+            if self.client.blmove(self.queue.queue_key, self.queue.queue_key, timeout, src="LEFT", dest="LEFT") is None:
+                return [], time.monotonic()
+            self.ingest()
+            raws = self._pick(max_items)
+        return raws, time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-org depth, overdue jobs, next deadline and recent dispatch wait (p95)."""
+        orgs = sorted(self.client.smembers(self.orgs_key) | set(self._dispatched))
+        now_us = time.time() * 1_000_000
+        pipe = self.client.pipeline(transaction=False)
+        for org_id in orgs:
+            pipe.zcard(self.org_prefix + org_id)
+            pipe.zcount(self.org_prefix + org_id, "-inf", now_us)
+            pipe.zrange(self.org_prefix + org_id, 0, 0, withscores=True)
+        results = pipe.execute()
+
+        per_org: Dict[str, Any] = {}
+        for i, org_id in enumerate(orgs):
+            depth, overdue, head = results[3 * i], results[3 * i + 1], results[3 * i + 2]
+            waits = sorted(self._waits.get(org_id, ()))
+            per_org[org_id] = {
+                "plan": self.plan_for(org_id),
+                "weight": self.weight_for(org_id),
+                "depth": depth,
+                "overdue": overdue,
+                "next_deadline_in_ms": round((head[0][1] - now_us) / 1000) if head else None,
+                "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))]) if waits else 0,
+                "dispatched": self._dispatched.get(org_id, 0),
+            }
+        return {"enabled": True, "backlog": self.client.llen(self.queue.queue_key), "orgs": per_org}
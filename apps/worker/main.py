@@ -1,8 +1,10 @@
 import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import threading
 
-from queue_consumer import run_queue_consumer, request_stop
+import metrics
+from queue_consumer import get_worker_mode, run_queue_consumer, request_stop
 
 app = FastAPI()
 
@@ -31,7 +33,12 @@ def _startup():
 def _shutdown():
     request_stop()
     if _consumer_thread is not None:
-        _consumer_thread.join(timeout=5)
+        timeout = 5
+        if get_worker_mode() == "direct":
+            # Give the process pool its drain budget before the thread is abandoned.
+            from direct_executor import get_drain_timeout
+            timeout += get_drain_timeout()
+        _consumer_thread.join(timeout=timeout)
 
 @app.get("/")
 def read_root():
@@ -50,4 +57,9 @@ def health_check():
     return {
         "status": "healthy",
         "queue_consumer": consumer_status
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Autoscaling signals in Prometheus text format (cached briefly, see metrics.py)."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
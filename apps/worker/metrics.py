@@ -0,0 +1,286 @@
+"""
+Autoscaling signals in Prometheus text format, served at GET /metrics.
+
+Everything comes from a handful of pipelined Redis reads (no Celery
+broadcast/inspect calls) and the rendered page is cached for
+METRICS_CACHE_SECONDS, so frequent scrapes by several collectors cost at
+most one round of reads per interval.
+
+With fair scheduling most waiting jobs sit in the per-org sub-queues, which
+are ordered by deadline; the oldest-job age there is taken from each
+sub-queue's next job, so it can under-report when a later-deadline job has
+waited longer.
+
+Env:
+    METRICS_CACHE_SECONDS: how long a rendered page is reused (default: 5)
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+import backpressure
+import stream_queue
+from services import deadlines, input_cache, job_metrics, memory, result_cache, single_flight, time_limits
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+QUEUE_EVENTS = ("acked", "requeued", "recovered", "duplicates", "discarded", "drained", "dead_lettered")
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[float, str]] = None
+_broker: Optional[redis.Redis] = None
+
+
+def get_cache_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("METRICS_CACHE_SECONDS", "5")))
+    except ValueError:
+        return 5.0
+
+
+def _age_seconds(raw: Optional[str]) -> float:
+    if not raw:
+        return 0.0
+    try:
+        queued = deadlines.queued_at(json.loads(raw))
+    except (ValueError, AttributeError):
+        return 0.0
+    if queued is None:
+        return 0.0
+    return max(0.0, (datetime.now(timezone.utc) - queued).total_seconds())
+
+
+def _list_queue(client: redis.Redis) -> Dict[str, float]:
+    from queue_consumer import JOB_QUEUE_KEY_V1
+
+    # Key layout of FairScheduler / ReliableQueue for the job list.
+    orgs = sorted(client.smembers(f"{JOB_QUEUE_KEY_V1}:orgs"))
+    pipe = client.pipeline(transaction=False)
+    pipe.llen(JOB_QUEUE_KEY_V1)
+    pipe.lindex(JOB_QUEUE_KEY_V1, 0)
+    pipe.zcard(f"{JOB_QUEUE_KEY_V1}:leases")
+    for org_id in orgs:
+        pipe.zcard(f"{JOB_QUEUE_KEY_V1}:org:{org_id}")
+        pipe.zrange(f"{JOB_QUEUE_KEY_V1}:org:{org_id}", 0, 0)
+    results = pipe.execute()
+
+    depth, heads = results[0], [results[1]]
+    for i in range(len(orgs)):
+        depth += results[3 + 2 * i]
+        heads.extend(results[4 + 2 * i])
+    return {
+        "depth": depth,
+        "oldest_age_seconds": max(_age_seconds(raw) for raw in heads),
+        "inflight": results[2],
+    }
+
+
+def _stream_queue(client: redis.Redis) -> Dict[str, float]:
+    key, group_name = stream_queue.JOB_STREAM_KEY_V1, stream_queue.get_group()
+    try:
+        groups = client.xinfo_groups(key)
+    except redis.ResponseError:
+        # Stream not created yet.
+        return {"depth": 0, "oldest_age_seconds": 0.0, "inflight": 0}
+    group = next((g for g in groups if g["name"] == group_name), None)
+    if group is None:
+        return {"depth": client.xlen(key), "oldest_age_seconds": 0.0, "inflight": 0}
+
+    # The first entry after the group's last delivered id is the oldest undelivered job.
+    oldest = client.xrange(key, min=f"({group['last-delivered-id']}", count=1)
+    oldest_age = 0.0
+    if oldest:
+        oldest_age = max(0.0, time.time() - int(oldest[0][0].split("-")[0]) / 1000)
+    lag = group.get("lag")
+    return {
+        "depth": lag if lag is not None else max(0, client.xlen(key) - group["pending"]),
+        "oldest_age_seconds": oldest_age,
+        "inflight": group["pending"],
+    }
+
+
+def _celery_backlog() -> Dict[str, int]:
+    global _broker
+    from celery_app import AUDIO_QUEUE, HEAVY_QUEUE, IMAGE_QUEUE, celery_app
+
+    if _broker is None:
+        _broker = redis.Redis.from_url(celery_app.conf.broker_url, decode_responses=True)
+    return backpressure.measure_backlog(_broker, [IMAGE_QUEUE, AUDIO_QUEUE, HEAVY_QUEUE])
+
+
+def _collect() -> List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]:
+    """(name, type, help, [(labels, value)]) for every metric that could be read."""
+    from queue_consumer import backpressure_stats, batch_stats, fair_stats, get_worker_mode, queue_stats
+    from redis_client import get_redis
+
+    families: List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]] = []
+    client = get_redis()
+
+    try:
+        if stream_queue.get_transport() == "stream":
+            queue = _stream_queue(client)
+        else:
+            queue = _list_queue(client)
+        families += [
+            ("imagepivot_job_queue_depth", "gauge", "Jobs waiting in Redis for a consumer.", [({}, queue["depth"])]),
+            ("imagepivot_job_queue_oldest_age_seconds", "gauge", "Age of the oldest waiting job.", [({}, queue["oldest_age_seconds"])]),
+            ("imagepivot_job_queue_inflight", "gauge", "Jobs taken by a consumer and not yet handed off.", [({}, queue["inflight"])]),
+        ]
+    except Exception as e:
+        print(f"[METRICS] WARNING: Could not read job queue: {e}")
+
+    try:
+        # Counters of this process's consumer; they live in Redis, so they cover every consumer.
+        counters = queue_stats()
+        if counters:
+            families += [
+                (
+                    "imagepivot_job_queue_events_total", "counter",
+                    "Job queue deliveries by outcome (requeued/recovered after a lost lease, duplicates dropped, ...).",
+                    [({"event": event}, counters[event]) for event in QUEUE_EVENTS if event in counters],
+                ),
+                ("imagepivot_job_queue_dead_letter", "gauge", "Jobs parked in the dead-letter list.", [({}, counters.get("dead", 0))]),
+            ]
+    except Exception as e:
+        print(f"[METRICS] WARNING: Could not read job queue counters: {e}")
+
+    try:
+        fair = fair_stats()
+        if fair.get("enabled"):
+            orgs = sorted(fair["orgs"].items())
+            families += [
+                ("imagepivot_org_queue_depth", "gauge", "Jobs waiting in an org's fair-scheduling sub-queue.", [({"org": o}, s["depth"]) for o, s in orgs]),
+                ("imagepivot_org_queue_overdue", "gauge", "Waiting jobs already past their deadline, by org.", [({"org": o}, s["overdue"]) for o, s in orgs]),
+                (
+                    "imagepivot_org_queue_wait_p95_seconds", "gauge", "p95 queued-to-dispatch wait of an org's recent jobs.",
+                    [({"org": o}, s["p95_wait_ms"] / 1000) for o, s in orgs],
+                ),
+            ]
+    except Exception as e:
+        print(f"[METRICS] WARNING: Could not read fair scheduler stats: {e}")
+
+    running = None
+    try:
+        jobs = job_metrics.stats()
+        running = jobs["running"]
+        families += [
+            ("imagepivot_jobs_active", "gauge", "Jobs executing right now.", [({}, running)]),
+            (
+                "imagepivot_jobs_finished_total", "counter", "Jobs finished, by final status.",
+                [({"status": status}, count) for status, count in sorted(jobs["finished"].items())],
+            ),
+            (
+                "imagepivot_jobs_completed_per_second", "gauge",
+                f"Completed jobs per second over the last {job_metrics.RATE_WINDOW_MINUTES} full minutes.",
+                [({}, jobs["completed_per_second"])],
+            ),
+        ]
+    except Exception as e:
+        print(f"[METRICS] WARNING: Could not read job counters: {e}")
+
+    if get_worker_mode() == "celery":
+        try:
+            backlog = _celery_backlog()
+            unacked = backlog.pop("unacked")
+            families += [
+                (
+                    "imagepivot_celery_queue_length", "gauge", "Messages waiting in a Celery queue (all priorities).",
+                    [({"queue": queue_name}, length) for queue_name, length in backlog.items()],
+                ),
+                (
+                    "imagepivot_celery_tasks_reserved", "gauge", "Tasks prefetched by a worker but not started.",
+                    [({}, max(0, unacked - (running or 0)))],
+                ),
+            ]
+        except Exception as e:
+            print(f"[METRICS] WARNING: Could not read Celery broker: {e}")
+
+        batches = batch_stats()
+        families += [
+            ("imagepivot_dispatch_batches_total", "counter", "Batches this consumer published to Celery.", [({}, batches["batches"])]),
+            ("imagepivot_dispatch_jobs_total", "counter", "Jobs this consumer published to Celery.", [({}, batches["jobs"])]),
+            (
+                "imagepivot_dispatch_seconds_total", "counter", "Time from dequeue to the last publish of each batch, summed.",
+                [({}, round(batches["total_dispatch_ms"] / 1000, 3))],
+            ),
+        ]
+
+        bp = backpressure_stats()
+        if bp.get("enabled"):
+            families.append(
+                ("imagepivot_backpressure_paused", "gauge", "1 while the consumer holds jobs back from Celery.", [({}, int(bp["paused"]))])
+            )
+
+    try:
+        outcome = deadlines.stats()
+        families.append((
+            "imagepivot_job_deadlines_total", "counter", "Finished jobs by whether they met their deadline.",
+            [({"outcome": "met"}, outcome["met"]), ({"outcome": "missed"}, outcome["missed"])],
+        ))
+    except Exception as e:
+        print(f"[METRICS] WARNING: Could not read deadline counters: {e}")
+
+    memory_stats = memory.stats()
+    families += [
+        (
+            "imagepivot_job_peak_rss_bytes", "gauge", "Largest job-process peak RSS seen, by feature.",
+            [({"feature": feature}, peak) for feature, peak in sorted(memory_stats["peak_rss_bytes"].items())],
+        ),
+        ("imagepivot_jobs_memory_deferred_total", "counter", "Jobs deferred because their process lacked memory.", [({}, memory_stats["deferred"])]),
+    ]
+
+    cache = input_cache.stats()
+    families += [
+        (
+            "imagepivot_input_cache_lookups_total", "counter", "Node-local input cache lookups by result.",
+            [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])],
+        ),
+        ("imagepivot_input_cache_served_bytes_total", "counter", "Input bytes served from the cache instead of storage.", [({}, cache["bytes_served"])]),
+        ("imagepivot_input_cache_evictions_total", "counter", "Inputs evicted from the cache.", [({}, cache["evictions"])]),
+    ]
+
+    results = result_cache.stats()
+    families.append((
+        "imagepivot_result_cache_lookups_total", "counter", "Output dedup cache lookups by result (stale: index entry whose object was gone).",
+        [({"result": "hit"}, results["hits"]), ({"result": "miss"}, results["misses"]), ({"result": "stale"}, results["stale"])],
+    ))
+
+    flights = single_flight.stats()
+    families.append((
+        "imagepivot_single_flight_total", "counter",
+        "Identical jobs coalesced, by outcome (deferred: follower retried later instead of waiting in its slot).",
+        [({"outcome": field}, flights[field]) for field in single_flight.STAT_FIELDS],
+    ))
+
+    timeouts = []
+    for field, count in sorted(time_limits.stats().items()):
+        feature, _, limit = field.rpartition(":")
+        timeouts.append(({"feature": feature, "limit": limit}, count))
+    families.append(("imagepivot_job_timeouts_total", "counter", "Jobs stopped at their soft or hard time limit, by feature.", timeouts))
+
+    return families
+
+
+def _format(families: List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]) -> str:
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render() -> str:
+    """The metrics page, recomputed at most once per METRICS_CACHE_SECONDS."""
+    global _cached
+    with _lock:
+        now = time.monotonic()
+        if _cached is None or now - _cached[0] >= get_cache_seconds():
+            _cached = (now, _format(_collect()))
+        return _cached[1]
@@ -1,14 +1,29 @@
 import json
 import os
+import threading
 import time
-from typing import Any, Dict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
 import redis
 
+import backpressure
+import fair_scheduler
+import stream_queue
+from backpressure import Backpressure
+from fair_scheduler import FairScheduler
+from reliable_queue import ReliableQueue, get_reaper_interval
+from services import deadlines, time_limits
+from stream_queue import StreamQueue
+
 JOB_QUEUE_KEY_V1 = "imagepivot:jobs:v1"
 
 _stop = False
 _redis_client: redis.Redis | None = None
+_queue: ReliableQueue | StreamQueue | None = None
+_scheduler: FairScheduler | None = None
+_backpressure: Backpressure | None = None
+_executor: Any = None
 
 
 def _get_redis_client() -> redis.Redis:
@@ -19,22 +34,194 @@ def _get_redis_client() -> redis.Redis:
     return client
 
 
-def _handle_job(payload: Dict[str, Any]) -> None:
+def get_batch_size() -> int:
+    """
+    Max jobs taken per dequeue: one blocking move plus up to N-1 more in a
+    single pipelined round trip. Env: QUEUE_BATCH_SIZE (default: 1).
+    """
+    try:
+        return max(1, int(os.getenv("QUEUE_BATCH_SIZE", "1")))
+    except ValueError:
+        return 1
+
+
+_batch_stats: Dict[str, Any] = {
+    "batches": 0,
+    "jobs": 0,
+    "max_batch": 0,
+    "last_dispatch_ms": 0.0,
+    "total_dispatch_ms": 0.0,
+}
+
+
+def get_worker_mode() -> str:
+    """
+    Env: WORKER_MODE - "celery" (default) re-publishes jobs to the Celery
+    broker; "direct" runs them in a local process pool (direct_executor).
+    """
+    return os.getenv("WORKER_MODE", "celery").lower()
+
+
+def _parse_job(raw: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = json.loads(raw)
+        print(f"[WORKER] Parsed payload: jobId={payload.get('jobId')}, featureSlug={payload.get('featureSlug')}")
+        return payload
+    except json.JSONDecodeError as e:
+        print(f"[WORKER] ERROR: Failed to parse JSON payload: {e}")
+        print(f"[WORKER] Raw payload (first 200 chars): {raw[:200]}")
+        return None
+
+
+def _queued_age_ms(payload: Dict[str, Any]) -> Optional[float]:
+    queued = deadlines.queued_at(payload)
+    if queued is None:
+        return None
+    return (datetime.now(timezone.utc) - queued).total_seconds() * 1000
+
+
+def _dispatch_batch(jobs: List[Tuple[str, Dict[str, Any]]], dequeued_at: float) -> None:
+    """
+    Publish a batch to Celery over one broker connection and report
+    dequeue-to-dispatch latency for the batch. Published jobs are acknowledged
+    together in one Redis round trip afterwards; ones that fail to publish
+    stay in-flight for the reaper to requeue.
+    """
     # Dispatch to Celery task (real processing lives there)
+    from celery_app import celery_app, queue_for_job
     from tasks.process_job import process_job
 
-    job_id = payload.get("jobId", "unknown")
-    feature_slug = payload.get("featureSlug", "unknown")
-    media_type = payload.get("mediaType", "unknown")
-    
-    print(f"[WORKER] Received job from queue: jobId={job_id}, feature={feature_slug}, mediaType={media_type}")
-    
+    payloads = [payload for _raw, payload in jobs]
+    published: List[Tuple[str, Optional[str]]] = []
+    with celery_app.producer_or_acquire() as producer:
+        for raw, payload in jobs:
+            job_id = payload.get("jobId", "unknown")
+            feature_slug = payload.get("featureSlug", "unknown")
+            media_type = payload.get("mediaType", "unknown")
+            print(f"[WORKER] Received job from queue: jobId={job_id}, feature={feature_slug}, mediaType={media_type}")
+            try:
+                queue = queue_for_job(payload)
+                priority = deadlines.celery_priority(payload)
+                result = process_job.apply_async(
+                    args=[payload], producer=producer, queue=queue, priority=priority,
+                    time_limit=time_limits.hard_limit(payload),
+                )
+                published.append((raw, payload.get("jobId")))
+                print(f"[WORKER] Celery task dispatched: jobId={job_id}, taskId={result.id}, queue={queue}, priority={priority}")
+            except Exception as e:
+                print(f"[WORKER] ERROR: Failed to dispatch Celery task for job {job_id}: {e}")
+                import traceback
+                traceback.print_exc()
+
+    dispatched = len(published)
+    if published:
+        try:
+            _queue.ack_many(published)
+        except Exception as e:
+            print(f"[WORKER] ERROR: Failed to ack {dispatched} dispatched job(s), the reaper will requeue them: {e}")
+
+    dispatch_ms = (time.monotonic() - dequeued_at) * 1000
+    ages = [age for age in (_queued_age_ms(p) for p in payloads) if age is not None]
+    _batch_stats["batches"] += 1
+    _batch_stats["jobs"] += dispatched
+    _batch_stats["max_batch"] = max(_batch_stats["max_batch"], len(payloads))
+    _batch_stats["last_dispatch_ms"] = round(dispatch_ms, 2)
+    _batch_stats["total_dispatch_ms"] += dispatch_ms
+    print(
+        f"[WORKER] Batch dispatched: size={len(payloads)}, dispatched={dispatched}, "
+        f"dequeueToDispatchMs={dispatch_ms:.1f}"
+        + (f", maxQueuedAgeMs={max(ages):.0f}" if ages else "")
+    )
+
+
+def _run_direct(jobs: List[Tuple[str, Dict[str, Any]]], dequeued_at: float) -> None:
+    for raw, payload in jobs:
+        _executor.submit(payload, raw)
+    print(f"[WORKER] Batch submitted to process pool: size={len(jobs)}, dequeueToDispatchMs={(time.monotonic() - dequeued_at) * 1000:.1f}")
+
+
+def _direct_job_finished(raw: str, payload: Dict[str, Any], error: Optional[BaseException]) -> None:
+    from concurrent.futures.process import BrokenProcessPool
+
+    if isinstance(error, BrokenProcessPool):
+        # The child died mid-job; leave it in-flight so the reaper requeues it.
+        return
+    # Success or a reported failure: either way the job has been handled.
+    _queue.ack(raw, payload.get("jobId"))
+
+
+def _dead_letter_job(raw: str) -> None:
+    """A job that lost its worker QUEUE_MAX_DELIVERIES times; tell the API it failed."""
+    from api_client import post_job_status
+    from reliable_queue import get_max_deliveries
+
+    payload = _parse_job(raw) or {}
+    job_id = payload.get("jobId")
+    if not job_id:
+        return
     try:
-        result = process_job.delay(payload)
-        print(f"[WORKER] Celery task dispatched: jobId={job_id}, taskId={result.id}")
+        post_job_status(
+            job_id=job_id,
+            status="FAILED",
+            error=f"Job was abandoned by its worker {get_max_deliveries()} times (e.g. killed for running out of memory)",
+            worker_id=os.getenv("WORKER_ID"),
+        )
     except Exception as e:
-        print(f"[WORKER] ERROR: Failed to dispatch Celery task for job {job_id}: {e}")
-        raise
+        print(f"[WORKER] ERROR: Failed to mark dead-lettered job {job_id} as FAILED: {e}")
+
+
+def _drain_direct() -> None:
+    """Let running jobs finish and push back the ones that never started."""
+    global _executor
+    if _executor is None:
+        return
+    not_started = _executor.drain()
+    for raw in reversed(not_started):
+        try:
+            _queue.requeue(raw, reason="drained")
+        except Exception as e:
+            print(f"[WORKER] ERROR: Failed to requeue job: {e}")
+    if not_started:
+        print(f"[WORKER] Requeued {len(not_started)} job(s) that never started")
+    _executor = None
+
+
+def _reap_loop() -> None:
+    """Heartbeat, renew leases of running direct jobs and requeue expired ones."""
+    next_run = 0.0
+    while not _stop:
+        time.sleep(1)
+        if time.monotonic() < next_run:
+            continue
+        next_run = time.monotonic() + get_reaper_interval()
+        try:
+            _queue.heartbeat()
+            if _executor is not None:
+                _queue.extend(_executor.inflight_raws())
+            _queue.reap()
+        except Exception as e:
+            print(f"[WORKER] ERROR: Queue reaper error: {e}")
+
+
+def queue_stats() -> Dict[str, Any]:
+    return _queue.stats() if _queue is not None else {}
+
+
+def fair_stats() -> Dict[str, Any]:
+    return _scheduler.stats() if _scheduler is not None else {"enabled": False}
+
+
+def backpressure_stats() -> Dict[str, Any]:
+    return _backpressure.stats() if _backpressure is not None else {"enabled": False}
+
+
+def batch_stats() -> Dict[str, Any]:
+    batches = _batch_stats["batches"]
+    return {
+        **_batch_stats,
+        "avg_batch": (_batch_stats["jobs"] / batches) if batches else 0.0,
+        "avg_dispatch_ms": (_batch_stats["total_dispatch_ms"] / batches) if batches else 0.0,
+    }
 
 
 def request_stop() -> None:
@@ -53,7 +240,7 @@ def _close() -> None:
 
 
 def run_queue_consumer() -> None:
-    global _redis_client
+    global _redis_client, _queue, _scheduler, _backpressure, _executor
     print("[WORKER] run_queue_consumer() called")
     
     try:
@@ -64,33 +251,81 @@ def run_queue_consumer() -> None:
         _redis_client.ping()
         print("[WORKER] Redis connection successful")
         
-        print(f"[WORKER] Queue consumer started, listening on: {JOB_QUEUE_KEY_V1}")
+        if stream_queue.get_transport() == "stream":
+            _queue = StreamQueue(_redis_client, on_dead_letter=_dead_letter_job)
+            if fair_scheduler.is_enabled():
+                print("[WORKER] Fair scheduling needs the list transport; disabled for streams")
+        else:
+            _queue = ReliableQueue(_redis_client, JOB_QUEUE_KEY_V1, on_dead_letter=_dead_letter_job)
+            if fair_scheduler.is_enabled():
+                _scheduler = FairScheduler(_queue)
+        _queue.register()
+        print(f"[WORKER] Queue consumer started, listening on: {_queue.queue_key} (consumer={_queue.consumer_id})")
     except Exception as e:
         print(f"[WORKER] ERROR: Failed to connect to Redis: {e}")
         import traceback
         traceback.print_exc()
         raise
 
+    mode = get_worker_mode()
+    if mode == "direct":
+        from direct_executor import DirectExecutor
+
+        _executor = DirectExecutor(on_finished=_direct_job_finished)
+    elif backpressure.is_enabled():
+        from celery_app import AUDIO_QUEUE, HEAVY_QUEUE, IMAGE_QUEUE, celery_app
+
+        _backpressure = Backpressure(celery_app.conf.broker_url, [IMAGE_QUEUE, AUDIO_QUEUE, HEAVY_QUEUE])
+
+    print(
+        f"[WORKER] Worker mode: {mode}, dequeue batch size: {get_batch_size()}, "
+        f"fair scheduling: {'on' if _scheduler is not None else 'off'}"
+    )
+    source = _scheduler if _scheduler is not None else _queue
+    threading.Thread(target=_reap_loop, name="queue-reaper", daemon=True).start()
+
     while not _stop:
         try:
-            item = _redis_client.blpop(JOB_QUEUE_KEY_V1, timeout=5)  # type: ignore[union-attr]
-            if not item:
+            max_items = get_batch_size()
+            if _executor is not None:
+                # Only take jobs we can start now; the rest stay in Redis.
+                if not _executor.wait_for_slot(timeout=1):
+                    continue
+                max_items = min(max_items, _executor.free_slots())
+            elif _backpressure is not None:
+                # Leave jobs in Redis while Celery already has plenty queued.
+                headroom = _backpressure.headroom()
+                if headroom <= 0:
+                    time.sleep(backpressure.CHECK_INTERVAL_SECONDS)
+                    continue
+                max_items = min(max_items, headroom)
+
+            raws, dequeued_at = source.pop_batch(timeout=5, max_items=max_items)
+            if not raws:
                 continue
 
-            _key, raw = item
-            print(f"[WORKER] Received item from queue: key={_key}, size={len(raw)} bytes")
+            print(f"[WORKER] Received {len(raws)} item(s) from queue: key={_queue.queue_key}, size={sum(len(r) for r in raws)} bytes")
             
-            try:
-                payload = json.loads(raw)
-                print(f"[WORKER] Parsed payload: jobId={payload.get('jobId')}, featureSlug={payload.get('featureSlug')}")
-                _handle_job(payload)
-            except json.JSONDecodeError as e:
-                print(f"[WORKER] ERROR: Failed to parse JSON payload: {e}")
-                print(f"[WORKER] Raw payload (first 200 chars): {raw[:200]}")
-            except Exception as e:
-                print(f"[WORKER] ERROR: Failed to handle job: {e}")
-                import traceback
-                traceback.print_exc()
+            jobs = []
+            for raw in raws:
+                payload = _parse_job(raw)
+                if payload is None:
+                    _queue.discard(raw)
+                else:
+                    jobs.append((raw, payload))
+            jobs = _queue.filter_duplicates(jobs)
+            # Hand off the most urgent jobs first; undated ones go last.
+            jobs.sort(key=lambda job: deadlines.deadline_at(job[1]) or datetime.max.replace(tzinfo=timezone.utc))
+            if jobs:
+                try:
+                    if _executor is not None:
+                        _run_direct(jobs, dequeued_at)
+                    else:
+                        _dispatch_batch(jobs, dequeued_at)
+                except Exception as e:
+                    print(f"[WORKER] ERROR: Failed to handle job batch: {e}")
+                    import traceback
+                    traceback.print_exc()
         except Exception as e:
             print(f"[WORKER] ERROR: Queue consumer error: {e}")
             import traceback
@@ -98,6 +333,7 @@ def run_queue_consumer() -> None:
             time.sleep(1)
 
     print("[WORKER] Queue consumer stopping...")
+    _drain_direct()
     _close()
 
 
@@ -1,10 +1,62 @@
 import os
-from typing import Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional, Tuple
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 
-def _r2_client():
+# One boto3 client per process. Celery prefork children each get their own
+# client (created lazily after fork), so per-node connections are roughly
+# concurrency * R2_MAX_POOL_CONNECTIONS.
+_client = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+_client_stats: Dict[str, Any] = {"hits": 0, "misses": 0, "created_at": None}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _client_config() -> Config:
+    """
+    Connection pool, retry and timeout settings for the R2 client.
+
+    Env:
+        R2_MAX_POOL_CONNECTIONS: keep-alive connections per process (default: 10, and
+            never below R2_MAX_TRANSFER_CONCURRENCY + 2 so parallel parts don't queue)
+        R2_MAX_ATTEMPTS: total attempts per request, including the first (default: 3)
+        R2_RETRY_MODE: botocore retry mode, legacy/standard/adaptive (default: standard)
+        R2_CONNECT_TIMEOUT: seconds (default: 5)
+        R2_READ_TIMEOUT: seconds (default: 60)
+    """
+    return Config(
+        max_pool_connections=max(_env_int("R2_MAX_POOL_CONNECTIONS", 10), get_max_transfer_concurrency() + 2),
+        retries={
+            "max_attempts": _env_int("R2_MAX_ATTEMPTS", 3),
+            "mode": os.getenv("R2_RETRY_MODE", "standard"),
+        },
+        connect_timeout=_env_float("R2_CONNECT_TIMEOUT", 5.0),
+        read_timeout=_env_float("R2_READ_TIMEOUT", 60.0),
+        tcp_keepalive=True,
+    )
+
+
+def _create_client():
     endpoint = os.getenv("R2_ENDPOINT")
     access_key = os.getenv("R2_ACCESS_KEY_ID")
     secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
@@ -12,19 +64,102 @@ def _r2_client():
     if not endpoint or not access_key or not secret_key:
         raise RuntimeError("R2 credentials not configured (R2_ENDPOINT/R2_ACCESS_KEY_ID/R2_SECRET_ACCESS_KEY)")
 
-    return boto3.client(
+    # A private session keeps credential resolution off the shared default
+    # session, which is not thread-safe.
+    session = boto3.session.Session()
+    return session.client(
         "s3",
         endpoint_url=endpoint,
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key,
         region_name="auto",
+        config=_client_config(),
     )
 
 
+def _r2_client():
+    """
+    Return the process-wide R2 client, creating it on first use.
+
+    The client is rebuilt when the PID changes so a client inherited across
+    fork (whose sockets belong to the parent) is never reused.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    client = _client
+    if client is not None and _client_pid == pid:
+        _client_stats["hits"] += 1
+        return client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid
+            _client_stats["misses"] += 1
+            _client_stats["created_at"] = time.time()
+            print(f"[R2] Created pooled R2 client: pid={pid}, maxPoolConnections={_client.meta.config.max_pool_connections}")
+        else:
+            _client_stats["hits"] += 1
+        return _client
+
+
+def reset_client() -> None:
+    """Drop the cached client (called after fork and on worker shutdown)."""
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+    _client_stats["hits"] = 0
+    _client_stats["misses"] = 0
+    _client_stats["created_at"] = None
+
+
+def client_stats() -> Dict[str, Any]:
+    """
+    Pool hit/miss counters for this process.
+
+    A miss means a new client (and new TLS connections) was built; in a
+    healthy worker misses stays at 1 per process.
+    """
+    return {"pid": os.getpid(), **_client_stats}
+
+
+def _reset_after_fork() -> None:
+    # A fork can happen while a parent thread (e.g. an input prefetch) holds
+    # the lock; the child would wait on it forever.
+    global _client_lock
+    _client_lock = threading.Lock()
+    reset_client()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
 def _bucket() -> str:
     return os.getenv("R2_BUCKET_NAME", "imagepivot-uploads")
 
 
+class ObjectInfo(NamedTuple):
+    """Object metadata taken from the GET/PUT/COPY response itself."""
+
+    size_bytes: int
+    content_type: Optional[str]
+    etag: Optional[str]
+
+
+def _etag(value: Optional[str]) -> Optional[str]:
+    return value.strip('"') if value else None
+
+
+def _is_not_modified(e: ClientError) -> bool:
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status == 304 or e.response.get("Error", {}).get("Code") in ("304", "NotModified")
+
+
+_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
 def head_object(key: str) -> Tuple[int, Optional[str]]:
     s3 = _r2_client()
     resp = s3.head_object(Bucket=_bucket(), Key=key)
@@ -33,22 +168,463 @@ def head_object(key: str) -> Tuple[int, Optional[str]]:
     return size_bytes, content_type
 
 
-def download_file(key: str, local_path: str) -> None:
+def stat_object(key: str) -> ObjectInfo:
+    """HEAD an object and return its size, content type and ETag."""
+    s3 = _r2_client()
+    resp = s3.head_object(Bucket=_bucket(), Key=key)
+    return ObjectInfo(int(resp.get("ContentLength", 0)), resp.get("ContentType"), _etag(resp.get("ETag")))
+
+
+def open_object(key: str) -> Tuple[ObjectInfo, Any]:
+    """
+    GET an object and return its metadata with the unread body stream.
+
+    The caller decides where the bytes go (memory or disk) after seeing the
+    size, and must close the body.
+    """
     s3 = _r2_client()
-    s3.download_file(_bucket(), key, local_path)
+    resp = s3.get_object(Bucket=_bucket(), Key=key)
+    info = ObjectInfo(int(resp.get("ContentLength", 0)), resp.get("ContentType"), _etag(resp.get("ETag")))
+    return info, resp["Body"]
 
 
-def upload_file(local_path: str, key: str, content_type: Optional[str] = None) -> None:
+def open_object_if_changed(key: str, etag: str) -> Optional[Tuple[ObjectInfo, Any]]:
+    """
+    Conditional GET (If-None-Match). Returns None when the object still has
+    the given ETag (304, no body transferred), otherwise the same as open_object.
+    """
     s3 = _r2_client()
-    extra_args = {}
+    try:
+        resp = s3.get_object(Bucket=_bucket(), Key=key, IfNoneMatch=f'"{etag}"')
+    except ClientError as e:
+        if _is_not_modified(e):
+            return None
+        raise
+    info = ObjectInfo(int(resp.get("ContentLength", 0)), resp.get("ContentType"), _etag(resp.get("ETag")))
+    return info, resp["Body"]
+
+
+def get_object_range(
+    key: str,
+    start: int,
+    end: int,
+    if_none_match: Optional[str] = None,
+) -> Optional[Tuple[bytes, ObjectInfo]]:
+    """
+    Ranged GET of bytes [start, end] (inclusive).
+
+    The returned ObjectInfo carries the full object size (from Content-Range),
+    not the length of the slice. With if_none_match, returns None when the
+    object still has that ETag.
+    """
+    s3 = _r2_client()
+    kwargs = {"Bucket": _bucket(), "Key": key, "Range": f"bytes={start}-{end}"}
+    if if_none_match:
+        kwargs["IfNoneMatch"] = f'"{if_none_match}"'
+    try:
+        resp = s3.get_object(**kwargs)
+    except ClientError as e:
+        if if_none_match and _is_not_modified(e):
+            return None
+        raise
+
+    body = resp["Body"]
+    try:
+        data = body.read()
+    finally:
+        body.close()
+
+    size_bytes = int(resp.get("ContentLength", len(data)))
+    content_range = resp.get("ContentRange")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            size_bytes = int(total)
+    return data, ObjectInfo(size_bytes, resp.get("ContentType"), _etag(resp.get("ETag")))
+
+
+def read_body_into(body: Any, fileobj: BinaryIO) -> int:
+    """Drain a GET body into fileobj and close it. Returns bytes written."""
+    written = 0
+    try:
+        for chunk in body.iter_chunks(_DOWNLOAD_CHUNK_BYTES):
+            fileobj.write(chunk)
+            written += len(chunk)
+    finally:
+        body.close()
+    return written
+
+
+class TransferPlan(NamedTuple):
+    multipart: bool
+    chunk_bytes: int
+    part_count: int
+    concurrency: int
+
+
+# S3/R2 hard limits.
+_MIN_PART_BYTES = 5 * 1024 * 1024
+_MAX_PARTS = 10000
+
+
+def get_max_transfer_concurrency() -> int:
+    return max(1, _env_int("R2_MAX_TRANSFER_CONCURRENCY", 8))
+
+
+def plan_transfer(size_bytes: int) -> TransferPlan:
+    """
+    Choose single-stream vs multipart, part size and concurrency for an
+    object of size_bytes.
+
+    Env:
+        R2_MULTIPART_THRESHOLD_BYTES: go multipart at/above this size (default: 16 MiB)
+        R2_MULTIPART_CHUNK_BYTES: base part size (default: 8 MiB); grown for very
+            large objects so there are never more than 10,000 parts
+        R2_MAX_TRANSFER_CONCURRENCY: parallel parts per transfer (default: 8)
+    """
+    threshold = _env_int("R2_MULTIPART_THRESHOLD_BYTES", 16 * 1024 * 1024)
+    chunk = max(_MIN_PART_BYTES, _env_int("R2_MULTIPART_CHUNK_BYTES", 8 * 1024 * 1024))
+
+    if size_bytes < max(threshold, chunk + 1):
+        return TransferPlan(False, size_bytes, 1, 1)
+
+    if size_bytes > chunk * _MAX_PARTS:
+        mib = 1024 * 1024
+        chunk = -(-size_bytes // _MAX_PARTS)
+        chunk = -(-chunk // mib) * mib
+
+    part_count = -(-size_bytes // chunk)
+    return TransferPlan(True, chunk, part_count, min(get_max_transfer_concurrency(), part_count))
+
+
+def _log_transfer(direction: str, key: str, size_bytes: int, seconds: float, plan: TransferPlan) -> None:
+    mbps = (size_bytes / (1024 * 1024)) / seconds if seconds > 0 else 0.0
+    print(
+        f"[R2] {direction} {key}: {size_bytes} bytes in {seconds:.2f}s "
+        f"({mbps:.1f} MiB/s, parts={plan.part_count}, concurrency={plan.concurrency})"
+    )
+
+
+def _write_range(key: str, etag: Optional[str], local_path: str, start: int, end: int) -> None:
+    s3 = _r2_client()
+    kwargs = {"Bucket": _bucket(), "Key": key, "Range": f"bytes={start}-{end}"}
+    if etag:
+        # Fail instead of stitching parts of two different versions together.
+        kwargs["IfMatch"] = f'"{etag}"'
+    body = s3.get_object(**kwargs)["Body"]
+    with open(local_path, "r+b") as f:
+        f.seek(start)
+        read_body_into(body, f)
+
+
+def _save_parts(key: str, info: ObjectInfo, body: Any, local_path: str, plan: TransferPlan) -> None:
+    with open(local_path, "wb") as f:
+        f.truncate(info.size_bytes)
+
+    ranges = [
+        (start, min(start + plan.chunk_bytes, info.size_bytes) - 1)
+        for start in range(plan.chunk_bytes, info.size_bytes, plan.chunk_bytes)
+    ]
+    with ThreadPoolExecutor(max_workers=plan.concurrency) as pool:
+        futures = [pool.submit(_write_range, key, info.etag, local_path, start, end) for start, end in ranges]
+        try:
+            with open(local_path, "r+b") as f:
+                remaining = plan.chunk_bytes
+                try:
+                    for chunk in body.iter_chunks(_DOWNLOAD_CHUNK_BYTES):
+                        chunk = chunk[:remaining]
+                        f.write(chunk)
+                        remaining -= len(chunk)
+                        if remaining <= 0:
+                            break
+                finally:
+                    # Abandons the rest of the single-stream GET; its bytes
+                    # come from the ranged parts instead.
+                    body.close()
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def save_body_to_file(key: str, info: ObjectInfo, body: Any, local_path: str) -> None:
+    """
+    Write an opened GET (see open_object) to local_path.
+
+    Large objects are split per plan_transfer: the already-open body supplies
+    the first part while the remaining parts are fetched with parallel
+    ranged GETs into their offsets of the same file.
+
+    The data goes to local_path + ".part" and is renamed on success, so a
+    failed download leaves nothing behind for the caller to clean up.
+    """
+    started = time.monotonic()
+    plan = plan_transfer(info.size_bytes)
+    part_path = local_path + ".part"
+
+    try:
+        if plan.multipart:
+            _save_parts(key, info, body, part_path, plan)
+        else:
+            with open(part_path, "wb") as f:
+                read_body_into(body, f)
+        os.replace(part_path, local_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+
+    _log_transfer("download", key, info.size_bytes, time.monotonic() - started, plan)
+
+
+def download_file(key: str, local_path: str) -> ObjectInfo:
+    """
+    Download an object to local_path.
+
+    Size, content type and ETag come from the GET response headers, so no
+    follow-up HEAD is needed.
+    """
+    info, body = open_object(key)
+    save_body_to_file(key, info, body, local_path)
+    return info
+
+
+def _upload_part(key: str, upload_id: str, part_number: int, local_path: str, offset: int, length: int) -> Dict[str, Any]:
+    with open(local_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    resp = _r2_client().upload_part(
+        Bucket=_bucket(),
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=data,
+        ContentLength=len(data),
+    )
+    return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+
+def _multipart_upload_file(local_path: str, key: str, size_bytes: int, content_type: Optional[str], plan: TransferPlan) -> Optional[str]:
+    s3 = _r2_client()
+    kwargs = {"Bucket": _bucket(), "Key": key}
     if content_type:
-        extra_args["ContentType"] = content_type
-    s3.upload_file(local_path, _bucket(), key, ExtraArgs=extra_args if extra_args else None)
+        kwargs["ContentType"] = content_type
+    upload_id = s3.create_multipart_upload(**kwargs)["UploadId"]
+
+    try:
+        with ThreadPoolExecutor(max_workers=plan.concurrency) as pool:
+            futures = [
+                pool.submit(
+                    _upload_part,
+                    key,
+                    upload_id,
+                    index + 1,
+                    local_path,
+                    offset,
+                    min(plan.chunk_bytes, size_bytes - offset),
+                )
+                for index, offset in enumerate(range(0, size_bytes, plan.chunk_bytes))
+            ]
+            parts = [future.result() for future in futures]
+
+        resp = s3.complete_multipart_upload(
+            Bucket=_bucket(),
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        try:
+            s3.abort_multipart_upload(Bucket=_bucket(), Key=key, UploadId=upload_id)
+        except Exception as abort_err:
+            print(f"[R2] WARNING: Failed to abort multipart upload {upload_id} for {key}: {abort_err}")
+        raise
+    return _etag(resp.get("ETag"))
 
 
-def copy_object(src_key: str, dest_key: str, content_type: Optional[str] = None) -> int:
+def upload_file(local_path: str, key: str, content_type: Optional[str] = None) -> ObjectInfo:
     """
-    Server-side copy within the same bucket. Returns output size in bytes.
+    Upload local_path, as a single PUT or a parallel multipart upload
+    depending on size. The size is known locally and the ETag comes back
+    on the PUT/CompleteMultipartUpload response.
+    """
+    started = time.monotonic()
+    size_bytes = os.path.getsize(local_path)
+    plan = plan_transfer(size_bytes)
+
+    if plan.multipart:
+        etag = _multipart_upload_file(local_path, key, size_bytes, content_type, plan)
+    else:
+        s3 = _r2_client()
+        kwargs = {"Bucket": _bucket(), "Key": key}
+        if content_type:
+            kwargs["ContentType"] = content_type
+        with open(local_path, "rb") as f:
+            resp = s3.put_object(Body=f, ContentLength=size_bytes, **kwargs)
+        etag = _etag(resp.get("ETag"))
+
+    _log_transfer("upload", key, size_bytes, time.monotonic() - started, plan)
+    return ObjectInfo(size_bytes, content_type, etag)
+
+
+class StreamingUpload:
+    """
+    Writable sink that uploads to R2 while it is being written.
+
+    Bytes are buffered into fixed-size parts (R2 requires equal-sized parts
+    except the last); each full part is handed to a thread pool and uploaded
+    while the producer (an encoder writing into a pipe) keeps going. At most
+    `concurrency` parts are in flight, which bounds memory. Outputs smaller
+    than one part are sent with a single PUT on close().
+    """
+
+    def __init__(self, key: str, content_type: Optional[str] = None):
+        self.key = key
+        self.content_type = content_type
+        self.size_bytes = 0
+        self.etag: Optional[str] = None
+        self.closed = False
+        self._chunk_bytes = max(_MIN_PART_BYTES, _env_int("R2_MULTIPART_CHUNK_BYTES", 8 * 1024 * 1024))
+        self._concurrency = get_max_transfer_concurrency()
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self._concurrency)
+        self._futures: list = []
+        self._started = time.monotonic()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError("write to closed StreamingUpload")
+        self._buffer.extend(data)
+        self.size_bytes += len(data)
+        while len(self._buffer) >= self._chunk_bytes:
+            part = bytes(self._buffer[: self._chunk_bytes])
+            del self._buffer[: self._chunk_bytes]
+            self._submit_part(part)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _submit_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            kwargs = {"Bucket": _bucket(), "Key": self.key}
+            if self.content_type:
+                kwargs["ContentType"] = self.content_type
+            self._upload_id = _r2_client().create_multipart_upload(**kwargs)["UploadId"]
+            self._pool = ThreadPoolExecutor(max_workers=self._concurrency)
+
+        part_number = len(self._futures) + 1
+        # Blocks the producer when `concurrency` parts are already uploading.
+        self._slots.acquire()
+        future = self._pool.submit(self._upload_part, part_number, data)
+        future.add_done_callback(lambda _f: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number: int, data: bytes) -> Dict[str, Any]:
+        resp = _r2_client().upload_part(
+            Bucket=_bucket(),
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+            ContentLength=len(data),
+        )
+        return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+    def close(self) -> ObjectInfo:
+        """Upload what's left and complete the object."""
+        if self.closed:
+            return ObjectInfo(self.size_bytes, self.content_type, self.etag)
+        self.closed = True
+
+        try:
+            if self._upload_id is None:
+                s3 = _r2_client()
+                kwargs = {"Bucket": _bucket(), "Key": self.key}
+                if self.content_type:
+                    kwargs["ContentType"] = self.content_type
+                resp = s3.put_object(Body=bytes(self._buffer), ContentLength=len(self._buffer), **kwargs)
+                self.etag = _etag(resp.get("ETag"))
+                part_count = 1
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                resp = _r2_client().complete_multipart_upload(
+                    Bucket=_bucket(),
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+                self.etag = _etag(resp.get("ETag"))
+                part_count = len(parts)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+
+        plan = TransferPlan(part_count > 1, self._chunk_bytes, part_count, self._concurrency)
+        _log_transfer("upload", self.key, self.size_bytes, time.monotonic() - self._started, plan)
+        return ObjectInfo(self.size_bytes, self.content_type, self.etag)
+
+    def abort(self) -> None:
+        """Discard the upload; nothing becomes visible under key."""
+        self.closed = True
+        self._buffer = bytearray()
+        for future in self._futures:
+            future.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        if self._upload_id is not None:
+            try:
+                _r2_client().abort_multipart_upload(Bucket=_bucket(), Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                print(f"[R2] WARNING: Failed to abort streaming upload for {self.key}: {e}")
+            self._upload_id = None
+
+    def __enter__(self) -> "StreamingUpload":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def upload_bytes(data: bytes, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+    """Upload an in-memory payload with a single PUT."""
+    s3 = _r2_client()
+    kwargs = {"Bucket": _bucket(), "Key": key}
+    if content_type:
+        kwargs["ContentType"] = content_type
+    resp = s3.put_object(Body=data, ContentLength=len(data), **kwargs)
+    return ObjectInfo(len(data), content_type, _etag(resp.get("ETag")))
+
+
+def copy_object(
+    src_key: str,
+    dest_key: str,
+    content_type: Optional[str] = None,
+    size_bytes: Optional[int] = None,
+) -> ObjectInfo:
+    """
+    Server-side copy within the same bucket.
+
+    CopyObject does not return the object size; pass size_bytes when the
+    caller already knows it (e.g. from a cached result) to skip the HEAD.
     """
     s3 = _r2_client()
     copy_source = {"Bucket": _bucket(), "Key": src_key}
@@ -62,10 +638,9 @@ def copy_object(src_key: str, dest_key: str, content_type: Optional[str] = None)
         kwargs["ContentType"] = content_type
         kwargs["MetadataDirective"] = "REPLACE"
 
-    s3.copy_object(**kwargs)
-    size_bytes, _ = head_object(dest_key)
-    return size_bytes
-
-
-
-
+    resp = s3.copy_object(**kwargs)
+    etag = _etag(resp.get("CopyObjectResult", {}).get("ETag"))
+    if size_bytes is None:
+        size_bytes, head_type = head_object(dest_key)
+        content_type = content_type or head_type
+    return ObjectInfo(size_bytes, content_type, etag)
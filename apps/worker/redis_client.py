@@ -0,0 +1,45 @@
+import os
+import threading
+from typing import Optional
+
+import redis
+
+
+_client: Optional[redis.Redis] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def _redis_url() -> str:
+    return os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+def get_redis() -> redis.Redis:
+    """
+    Process-wide Redis client for task-side caches and counters.
+
+    Like the R2 client it is created lazily and rebuilt after fork, so
+    prefork children never share the parent's connection pool.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = redis.Redis.from_url(_redis_url(), decode_responses=True)
+            _client_pid = pid
+        return _client
+
+
+def _reset_after_fork() -> None:
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
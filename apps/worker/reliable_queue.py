@@ -0,0 +1,280 @@
+"""
+At-least-once consumption of the job list.
+
+Jobs are moved (BLMOVE/LMOVE) from the job list into a per-consumer
+processing list instead of being popped, and each gets a lease in a shared
+ZSET scored by pop time. A job is acknowledged (removed from the processing
+list) only once it has been handed off: published to Celery, or finished in
+direct mode. A reaper requeues entries whose lease is older than the
+visibility timeout, e.g. because their consumer crashed between pop and
+dispatch.
+
+Jobs that were already acknowledged once are recorded by jobId; if one comes
+back (requeued after dispatch but before ack) it is counted as a duplicate
+and dropped instead of being processed twice.
+
+Every requeue after a lost lease counts as a failed delivery of that jobId.
+A job that reaches QUEUE_MAX_DELIVERIES (e.g. one that OOM-kills the direct
+process pool each time it runs) is moved to the dead-letter list and handed
+to on_dead_letter instead of being requeued again. Jobs handed back on a
+graceful drain don't count.
+
+Keys (for queue key Q):
+    Q:processing:<consumer>  raw payloads this consumer has taken
+    Q:leases                 ZSET raw payload -> pop time
+    Q:consumers              SET of consumer ids with a processing list
+    Q:heartbeat:<consumer>   set while the consumer is alive
+    Q:acked:<jobId>          set after a job was handed off
+    Q:deliveries             HASH jobId -> failed deliveries so far
+    Q:dead                   raw payloads that hit QUEUE_MAX_DELIVERIES
+    Q:metrics                HASH of counters
+
+Env:
+    QUEUE_VISIBILITY_TIMEOUT_SECONDS: lease length (default: 300)
+    QUEUE_REAPER_INTERVAL_SECONDS: how often leases are checked (default: 30)
+    QUEUE_MAX_DELIVERIES: failed deliveries before a job is dead-lettered (default: 5)
+"""
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+ACKED_TTL_SECONDS = 24 * 3600
+
+# Move one entry from a processing list back to the head of the job list,
+# only if it is still there (another reaper may have got to it first). With a
+# jobId in ARGV[3] the delivery is counted, and at ARGV[4] failed deliveries
+# the entry goes to the dead-letter list instead. Returns 0 (not there),
+# 1 (requeued) or 2 (dead-lettered).
+_REQUEUE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+if ARGV[3] ~= '' and redis.call('HINCRBY', KEYS[5], ARGV[3], 1) >= tonumber(ARGV[4]) then
+    redis.call('HDEL', KEYS[5], ARGV[3])
+    redis.call('RPUSH', KEYS[6], ARGV[1])
+    redis.call('HINCRBY', KEYS[4], 'dead_lettered', 1)
+    return 2
+end
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('HINCRBY', KEYS[4], ARGV[2], 1)
+return 1
+"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_visibility_timeout() -> int:
+    return _env_int("QUEUE_VISIBILITY_TIMEOUT_SECONDS", 300)
+
+
+def get_reaper_interval() -> int:
+    return max(1, _env_int("QUEUE_REAPER_INTERVAL_SECONDS", 30))
+
+
+def get_max_deliveries() -> int:
+    return max(1, _env_int("QUEUE_MAX_DELIVERIES", 5))
+
+
+def default_consumer_id() -> str:
+    """Env: QUEUE_CONSUMER_ID (default: <hostname>-<pid>, stable across container restarts)."""
+    return os.getenv("QUEUE_CONSUMER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _job_id(raw: str) -> Optional[str]:
+    try:
+        return json.loads(raw).get("jobId")
+    except (ValueError, AttributeError):
+        return None
+
+
+class ReliableQueue:
+    def __init__(
+        self,
+        client: redis.Redis,
+        queue_key: str,
+        consumer_id: Optional[str] = None,
+        on_dead_letter: Optional[Callable[[str], None]] = None,
+    ):
+        self.client = client
+        self.queue_key = queue_key
+        self.consumer_id = consumer_id or default_consumer_id()
+        self.on_dead_letter = on_dead_letter
+        self.processing_key = f"{queue_key}:processing:{self.consumer_id}"
+        self.leases_key = f"{queue_key}:leases"
+        self.consumers_key = f"{queue_key}:consumers"
+        self.deliveries_key = f"{queue_key}:deliveries"
+        self.dead_key = f"{queue_key}:dead"
+        self.metrics_key = f"{queue_key}:metrics"
+        self._requeue = client.register_script(_REQUEUE_SCRIPT)
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f"{self.queue_key}:heartbeat:{consumer_id}"
+
+    def _acked_key(self, job_id: str) -> str:
+        return f"{self.queue_key}:acked:{job_id}"
+
+    def register(self) -> None:
+        """Announce this consumer and hand back anything a previous run left in its list."""
+        self.client.sadd(self.consumers_key, self.consumer_id)
+        self.heartbeat()
+        leftovers = self.client.lrange(self.processing_key, 0, -1)
+        # LPUSH one by one from the tail keeps the original order at the head.
+        for raw in reversed(leftovers):
+            self.requeue(raw, self.processing_key, reason="recovered")
+        if leftovers:
+            print(f"[QUEUE] Requeued {len(leftovers)} job(s) left in {self.processing_key} by a previous run")
+
+    def heartbeat(self) -> None:
+        self.client.set(self._heartbeat_key(self.consumer_id), "1", ex=get_visibility_timeout() * 2)
+
+    def pop_batch(self, timeout: int = 5, max_items: int = 1) -> Tuple[List[str], float]:
+        """
+        Block for the first job, then move up to max_items - 1 more in one
+        pipeline. Returns (raw payloads, monotonic time the first job arrived).
+        """
+        raw = self.client.blmove(self.queue_key, self.processing_key, timeout, src="LEFT", dest="RIGHT")
+        dequeued_at = time.monotonic()
+        if raw is None:
+            return [], dequeued_at
+
+        raws = [raw]
+        if max_items > 1:
+            pipe = self.client.pipeline(transaction=False)
+            for _ in range(max_items - 1):
+                pipe.lmove(self.queue_key, self.processing_key, src="LEFT", dest="RIGHT")
+            raws.extend(r for r in pipe.execute() if r is not None)
+
+        now = time.time()
+        self.client.zadd(self.leases_key, {r: now for r in raws})
+        return raws, dequeued_at
+
+    def filter_duplicates(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Drop (and ack) jobs that were already handed off once."""
+        if not jobs:
+            return jobs
+        pipe = self.client.pipeline(transaction=False)
+        for _raw, payload in jobs:
+            pipe.exists(self._acked_key(str(payload.get("jobId"))))
+        seen = pipe.execute()
+
+        fresh = []
+        for (raw, payload), already_acked in zip(jobs, seen):
+            if already_acked:
+                print(f"[QUEUE] Duplicate delivery of jobId={payload.get('jobId')}, dropping it")
+                self.client.hincrby(self.metrics_key, "duplicates", 1)
+                self._remove(raw)
+            else:
+                fresh.append((raw, payload))
+        return fresh
+
+    def ack(self, raw: str, job_id: Optional[str] = None) -> None:
+        """The job has been handed off; forget it and remember that it was."""
+        self.ack_many([(raw, job_id)])
+
+    def ack_many(self, jobs: Iterable[Tuple[str, Optional[str]]]) -> None:
+        """ack() for several (raw, jobId) pairs in one round trip."""
+        pipe = self.client.pipeline(transaction=True)
+        acked = 0
+        for raw, job_id in jobs:
+            job_id = job_id or _job_id(raw)
+            if job_id:
+                pipe.set(self._acked_key(job_id), "1", ex=ACKED_TTL_SECONDS)
+                pipe.hdel(self.deliveries_key, job_id)
+            pipe.lrem(self.processing_key, 1, raw)
+            pipe.zrem(self.leases_key, raw)
+            acked += 1
+        if acked:
+            pipe.hincrby(self.metrics_key, "acked", acked)
+            pipe.execute()
+
+    def discard(self, raw: str) -> None:
+        """Drop an entry that can never be processed (e.g. invalid JSON)."""
+        self._remove(raw)
+        self.client.hincrby(self.metrics_key, "discarded", 1)
+
+    def _remove(self, raw: str) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.zrem(self.leases_key, raw)
+        pipe.execute()
+
+    def requeue(self, raw: str, processing_key: Optional[str] = None, reason: str = "requeued") -> bool:
+        """Put a job back on the queue; returns False if it was no longer in the processing list."""
+        # A drained job never ran, so it hasn't used up a delivery.
+        job_id = (_job_id(raw) or "") if reason != "drained" else ""
+        moved = self._requeue(
+            keys=[
+                processing_key or self.processing_key, self.queue_key, self.leases_key,
+                self.metrics_key, self.deliveries_key, self.dead_key,
+            ],
+            args=[raw, reason, job_id, get_max_deliveries()],
+        )
+        if moved == 2:
+            print(f"[QUEUE] jobId={job_id} failed {get_max_deliveries()} deliveries, moved to {self.dead_key}")
+            if self.on_dead_letter is not None:
+                self.on_dead_letter(raw)
+        return bool(moved)
+
+    def extend(self, raws: Iterable[str]) -> None:
+        """Renew leases for jobs this consumer is still working on."""
+        raws = list(raws)
+        if raws:
+            self.client.zadd(self.leases_key, {r: time.time() for r in raws}, xx=True)
+
+    def reap(self) -> int:
+        """Requeue entries whose lease expired, across every consumer's processing list."""
+        cutoff = time.time() - get_visibility_timeout()
+        requeued = 0
+        for consumer_id in self.client.smembers(self.consumers_key):
+            processing_key = f"{self.queue_key}:processing:{consumer_id}"
+            raws = self.client.lrange(processing_key, 0, -1)
+            if not raws:
+                if consumer_id != self.consumer_id and not self.client.exists(self._heartbeat_key(consumer_id)):
+                    self.client.srem(self.consumers_key, consumer_id)
+                continue
+
+            pipe = self.client.pipeline(transaction=False)
+            for raw in raws:
+                pipe.zscore(self.leases_key, raw)
+            scores = pipe.execute()
+
+            for raw, popped_at in reversed(list(zip(raws, scores))):
+                if popped_at is None:
+                    # Consumer died between the move and the lease write: start the clock now.
+                    self.client.zadd(self.leases_key, {raw: time.time()}, nx=True)
+                    continue
+                if popped_at < cutoff and self.requeue(raw, processing_key):
+                    requeued += 1
+                    print(
+                        f"[QUEUE] Requeued jobId={_job_id(raw)} from {consumer_id} "
+                        f"after {time.time() - popped_at:.0f}s without ack"
+                    )
+        return requeued
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.client.hgetall(self.metrics_key)
+        oldest = self.client.zrange(self.leases_key, 0, 0, withscores=True)
+        return {
+            "consumer_id": self.consumer_id,
+            "visibility_timeout": get_visibility_timeout(),
+            "inflight": self.client.zcard(self.leases_key),
+            "oldest_lease_age_s": round(time.time() - oldest[0][1], 1) if oldest else 0.0,
+            "acked": int(counters.get("acked", 0)),
+            "requeued": int(counters.get("requeued", 0)),
+            "recovered": int(counters.get("recovered", 0)),
+            "duplicates": int(counters.get("duplicates", 0)),
+            "drained": int(counters.get("drained", 0)),
+            "discarded": int(counters.get("discarded", 0)),
+            "dead_lettered": int(counters.get("dead_lettered", 0)),
+            "dead": self.client.llen(self.dead_key),
+        }
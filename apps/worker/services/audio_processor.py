@@ -1,6 +1,8 @@
 import os
 import shutil
-from typing import Optional, Dict, Any
+import subprocess
+import threading
+from typing import Optional, Dict, Any, BinaryIO, List, Union
 from pathlib import Path
 
 try:
@@ -95,9 +97,132 @@ def get_pydub_format(format: str) -> str:
     return format_map.get(format, "mp3")
 
 
+# Output extensions whose containers can be written to a non-seekable pipe.
+# MP4/M4A needs its moov atom written after encoding, and WAV/FLAC patch
+# their headers at the end, so those keep going through a temp file.
+STREAMABLE_EXTENSIONS = {".mp3", ".ogg", ".opus"}
+_STREAMABLE_FORMATS = {"mp3", "ogg", "opus"}
+_STREAM_CHUNK_BYTES = 256 * 1024
+
+
+def can_stream_output(output_extension: str, vbr: bool = False) -> bool:
+    """
+    Whether the encoded output can be piped straight into an upload.
+    VBR MP3 is excluded: its Xing header (accurate duration) needs a seek.
+    """
+    return output_extension.lower() in STREAMABLE_EXTENSIONS and not vbr
+
+
+def _ffmpeg_binary() -> str:
+    return getattr(AudioSegment, "converter", None) or "ffmpeg"
+
+
+def _stream_export(
+    audio: Any,
+    out_f: BinaryIO,
+    format: str,
+    codec: Optional[str] = None,
+    bitrate: Optional[str] = None,
+    parameters: Optional[List[str]] = None,
+) -> None:
+    """
+    Encode with ffmpeg reading raw PCM from stdin and writing the container
+    to stdout, copying stdout into out_f as it is produced.
+    """
+    sample_formats = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
+    command = [
+        _ffmpeg_binary(), "-hide_banner", "-loglevel", "error",
+        "-f", sample_formats[audio.sample_width],
+        "-ar", str(audio.frame_rate),
+        "-ac", str(audio.channels),
+        "-i", "pipe:0",
+    ]
+    if codec:
+        command.extend(["-acodec", codec])
+    if bitrate:
+        command.extend(["-b:a", bitrate])
+    if parameters:
+        command.extend(parameters)
+    command.extend(["-f", format, "pipe:1"])
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_output: List[bytes] = []
+
+    def _feed_stdin() -> None:
+        raw = memoryview(audio.raw_data)
+        try:
+            for offset in range(0, len(raw), _STREAM_CHUNK_BYTES):
+                process.stdin.write(raw[offset:offset + _STREAM_CHUNK_BYTES])
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def _drain_stderr() -> None:
+        stderr_output.append(process.stderr.read())
+
+    feeder = threading.Thread(target=_feed_stdin, daemon=True)
+    stderr_reader = threading.Thread(target=_drain_stderr, daemon=True)
+    feeder.start()
+    stderr_reader.start()
+
+    try:
+        while True:
+            chunk = process.stdout.read(_STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            out_f.write(chunk)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        feeder.join()
+        stderr_reader.join()
+        process.wait()
+
+    if process.returncode != 0:
+        error = b"".join(stderr_output).decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {error}")
+
+
+def export_audio(audio: Any, output: Union[str, BinaryIO], **export_params: Any) -> None:
+    """
+    Export an AudioSegment to a path or a writable stream.
+
+    Streams get the encoder output piped in as it is produced (no temp
+    output file) when the container allows it (see can_stream_output);
+    otherwise pydub encodes to its own temp file and copies the result into
+    the stream, which must then be seekable (a path or an in-memory buffer).
+
+    Raises:
+        ValueError: the output can't be streamed and is not seekable
+    """
+    parameters = export_params.get("parameters") or []
+    if (
+        isinstance(output, str)
+        or export_params.get("format") not in _STREAMABLE_FORMATS
+        or "-q:a" in parameters
+    ):
+        seekable = getattr(output, "seekable", None)
+        if not isinstance(output, str) and not (seekable and seekable()):
+            raise ValueError(
+                f"Cannot export {export_params.get('format')} audio"
+                f"{' with VBR (-q:a)' if '-q:a' in parameters else ''} to a non-seekable stream; "
+                "use a path or buffer output (check can_stream_output first)"
+            )
+        audio.export(output, **export_params)
+        return
+
+    print(f"[AUDIO_PROCESSOR] Streaming encoder output (format: {export_params.get('format')})")
+    _stream_export(audio, output, **export_params)
+
+
 def trim_audio(
     input_path: str,
-    output_path: str,
+    output_path: Union[str, BinaryIO],
     start_time: float,
     end_time: float,
     output_format: Optional[str] = None,
@@ -107,7 +232,7 @@ def trim_audio(
     
     Args:
         input_path: Path to input audio file
-        output_path: Path to save output audio file
+        output_path: Path to save output audio file, or a writable stream (see export_audio)
         start_time: Start time in seconds (float)
         end_time: End time in seconds (float)
         output_format: Output format (mp3, wav, aac, etc.). If None, uses input format
@@ -171,7 +296,7 @@ def trim_audio(
     print(f"[AUDIO_PROCESSOR] Exporting to format: {output_format}, path: {output_path}")
     
     try:
-        trimmed.export(output_path, format=output_format)
+        export_audio(trimmed, output_path, format=output_format)
     except Exception as e:
         raise ValueError(f"Error exporting audio: {e}")
     
@@ -180,7 +305,7 @@ def trim_audio(
 
 def convert_audio(
     input_path: str,
-    output_path: str,
+    output_path: Union[str, BinaryIO],
     output_format: str,
     quality: Optional[str] = None,
     bitrate: Optional[int] = None,
@@ -190,7 +315,7 @@ def convert_audio(
     
     Args:
         input_path: Path to input audio file
-        output_path: Path to save output audio file
+        output_path: Path to save output audio file, or a writable stream (see export_audio)
         output_format: Target format (mp3, wav, flac, aac, ogg, wma, alac, m4a)
         quality: Quality preset for lossy formats (low=96k, medium=192k, high=320k)
         bitrate: Custom bitrate in kbps (only used when quality is 'custom')
@@ -264,7 +389,7 @@ def convert_audio(
             # ALAC codec in m4a container (lossless, no bitrate)
             export_params["codec"] = "alac"
         
-        audio.export(output_path, **export_params)
+        export_audio(audio, output_path, **export_params)
     except Exception as e:
         raise ValueError(f"Error exporting audio: {e}")
     
@@ -273,7 +398,7 @@ def convert_audio(
 
 def compress_audio(
     input_path: str,
-    output_path: str,
+    output_path: Union[str, BinaryIO],
     bitrate: int,
     vbr: bool = False,
     sample_rate: Optional[int] = None,
@@ -284,7 +409,7 @@ def compress_audio(
     
     Args:
         input_path: Path to input audio file
-        output_path: Path to save output audio file
+        output_path: Path to save output audio file, or a writable stream (see export_audio)
         bitrate: Target bitrate in kbps (64-320)
         vbr: Use Variable Bitrate (VBR) for better quality at same file size
         sample_rate: Target sample rate in Hz (8000, 11025, 16000, 22050, 44100, 48000)
@@ -351,7 +476,7 @@ def compress_audio(
         elif output_format == "ogg":
             export_params["bitrate"] = f"{bitrate}k"
         
-        audio.export(output_path, **export_params)
+        export_audio(audio, output_path, **export_params)
     except Exception as e:
         raise ValueError(f"Error compressing audio: {e}")
     
@@ -360,7 +485,7 @@ def compress_audio(
 
 def normalize_audio(
     input_path: str,
-    output_path: str,
+    output_path: Union[str, BinaryIO],
     target_level: float = -16.0,
     output_format: Optional[str] = None,
 ) -> None:
@@ -369,7 +494,7 @@ def normalize_audio(
     
     Args:
         input_path: Path to input audio file
-        output_path: Path to save output audio file
+        output_path: Path to save output audio file, or a writable stream (see export_audio)
         target_level: Target loudness level in LUFS (default: -16.0, industry standard)
         output_format: Output format (mp3, wav, flac, aac, ogg, m4a). If None, uses input format
     """
@@ -432,7 +557,7 @@ def normalize_audio(
             ]
         }
         
-        audio.export(output_path, **export_params)
+        export_audio(audio, output_path, **export_params)
     except Exception as e:
         raise ValueError(f"Error normalizing audio: {e}")
     
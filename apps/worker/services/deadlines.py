@@ -0,0 +1,115 @@
+"""
+Job priority and deadlines.
+
+Every job gets a deadline: queuedAt + metadata.deadlineSeconds when the API
+set one, otherwise a slack derived from metadata.priority (0-10, higher is
+more urgent) that shrinks linearly from JOB_DEFAULT_DEADLINE_SECONDS at
+priority 0 to 1/11 of it at priority 10. The fair scheduler orders each
+org's jobs (and picks between orgs with turns left) by earliest deadline,
+and Celery gets a matching message priority.
+
+Finished jobs are counted as met or missed in a shared hash, so sustained
+misses show up as a capacity signal.
+
+Env:
+    JOB_DEFAULT_DEADLINE_SECONDS: slack at priority 0 (default: 600)
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+DEADLINE_STATS_KEY = "imagepivot:deadlines:v1:stats"
+MIN_PRIORITY = 0
+MAX_PRIORITY = 10
+DEFAULT_PRIORITY = 5
+
+
+def get_default_deadline_seconds() -> float:
+    try:
+        return max(1.0, float(os.getenv("JOB_DEFAULT_DEADLINE_SECONDS", "600")))
+    except ValueError:
+        return 600.0
+
+
+def get_priority(payload: Dict[str, Any]) -> int:
+    try:
+        priority = int((payload.get("metadata") or {}).get("priority", DEFAULT_PRIORITY))
+    except (TypeError, ValueError):
+        priority = DEFAULT_PRIORITY
+    return min(max(priority, MIN_PRIORITY), MAX_PRIORITY)
+
+
+def slack_for_priority(priority: int) -> float:
+    return get_default_deadline_seconds() * (MAX_PRIORITY + 1 - priority) / (MAX_PRIORITY + 1)
+
+
+def deadline_seconds(payload: Dict[str, Any]) -> float:
+    explicit = (payload.get("metadata") or {}).get("deadlineSeconds")
+    if isinstance(explicit, (int, float)) and explicit > 0:
+        return float(explicit)
+    return slack_for_priority(get_priority(payload))
+
+
+def queued_at(payload: Dict[str, Any]) -> Optional[datetime]:
+    value = (payload.get("metadata") or {}).get("queuedAt")
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def deadline_at(payload: Dict[str, Any]) -> Optional[datetime]:
+    queued = queued_at(payload)
+    if queued is None:
+        return None
+    return queued + timedelta(seconds=deadline_seconds(payload))
+
+
+def celery_priority(payload: Dict[str, Any]) -> int:
+    """Kombu's Redis transport treats 0 as the most urgent and 9 as the least."""
+    return min(9, MAX_PRIORITY - get_priority(payload))
+
+
+def record_finish(payload: Dict[str, Any]) -> None:
+    """Count the job as having met or missed its deadline."""
+    from redis_client import get_redis
+
+    deadline = deadline_at(payload)
+    if deadline is None:
+        return
+    late_ms = (datetime.now(timezone.utc) - deadline).total_seconds() * 1000
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        if late_ms > 0:
+            pipe.hincrby(DEADLINE_STATS_KEY, "missed", 1)
+            pipe.hincrby(DEADLINE_STATS_KEY, f"missed:p{get_priority(payload)}", 1)
+            pipe.hincrbyfloat(DEADLINE_STATS_KEY, "late_ms_total", round(late_ms, 1))
+            print(f"[DEADLINE] jobId={payload.get('jobId')} finished {late_ms:.0f}ms past its deadline", flush=True)
+        else:
+            pipe.hincrby(DEADLINE_STATS_KEY, "met", 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"[DEADLINE] WARNING: Could not record deadline outcome: {e}", flush=True)
+
+
+def stats() -> Dict[str, Any]:
+    """Met/missed counters shared by every worker."""
+    from redis_client import get_redis
+
+    try:
+        counters = get_redis().hgetall(DEADLINE_STATS_KEY)
+    except Exception:
+        counters = {}
+    met = int(counters.get("met", 0))
+    missed = int(counters.get("missed", 0))
+    return {
+        "met": met,
+        "missed": missed,
+        "miss_rate": (missed / (met + missed)) if met + missed else 0.0,
+        "avg_late_ms": (float(counters.get("late_ms_total", 0)) / missed) if missed else 0.0,
+        "missed_by_priority": {
+            f"p{p}": int(counters.get(f"missed:p{p}", 0)) for p in range(MIN_PRIORITY, MAX_PRIORITY + 1)
+        },
+    }
@@ -1,9 +1,20 @@
+import io
 import os
 import tempfile
-from typing import Tuple
+from typing import Any, Optional, Tuple, Union
 from pathlib import Path
 
-from r2_storage import download_file, upload_file, head_object
+from r2_storage import ObjectInfo, read_body_into
+from services import input_cache
+from services.storage import UploadStream, get_storage
+
+
+# An input/output that is either a temp file path or an in-memory buffer.
+FileSource = Union[str, io.BytesIO]
+
+# Where a processor writes its output: a temp file, a buffer, or a sink that
+# uploads to storage while the encoder is still running.
+OutputTarget = Union[str, io.BytesIO, UploadStream]
 
 
 def get_temp_dir() -> str:
@@ -13,6 +24,70 @@ def get_temp_dir() -> str:
     return temp_dir
 
 
+def get_inmemory_max_bytes() -> int:
+    """
+    Largest object kept in memory instead of spilling to TEMP_DIR.
+
+    Env: INMEMORY_MAX_BYTES (default: 5 MiB, 0 disables the in-memory path).
+    """
+    try:
+        return int(os.getenv("INMEMORY_MAX_BYTES", str(5 * 1024 * 1024)))
+    except ValueError:
+        return 5 * 1024 * 1024
+
+
+def _open_input(input_key: str) -> Tuple[Optional[input_cache.CachedInput], Optional[ObjectInfo], Any]:
+    """
+    Resolve an input through the node-local cache.
+
+    On a cache hit the ETag is confirmed with a conditional GET (304, no body)
+    and (entry, None, None) is returned. Otherwise the fresh GET is returned
+    as (None, info, body) for the caller to drain.
+    """
+    cached = input_cache.lookup(input_key)
+    if cached is not None:
+        opened = get_storage().open_if_changed(input_key, cached.etag)
+        if opened is None:
+            input_cache.record_hit(cached)
+            return cached, None, None
+    else:
+        opened = get_storage().open(input_key)
+
+    if input_cache.is_enabled():
+        input_cache.record_miss()
+    info, body = opened
+    return None, info, body
+
+
+def _store_or_save(input_key: str, info: ObjectInfo, body: Any, local_path: str) -> Tuple[Optional[input_cache.CachedInput], ObjectInfo]:
+    """
+    Drain a fresh GET into the input cache, or straight to local_path when the
+    object isn't cached. The cache is only an optimization: if writing it
+    fails (disk full, broken volume), the object is fetched again and saved
+    to local_path.
+    """
+    try:
+        entry = input_cache.store_stream(input_key, info, body)
+    except Exception as e:
+        print(f"[INPUT_CACHE] WARNING: Failed to cache {input_key}, downloading it directly: {e}")
+        try:
+            body.close()
+        except Exception:
+            pass
+        # The failed write consumed part of the body.
+        info, body = get_storage().open(input_key)
+        entry = None
+    if entry is None:
+        get_storage().save_body_to_file(input_key, info, body, local_path)
+    return entry, info
+
+
+def _download_evicted(input_key: str, local_path: str) -> ObjectInfo:
+    """Fetch the object again when its cached blob was evicted by another process after lookup."""
+    print(f"[INPUT_CACHE] Cached copy of {input_key} was evicted, downloading it again")
+    return get_storage().download_file(input_key, local_path)
+
+
 def download_input_file(input_key: str, job_id: str) -> Tuple[str, str]:
     """
     Download input file from R2 to temporary location.
@@ -24,11 +99,85 @@ def download_input_file(input_key: str, job_id: str) -> Tuple[str, str]:
     input_ext = Path(input_key).suffix or ".tmp"
     local_path = os.path.join(temp_dir, f"{job_id}_input{input_ext}")
     
-    download_file(input_key, local_path)
+    entry, info, body = _open_input(input_key)
+    if entry is None:
+        entry, info = _store_or_save(input_key, info, body, local_path)
+    if entry is None:
+        return local_path, info.content_type or "application/octet-stream"
     
-    _, mime_type = head_object(input_key)
+    if not input_cache.materialize(entry, local_path):
+        info = _download_evicted(input_key, local_path)
+        return local_path, info.content_type or "application/octet-stream"
     
-    return local_path, mime_type or "application/octet-stream"
+    return local_path, entry.content_type or "application/octet-stream"
+
+
+def download_input_source(input_key: str, job_id: str) -> Tuple[FileSource, str]:
+    """
+    Download input from R2 into memory, spilling to a temp file only when the
+    object is larger than INMEMORY_MAX_BYTES.
+
+    Returns:
+        Tuple of (BytesIO or local_path, mime_type)
+    """
+    max_in_memory = get_inmemory_max_bytes()
+    entry, info, body = _open_input(input_key)
+
+    if entry is None and info.size_bytes <= max_in_memory:
+        buffer = io.BytesIO()
+        read_body_into(body, buffer)
+        buffer.seek(0)
+        input_cache.store_bytes(input_key, info.etag, info.content_type, buffer.getvalue())
+        return buffer, info.content_type or "application/octet-stream"
+
+    input_ext = Path(input_key).suffix or ".tmp"
+    local_path = os.path.join(get_temp_dir(), f"{job_id}_input{input_ext}")
+
+    if entry is None:
+        entry, info = _store_or_save(input_key, info, body, local_path)
+    if entry is None:
+        return local_path, info.content_type or "application/octet-stream"
+
+    mime_type = entry.content_type or "application/octet-stream"
+    if entry.size_bytes <= max_in_memory:
+        buffer = input_cache.read_bytes(entry)
+        if buffer is not None:
+            return buffer, mime_type
+    elif input_cache.materialize(entry, local_path):
+        return local_path, mime_type
+    info = _download_evicted(input_key, local_path)
+    return local_path, info.content_type or "application/octet-stream"
+
+
+def new_output_target(input_source: FileSource, job_id: str, output_extension: str) -> FileSource:
+    """
+    Pick where to encode the output: a buffer when the input was small enough
+    to stay in memory, a temp file path otherwise.
+    """
+    if isinstance(input_source, io.BytesIO):
+        return io.BytesIO()
+    return os.path.join(get_temp_dir(), f"{job_id}_output{output_extension}")
+
+
+def is_streaming_upload_enabled() -> bool:
+    """Env: STREAMING_UPLOAD (default: true)."""
+    return os.getenv("STREAMING_UPLOAD", "true").lower() in ("1", "true", "yes")
+
+
+def open_output_stream(org_id: str, job_id: str, mime_type: str, output_extension: str) -> UploadStream:
+    """
+    Sink for encoders that write sequentially: parts are uploaded to storage
+    as they fill, so no output temp file is written. Finish with upload_output().
+    """
+    output_key = f"outputs/{org_id}/{job_id}/output{output_extension}"
+    return get_storage().open_upload_stream(output_key, content_type=mime_type)
+
+
+def source_size_bytes(source: FileSource) -> int:
+    """Size of a temp file or in-memory buffer."""
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer().nbytes
+    return os.path.getsize(source)
 
 
 def upload_output_file(
@@ -49,19 +198,50 @@ def upload_output_file(
     
     output_key = f"outputs/{org_id}/{job_id}/output{output_extension}"
     
-    upload_file(local_path, output_key, content_type=mime_type)
+    info = get_storage().upload_file(local_path, output_key, content_type=mime_type)
     
-    size_bytes, _ = head_object(output_key)
-    
-    return output_key, size_bytes
+    return output_key, info.size_bytes
+
 
+def upload_output(
+    output: OutputTarget,
+    org_id: str,
+    job_id: str,
+    mime_type: str,
+    output_extension: str,
+) -> Tuple[str, int]:
+    """
+    Upload a processed output held in a buffer or a temp file, or complete
+    a streaming upload.
+
+    Returns:
+        Tuple of (output_key, size_bytes)
+    """
+    if isinstance(output, UploadStream):
+        info = output.close()
+        return output.key, info.size_bytes
+
+    if not isinstance(output, io.BytesIO):
+        return upload_output_file(output, org_id, job_id, mime_type, output_extension)
+
+    output_key = f"outputs/{org_id}/{job_id}/output{output_extension}"
+    info = get_storage().upload_bytes(output.getvalue(), output_key, content_type=mime_type)
+    return output_key, info.size_bytes
 
-def cleanup_temp_files(*file_paths: str) -> None:
-    """Remove temporary files."""
+
+def cleanup_temp_files(*file_paths: Optional[OutputTarget]) -> None:
+    """
+    Remove temporary files. In-memory buffers are just closed, and streaming
+    uploads that were never completed are aborted.
+    """
     for file_path in file_paths:
         try:
-            if os.path.exists(file_path):
+            if isinstance(file_path, UploadStream):
+                if not file_path.closed:
+                    file_path.abort()
+            elif isinstance(file_path, io.BytesIO):
+                file_path.close()
+            elif file_path and os.path.exists(file_path):
                 os.remove(file_path)
         except Exception:
             pass
-
@@ -1,10 +1,14 @@
 import os
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple, Union
 from pathlib import Path
 
 from PIL import Image
 
 
+# Processors read from / write to either a file path or an in-memory buffer.
+ImageSource = Union[str, BinaryIO]
+
+
 def get_image_format_from_mime(mime_type: str) -> str:
     """Convert MIME type to PIL format string."""
     mime_to_format = {
@@ -58,8 +62,8 @@ def ensure_rgb_mode(img: Image.Image, target_format: str) -> Image.Image:
 
 
 def resize_image(
-    input_path: str,
-    output_path: str,
+    input_path: ImageSource,
+    output_path: ImageSource,
     width: Optional[int] = None,
     height: Optional[int] = None,
     maintain_aspect: bool = True,
@@ -70,8 +74,8 @@ def resize_image(
     Resize an image.
     
     Args:
-        input_path: Path to input image
-        output_path: Path to save output image
+        input_path: Path or buffer to read the input image from
+        output_path: Path or buffer to write the output image to
         width: Target width in pixels (optional)
         height: Target height in pixels (optional)
         maintain_aspect: If True, maintain aspect ratio (default: True)
@@ -81,43 +85,44 @@ def resize_image(
     if width is None and height is None:
         raise ValueError("At least one of width or height must be specified")
     
-    img = Image.open(input_path)
-    original_format = img.format or "JPEG"
-    target_format = output_format or original_format
-    
-    if maintain_aspect:
-        if width and height:
-            img.thumbnail((width, height), Image.Resampling.LANCZOS)
-        elif width:
-            ratio = width / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((width, new_height), Image.Resampling.LANCZOS)
-        elif height:
-            ratio = height / img.height
-            new_width = int(img.width * ratio)
-            img = img.resize((new_width, height), Image.Resampling.LANCZOS)
-    else:
-        if width is None:
-            width = img.width
-        if height is None:
-            height = img.height
-        img = img.resize((width, height), Image.Resampling.LANCZOS)
-    
-    img = ensure_rgb_mode(img, target_format)
-    
-    save_kwargs = {"format": target_format}
-    if target_format in ("JPEG", "WEBP"):
-        save_kwargs["quality"] = quality
-        save_kwargs["optimize"] = True
-    elif target_format == "PNG":
-        save_kwargs["optimize"] = True
-    
-    img.save(output_path, **save_kwargs)
+    # Closing the source releases its file handle and decoder state right away.
+    with Image.open(input_path) as img:
+        original_format = img.format or "JPEG"
+        target_format = output_format or original_format
+        
+        if maintain_aspect:
+            if width and height:
+                img.thumbnail((width, height), Image.Resampling.LANCZOS)
+            elif width:
+                ratio = width / img.width
+                new_height = int(img.height * ratio)
+                img = img.resize((width, new_height), Image.Resampling.LANCZOS)
+            elif height:
+                ratio = height / img.height
+                new_width = int(img.width * ratio)
+                img = img.resize((new_width, height), Image.Resampling.LANCZOS)
+        else:
+            if width is None:
+                width = img.width
+            if height is None:
+                height = img.height
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+        
+        img = ensure_rgb_mode(img, target_format)
+        
+        save_kwargs = {"format": target_format}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+            save_kwargs["optimize"] = True
+        elif target_format == "PNG":
+            save_kwargs["optimize"] = True
+        
+        img.save(output_path, **save_kwargs)
 
 
 def compress_image(
-    input_path: str,
-    output_path: str,
+    input_path: ImageSource,
+    output_path: ImageSource,
     quality: int = 85,
     output_format: Optional[str] = None,
     optimize: bool = True,
@@ -126,31 +131,31 @@ def compress_image(
     Compress an image by reducing quality and optimizing.
     
     Args:
-        input_path: Path to input image
-        output_path: Path to save output image
+        input_path: Path or buffer to read the input image from
+        output_path: Path or buffer to write the output image to
         quality: Quality for JPEG/WebP (1-100, default: 85)
         output_format: Output format (JPEG, PNG, etc.). If None, uses input format
         optimize: If True, enable optimization (default: True)
     """
-    img = Image.open(input_path)
-    original_format = img.format or "JPEG"
-    target_format = output_format or original_format
-    
-    img = ensure_rgb_mode(img, target_format)
-    
-    save_kwargs = {"format": target_format}
-    if target_format in ("JPEG", "WEBP"):
-        save_kwargs["quality"] = quality
-        save_kwargs["optimize"] = optimize
-    elif target_format == "PNG":
-        save_kwargs["optimize"] = optimize
-    
-    img.save(output_path, **save_kwargs)
+    with Image.open(input_path) as img:
+        original_format = img.format or "JPEG"
+        target_format = output_format or original_format
+        
+        img = ensure_rgb_mode(img, target_format)
+        
+        save_kwargs = {"format": target_format}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+            save_kwargs["optimize"] = optimize
+        elif target_format == "PNG":
+            save_kwargs["optimize"] = optimize
+        
+        img.save(output_path, **save_kwargs)
 
 
 def adjust_quality(
-    input_path: str,
-    output_path: str,
+    input_path: ImageSource,
+    output_path: ImageSource,
     quality: int = 95,
     output_format: Optional[str] = None,
     optimize: bool = True,
@@ -159,31 +164,31 @@ def adjust_quality(
     Adjust image quality without changing dimensions.
     
     Args:
-        input_path: Path to input image
-        output_path: Path to save output image
+        input_path: Path or buffer to read the input image from
+        output_path: Path or buffer to write the output image to
         quality: Quality for JPEG/WebP (1-100, default: 95)
         output_format: Output format (JPEG, PNG, etc.). If None, uses input format
         optimize: If True, enable optimization (default: True)
     """
-    img = Image.open(input_path)
-    original_format = img.format or "JPEG"
-    target_format = output_format or original_format
-    
-    img = ensure_rgb_mode(img, target_format)
-    
-    save_kwargs = {"format": target_format}
-    if target_format in ("JPEG", "WEBP"):
-        save_kwargs["quality"] = quality
-        save_kwargs["optimize"] = optimize
-    elif target_format == "PNG":
-        save_kwargs["optimize"] = optimize
-    
-    img.save(output_path, **save_kwargs)
+    with Image.open(input_path) as img:
+        original_format = img.format or "JPEG"
+        target_format = output_format or original_format
+        
+        img = ensure_rgb_mode(img, target_format)
+        
+        save_kwargs = {"format": target_format}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+            save_kwargs["optimize"] = optimize
+        elif target_format == "PNG":
+            save_kwargs["optimize"] = optimize
+        
+        img.save(output_path, **save_kwargs)
 
 
 def convert_image(
-    input_path: str,
-    output_path: str,
+    input_path: ImageSource,
+    output_path: ImageSource,
     output_format: str,
     quality: int = 95,
 ) -> None:
@@ -191,21 +196,21 @@ def convert_image(
     Convert an image to a different format.
     
     Args:
-        input_path: Path to input image
-        output_path: Path to save output image
+        input_path: Path or buffer to read the input image from
+        output_path: Path or buffer to write the output image to
         output_format: Target format (JPEG, PNG, WEBP, etc.)
         quality: Quality for JPEG/WebP (1-100, default: 95)
     """
-    img = Image.open(input_path)
-    target_format = output_format.upper()
-    
-    img = ensure_rgb_mode(img, target_format)
-    
-    save_kwargs = {"format": target_format}
-    if target_format in ("JPEG", "WEBP"):
-        save_kwargs["quality"] = quality
-        save_kwargs["optimize"] = True
-    elif target_format == "PNG":
-        save_kwargs["optimize"] = True
-    
-    img.save(output_path, **save_kwargs)
+    with Image.open(input_path) as img:
+        target_format = output_format.upper()
+        
+        img = ensure_rgb_mode(img, target_format)
+        
+        save_kwargs = {"format": target_format}
+        if target_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+            save_kwargs["optimize"] = True
+        elif target_format == "PNG":
+            save_kwargs["optimize"] = True
+        
+        img.save(output_path, **save_kwargs)
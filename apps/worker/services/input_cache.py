@@ -0,0 +1,331 @@
+"""
+Node-local, content-addressed cache of input objects.
+
+Shared by every process on the node (Celery prefork children, the consumer):
+
+    {INPUT_CACHE_DIR}/refs/<sha256(key)>.json        latest ETag + metadata for a key
+    {INPUT_CACHE_DIR}/blobs/<sha256(key)>-<etag-hash> object bytes
+    {INPUT_CACHE_DIR}/tmp/                           in-progress writes
+    {INPUT_CACHE_DIR}/.lock                          flock for eviction
+
+Blobs and refs are written to tmp/ and published with os.replace, so readers
+never see partial files and need no lock. Eviction is LRU by blob mtime
+(touched on every hit) and runs under an exclusive flock.
+
+Hit/miss counters are kept in a shared Redis hash (INPUT_CACHE_STATS_KEY)
+so the Celery children's counts reach /metrics.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (solo pool) - run without the cache.
+    fcntl = None
+
+
+INPUT_CACHE_STATS_KEY = "imagepivot:input-cache:v1:stats"
+STAT_FIELDS = ("hits", "misses", "stores", "evictions", "evicted_bytes", "bytes_served")
+
+
+class CachedInput(NamedTuple):
+    key: str
+    etag: str
+    content_type: Optional[str]
+    size_bytes: int
+    blob_path: str
+
+
+def get_max_bytes() -> int:
+    """Byte budget for the whole cache. Env: INPUT_CACHE_MAX_BYTES (default: 2 GiB, 0 disables)."""
+    try:
+        return int(os.getenv("INPUT_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+    except ValueError:
+        return 0
+
+
+def is_enabled() -> bool:
+    return fcntl is not None and get_max_bytes() > 0
+
+
+def get_cache_dir() -> str:
+    import tempfile
+
+    default_dir = os.path.join(os.getenv("TEMP_DIR", tempfile.gettempdir()), "imagepivot-input-cache")
+    cache_dir = os.getenv("INPUT_CACHE_DIR", default_dir)
+    for sub in ("refs", "blobs", "tmp"):
+        os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+    return cache_dir
+
+
+def _sha(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _ref_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, "refs", f"{_sha(key)}.json")
+
+
+def _blob_path(cache_dir: str, key: str, etag: str) -> str:
+    return os.path.join(cache_dir, "blobs", f"{_sha(key)}-{_sha(etag)[:16]}")
+
+
+def _drop_ref_for_blob(cache_dir: str, blob_name: str) -> None:
+    key_hash = blob_name.split("-", 1)[0]
+    ref_path = os.path.join(cache_dir, "refs", f"{key_hash}.json")
+    try:
+        with open(ref_path, "r") as f:
+            ref = json.load(f)
+    except (OSError, ValueError):
+        return
+    if os.path.basename(_blob_path(cache_dir, ref.get("key", ""), ref.get("etag", ""))) == blob_name:
+        _remove_quietly(ref_path)
+
+
+@contextmanager
+def _exclusive_lock(cache_dir: str) -> Iterator[None]:
+    with open(os.path.join(cache_dir, ".lock"), "a+") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def lookup(key: str) -> Optional[CachedInput]:
+    """
+    Return the cached entry for key, if any. The caller still has to confirm
+    the ETag with R2 (conditional GET) before trusting it.
+    """
+    if not is_enabled():
+        return None
+
+    cache_dir = get_cache_dir()
+    try:
+        with open(_ref_path(cache_dir, key), "r") as f:
+            ref = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    blob_path = _blob_path(cache_dir, key, ref["etag"])
+    if not os.path.exists(blob_path):
+        return None
+    return CachedInput(key, ref["etag"], ref.get("contentType"), int(ref.get("sizeBytes", 0)), blob_path)
+
+
+def record_hit(entry: CachedInput) -> None:
+    """Mark entry as recently used (LRU) and count the hit."""
+    try:
+        os.utime(entry.blob_path)
+    except OSError:
+        pass
+    _incr(hits=1, bytes_served=entry.size_bytes)
+
+
+def record_miss() -> None:
+    _incr(misses=1)
+
+
+def _incr(**amounts: int) -> None:
+    try:
+        from redis_client import get_redis
+
+        pipe = get_redis().pipeline(transaction=False)
+        for field, amount in amounts.items():
+            pipe.hincrby(INPUT_CACHE_STATS_KEY, field, amount)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _should_store(size_bytes: int, etag: Optional[str]) -> bool:
+    # One object may take at most a quarter of the budget so a single large
+    # upload can't flush everything else.
+    return is_enabled() and bool(etag) and size_bytes <= get_max_bytes() // 4
+
+
+def _publish(cache_dir: str, tmp_path: str, key: str, etag: str, content_type: Optional[str], size_bytes: int) -> CachedInput:
+    blob_path = _blob_path(cache_dir, key, etag)
+    os.replace(tmp_path, blob_path)
+
+    ref_tmp = os.path.join(cache_dir, "tmp", f"{uuid.uuid4().hex}.json")
+    with open(ref_tmp, "w") as f:
+        json.dump({"key": key, "etag": etag, "contentType": content_type, "sizeBytes": size_bytes}, f)
+    os.replace(ref_tmp, _ref_path(cache_dir, key))
+
+    _incr(stores=1)
+    evict()
+    return CachedInput(key, etag, content_type, size_bytes, blob_path)
+
+
+def store_stream(key: str, info: Any, body: Any) -> Optional[CachedInput]:
+    """
+    Drain an opened GET (StorageBackend.open) straight into the cache.
+    Returns None (body untouched) when the object should not be cached.
+    Raises if the write fails, with the body partly consumed.
+    """
+    if not _should_store(info.size_bytes, info.etag):
+        return None
+
+    from services.storage import get_storage
+
+    cache_dir = get_cache_dir()
+    tmp_path = os.path.join(cache_dir, "tmp", uuid.uuid4().hex)
+    try:
+        get_storage().save_body_to_file(key, info, body, tmp_path)
+        return _publish(cache_dir, tmp_path, key, info.etag, info.content_type, info.size_bytes)
+    except Exception:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def store_bytes(key: str, etag: Optional[str], content_type: Optional[str], data: bytes) -> Optional[CachedInput]:
+    """Write an already-downloaded payload into the cache (best effort)."""
+    if not _should_store(len(data), etag):
+        return None
+
+    cache_dir = get_cache_dir()
+    tmp_path = os.path.join(cache_dir, "tmp", uuid.uuid4().hex)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return _publish(cache_dir, tmp_path, key, etag, content_type, len(data))
+    except OSError as e:
+        print(f"[INPUT_CACHE] WARNING: Failed to cache {key}: {e}")
+        _remove_quietly(tmp_path)
+        return None
+
+
+def materialize(entry: CachedInput, local_path: str) -> bool:
+    """
+    Give a job its own copy of a cached blob. A hard link is free and keeps
+    the data alive even if the blob is evicted mid-job.
+
+    Returns:
+        False if another process evicted the blob since lookup()
+    """
+    try:
+        try:
+            os.link(entry.blob_path, local_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(entry.blob_path, local_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def read_into(entry: CachedInput, fileobj: BinaryIO) -> None:
+    with open(entry.blob_path, "rb") as f:
+        shutil.copyfileobj(f, fileobj)
+
+
+def read_bytes(entry: CachedInput) -> Optional[io.BytesIO]:
+    """The blob in memory; None if another process evicted it since lookup()."""
+    buffer = io.BytesIO()
+    try:
+        read_into(entry, buffer)
+    except FileNotFoundError:
+        return None
+    buffer.seek(0)
+    return buffer
+
+
+def remove(key: str, etag: str) -> None:
+    """Drop the blob for (key, etag) and its ref, if the ref still points at it."""
+    if not is_enabled():
+        return
+
+    cache_dir = get_cache_dir()
+    blob_path = _blob_path(cache_dir, key, etag)
+    with _exclusive_lock(cache_dir):
+        if _remove_quietly(blob_path):
+            _drop_ref_for_blob(cache_dir, os.path.basename(blob_path))
+
+
+def evict() -> None:
+    """Drop least recently used blobs until the cache fits its byte budget."""
+    if not is_enabled():
+        return
+
+    cache_dir = get_cache_dir()
+    budget = get_max_bytes()
+    blobs_dir = os.path.join(cache_dir, "blobs")
+
+    with _exclusive_lock(cache_dir):
+        entries = []
+        total = 0
+        for entry in os.scandir(blobs_dir):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+        if total <= budget:
+            return
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= budget:
+                break
+            if _remove_quietly(path):
+                _drop_ref_for_blob(cache_dir, os.path.basename(path))
+                total -= size
+                _incr(evictions=1, evicted_bytes=size)
+
+        # Stale temp files from crashed writers.
+        cutoff = time.time() - 3600
+        for entry in os.scandir(os.path.join(cache_dir, "tmp")):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    _remove_quietly(entry.path)
+            except OSError:
+                continue
+
+
+def _remove_quietly(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters shared by every worker, plus this node's on-disk usage."""
+    try:
+        from redis_client import get_redis
+
+        raw = get_redis().hgetall(INPUT_CACHE_STATS_KEY)
+    except Exception:
+        raw = {}
+    counters = {field: int(raw.get(field, 0)) for field in STAT_FIELDS}
+    lookups = counters["hits"] + counters["misses"]
+    result: Dict[str, Any] = {
+        "enabled": is_enabled(),
+        **counters,
+        "hit_rate": (counters["hits"] / lookups) if lookups else 0.0,
+        "max_bytes": get_max_bytes(),
+    }
+    if is_enabled():
+        blobs_dir = os.path.join(get_cache_dir(), "blobs")
+        sizes = []
+        for entry in os.scandir(blobs_dir):
+            try:
+                sizes.append(entry.stat().st_size)
+            except OSError:
+                continue
+        result["entries"] = len(sizes)
+        result["used_bytes"] = sum(sizes)
+    return result
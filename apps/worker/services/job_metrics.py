@@ -0,0 +1,67 @@
+"""
+Job execution counters shared by every worker process.
+
+run_job marks each job as running while it executes and counts how it
+finished, in every worker mode. The FastAPI app reads these back for
+/metrics (see metrics.py).
+
+Keys:
+    imagepivot:jobs-metrics:v1:running         ZSET jobId -> start time
+    imagepivot:jobs-metrics:v1:finished        HASH status -> count
+    imagepivot:jobs-metrics:v1:completed:<m>   completions in minute m (expires)
+"""
+import time
+from typing import Any, Dict
+
+from redis_client import get_redis
+
+JOB_METRICS_PREFIX = "imagepivot:jobs-metrics:v1"
+RUNNING_KEY = f"{JOB_METRICS_PREFIX}:running"
+FINISHED_KEY = f"{JOB_METRICS_PREFIX}:finished"
+# A job that crashed its process never clears its running entry; ignore
+# entries older than this.
+RUNNING_STALE_SECONDS = 3600
+RATE_WINDOW_MINUTES = 5
+
+
+def _completed_key(minute: int) -> str:
+    return f"{JOB_METRICS_PREFIX}:completed:{minute}"
+
+
+def job_started(payload: Dict[str, Any]) -> None:
+    try:
+        get_redis().zadd(RUNNING_KEY, {str(payload.get("jobId", "unknown")): time.time()})
+    except Exception as e:
+        print(f"[JOB_METRICS] WARNING: Could not record job start: {e}", flush=True)
+
+
+def job_finished(payload: Dict[str, Any], status: str) -> None:
+    minute = int(time.time() // 60)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.zrem(RUNNING_KEY, str(payload.get("jobId", "unknown")))
+        pipe.hincrby(FINISHED_KEY, status, 1)
+        if status == "COMPLETED":
+            pipe.incr(_completed_key(minute))
+            pipe.expire(_completed_key(minute), (RATE_WINDOW_MINUTES + 2) * 60)
+        pipe.execute()
+    except Exception as e:
+        print(f"[JOB_METRICS] WARNING: Could not record job finish: {e}", flush=True)
+
+
+def stats() -> Dict[str, Any]:
+    """Running jobs, finished counts by status and completions/s over the last full minutes."""
+    now = time.time()
+    minute = int(now // 60)
+    redis_client = get_redis()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zremrangebyscore(RUNNING_KEY, "-inf", now - RUNNING_STALE_SECONDS)
+    pipe.zcard(RUNNING_KEY)
+    pipe.hgetall(FINISHED_KEY)
+    pipe.mget([_completed_key(minute - i) for i in range(1, RATE_WINDOW_MINUTES + 1)])
+    _, running, finished, completed = pipe.execute()
+    return {
+        "running": running,
+        "finished": {status: int(count) for status, count in finished.items()},
+        "completed_per_second": sum(int(c or 0) for c in completed) / (RATE_WINDOW_MINUTES * 60),
+    }
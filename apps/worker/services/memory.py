@@ -0,0 +1,211 @@
+"""
+Per-job memory accounting and admission for job processes.
+
+Every job's peak RSS is measured (Linux: VmHWM from /proc/self/status,
+reset before each job via /proc/self/clear_refs) and logged next to the
+estimate made from the probed input, and the largest peak per feature is
+kept in Redis.
+
+With a budget set, a job whose estimate doesn't fit in what this process
+has left is deferred (retried a little later, most likely on another
+child) instead of pushing the process into the OOM killer mid-job. Celery
+replaces a child once its RSS after a job exceeds RECYCLE_FRACTION of the
+budget (worker_max_memory_per_child), so a bloated child is recycled
+between jobs rather than killed during one. A job too big even for a fresh
+process runs anyway.
+
+Estimates: images width x height x frames x 4 bytes (RGBA), audio
+duration x sample rate x channels x 2 bytes (pydub's 16-bit PCM), each
+times MEMORY_ESTIMATE_FACTOR for the decoded copy, intermediates and
+encode buffers.
+
+Env:
+    WORKER_MEMORY_BUDGET_MB: memory one job process may use (default: 0, no budget)
+    MEMORY_ESTIMATE_FACTOR: multiplier on the decoded size (default: 3)
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+MEMORY_PREFIX = "imagepivot:memory:v1"
+MEMORY_STATS_KEY = f"{MEMORY_PREFIX}:stats"
+PEAK_BY_FEATURE_KEY = f"{MEMORY_PREFIX}:peak"
+RECYCLE_FRACTION = 0.8
+MAX_DEFERRALS = 5
+DEFER_COUNTDOWN_SECONDS = 5
+
+_baseline_rss: Optional[int] = None
+
+
+class JobDeferred(Exception):
+    """This process can't run the job right now; retry it after countdown seconds."""
+
+    def __init__(self, message: str, countdown: float = DEFER_COUNTDOWN_SECONDS):
+        super().__init__(message)
+        self.countdown = countdown
+
+
+def get_budget_bytes() -> int:
+    try:
+        return max(0, int(os.getenv("WORKER_MEMORY_BUDGET_MB", "0"))) * 1024 * 1024
+    except ValueError:
+        return 0
+
+
+def get_recycle_kib() -> Optional[int]:
+    """Value for Celery's worker_max_memory_per_child (KiB), or None without a budget."""
+    budget = get_budget_bytes()
+    return int(budget * RECYCLE_FRACTION / 1024) if budget else None
+
+
+def get_estimate_factor() -> float:
+    try:
+        return max(1.0, float(os.getenv("MEMORY_ESTIMATE_FACTOR", "3")))
+    except ValueError:
+        return 3.0
+
+
+def _status_kib(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def rss_bytes() -> Optional[int]:
+    kib = _status_kib("VmRSS")
+    return kib * 1024 if kib is not None else None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    kib = _status_kib("VmHWM")
+    if kib is not None:
+        return kib * 1024
+    try:
+        import resource
+
+        # Linux reports KiB; this is the whole process lifetime, not per job.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def reset_peak() -> bool:
+    """Reset VmHWM to the current RSS so the next reading is this job's peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def record_baseline() -> None:
+    """Remember this process's RSS while idle (after warm-up) as its fresh-process size."""
+    global _baseline_rss
+    _baseline_rss = rss_bytes()
+
+
+def estimate_job_bytes(payload: Dict[str, Any]) -> Optional[int]:
+    """Expected peak working memory for the job, from its probe result."""
+    probe = payload.get("probe") or {}
+    media_type = str(payload.get("mediaType", "")).upper()
+    if media_type == "IMAGE" and probe.get("width") and probe.get("height"):
+        raw = probe["width"] * probe["height"] * (probe.get("frames") or 1) * 4
+    elif media_type == "AUDIO" and probe.get("durationSeconds"):
+        raw = probe["durationSeconds"] * (probe.get("sampleRate") or 44100) * (probe.get("channels") or 2) * 2
+    else:
+        return None
+    return int(raw * get_estimate_factor())
+
+
+def admit(payload: Dict[str, Any]) -> None:
+    """
+    Raise JobDeferred when the job's estimate doesn't fit in the budget left
+    in this process but would fit in a fresh one.
+    """
+    global _baseline_rss
+    budget = get_budget_bytes()
+    estimate = estimate_job_bytes(payload)
+    rss = rss_bytes()
+    if not budget or estimate is None or rss is None:
+        return
+    if _baseline_rss is None:
+        _baseline_rss = rss
+
+    if rss + estimate <= budget:
+        return
+    job_id = payload.get("jobId", "unknown")
+    mb = 1024 * 1024
+    if _baseline_rss + estimate > budget:
+        print(
+            f"[MEMORY] WARNING: jobId={job_id} needs ~{estimate // mb}MB, over the "
+            f"{budget // mb}MB budget even in a fresh process; running anyway",
+            flush=True,
+        )
+        return
+    _incr("deferred")
+    raise JobDeferred(
+        f"jobId={job_id} needs ~{estimate // mb}MB but this process is at "
+        f"{rss // mb}MB of {budget // mb}MB"
+    )
+
+
+def _incr(field: str) -> None:
+    try:
+        from redis_client import get_redis
+
+        get_redis().hincrby(MEMORY_STATS_KEY, field, 1)
+    except Exception:
+        pass
+
+
+@contextmanager
+def track(payload: Dict[str, Any]) -> Iterator[None]:
+    """Measure the job's peak RSS and log it against the estimate."""
+    reset = reset_peak()
+    rss_before = rss_bytes()
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        peak = peak_rss_bytes()
+        if peak is not None and rss_before is not None:
+            mb = 1024 * 1024
+            estimate = estimate_job_bytes(payload)
+            feature_slug = payload.get("featureSlug", "unknown")
+            print(
+                f"[MEMORY] jobId={payload.get('jobId', 'unknown')} feature={feature_slug} "
+                f"peakRssMb={peak / mb:.0f}{'' if reset else ' (process lifetime)'} "
+                f"growthMb={(peak - rss_before) / mb:.0f} rssAfterMb={(rss_bytes() or 0) / mb:.0f} "
+                f"estimateMb={(estimate / mb if estimate else 0):.0f} seconds={time.monotonic() - started:.1f}",
+                flush=True,
+            )
+            if reset:
+                try:
+                    from redis_client import get_redis
+
+                    get_redis().zadd(PEAK_BY_FEATURE_KEY, {feature_slug: peak}, gt=True)
+                except Exception:
+                    pass
+
+
+def stats() -> Dict[str, Any]:
+    """Deferrals and largest per-job peak RSS by feature, shared by every worker."""
+    from redis_client import get_redis
+
+    try:
+        counters = get_redis().hgetall(MEMORY_STATS_KEY)
+        peaks = get_redis().zrange(PEAK_BY_FEATURE_KEY, 0, -1, withscores=True)
+    except Exception:
+        counters, peaks = {}, []
+    return {
+        "budget_bytes": get_budget_bytes(),
+        "deferred": int(counters.get("deferred", 0)),
+        "peak_rss_bytes": {feature: int(peak) for feature, peak in peaks},
+    }
@@ -0,0 +1,245 @@
+"""
+Input prefetch for reserved jobs.
+
+While a worker's children are busy decoding/encoding, the jobs it has
+already reserved are known but idle. schedule() starts downloading their
+inputs into the node-local input cache in the background, so when a child
+picks the job up file_handler gets a cache hit (conditional GET, 304) and
+goes straight to processing.
+
+Bounded by a window (prefetched inputs not yet claimed) and a byte budget.
+An entry counts as claimed once a job has touched the cached blob
+(input_cache.record_hit bumps its mtime). Entries still unclaimed after
+INPUT_PREFETCH_TTL_SECONDS, e.g. because the job was revoked or redelivered
+to another node, are removed from the cache.
+
+Env:
+    INPUT_PREFETCH_WINDOW: max unclaimed prefetched inputs (default: 0, disabled)
+    INPUT_PREFETCH_MAX_BYTES: max unclaimed prefetched bytes (default: 512 MiB)
+    INPUT_PREFETCH_TTL_SECONDS: how long an unclaimed input is kept (default: 600)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from services import input_cache
+
+
+class _Prefetched(NamedTuple):
+    job_id: str
+    key: str
+    etag: str
+    size_bytes: int
+    blob_path: str
+    mtime_ns: int
+    expires_at: float
+
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_sweeper: Optional[threading.Thread] = None
+# Reservations (job_id -> size) still downloading, and finished entries by job_id.
+_inflight: Dict[str, int] = {}
+_ready: Dict[str, _Prefetched] = {}
+
+_stats: Dict[str, int] = {
+    "scheduled": 0,
+    "skipped": 0,
+    "fetched": 0,
+    "fetched_bytes": 0,
+    "already_cached": 0,
+    "claimed": 0,
+    "expired": 0,
+    "released": 0,
+    "errors": 0,
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_window() -> int:
+    return _env_int("INPUT_PREFETCH_WINDOW", 0)
+
+
+def get_max_bytes() -> int:
+    return _env_int("INPUT_PREFETCH_MAX_BYTES", 512 * 1024 * 1024)
+
+
+def get_ttl_seconds() -> int:
+    return _env_int("INPUT_PREFETCH_TTL_SECONDS", 600)
+
+
+def is_enabled() -> bool:
+    return get_window() > 0 and input_cache.is_enabled()
+
+
+def _ensure_started() -> ThreadPoolExecutor:
+    global _executor, _sweeper
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, get_window()), thread_name_prefix="prefetch")
+        _sweeper = threading.Thread(target=_sweep_loop, name="prefetch-sweeper", daemon=True)
+        _sweeper.start()
+    return _executor
+
+
+def _outstanding() -> Tuple[int, int]:
+    count = len(_inflight) + len(_ready)
+    size = sum(_inflight.values()) + sum(entry.size_bytes for entry in _ready.values())
+    return count, size
+
+
+def schedule(payload: Dict[str, Any]) -> bool:
+    """
+    Start prefetching a reserved job's input. Returns False when the job is
+    skipped (disabled, no size hint, window or byte budget full).
+    """
+    if not is_enabled():
+        return False
+
+    job_id = payload.get("jobId")
+    input_obj = payload.get("input") or {}
+    input_key = input_obj.get("key")
+    size_bytes = int(input_obj.get("sizeBytes") or 0)
+    if not job_id or not input_key or size_bytes <= 0:
+        return False
+
+    sweep()
+    with _lock:
+        count, outstanding_bytes = _outstanding()
+        if (
+            job_id in _inflight
+            or job_id in _ready
+            or count >= get_window()
+            or outstanding_bytes + size_bytes > get_max_bytes()
+        ):
+            _stats["skipped"] += 1
+            return False
+        _inflight[job_id] = size_bytes
+        _stats["scheduled"] += 1
+
+    _ensure_started().submit(_fetch, job_id, input_key)
+    return True
+
+
+def _fetch(job_id: str, input_key: str) -> None:
+    from services.storage import get_storage
+
+    started = time.time()
+    try:
+        storage = get_storage()
+        cached = input_cache.lookup(input_key)
+        opened = storage.open_if_changed(input_key, cached.etag) if cached else storage.open(input_key)
+        if opened is None:
+            # Already on this node; nothing to fetch or clean up later.
+            with _lock:
+                _stats["already_cached"] += 1
+            return
+
+        info, body = opened
+        entry = input_cache.store_stream(input_key, info, body)
+        if entry is None:
+            body.close()
+            with _lock:
+                _stats["skipped"] += 1
+            return
+
+        mtime_ns = os.stat(entry.blob_path).st_mtime_ns
+        with _lock:
+            _ready[job_id] = _Prefetched(
+                job_id, input_key, entry.etag, entry.size_bytes, entry.blob_path,
+                mtime_ns, time.time() + get_ttl_seconds(),
+            )
+            _stats["fetched"] += 1
+            _stats["fetched_bytes"] += entry.size_bytes
+        print(
+            f"[PREFETCH] Prefetched input for jobId={job_id}: {input_key} "
+            f"({entry.size_bytes} bytes in {time.time() - started:.2f}s)",
+            flush=True,
+        )
+    except Exception as e:
+        with _lock:
+            _stats["errors"] += 1
+        print(f"[PREFETCH] WARNING: Prefetch failed for jobId={job_id} ({input_key}): {e}", flush=True)
+    finally:
+        with _lock:
+            _inflight.pop(job_id, None)
+
+
+def _is_claimed(entry: _Prefetched) -> bool:
+    """A job hit the blob (mtime bumped) or it is gone; either way it's no longer ours."""
+    try:
+        return os.stat(entry.blob_path).st_mtime_ns != entry.mtime_ns
+    except OSError:
+        return True
+
+
+def release(job_id: str) -> None:
+    """Drop a prefetched input right away, e.g. when its job was revoked."""
+    with _lock:
+        entry = _ready.pop(job_id, None)
+    if entry is not None and not _is_claimed(entry):
+        input_cache.remove(entry.key, entry.etag)
+        with _lock:
+            _stats["released"] += 1
+
+
+def sweep() -> None:
+    """Forget claimed entries and remove the ones that expired unclaimed."""
+    now = time.time()
+    expired = []
+    with _lock:
+        for job_id, entry in list(_ready.items()):
+            if _is_claimed(entry):
+                del _ready[job_id]
+                _stats["claimed"] += 1
+            elif entry.expires_at <= now:
+                del _ready[job_id]
+                expired.append(entry)
+                _stats["expired"] += 1
+
+    for entry in expired:
+        print(f"[PREFETCH] Input for jobId={entry.job_id} was never claimed, removing {entry.key}", flush=True)
+        input_cache.remove(entry.key, entry.etag)
+
+
+def _sweep_loop() -> None:
+    while True:
+        time.sleep(min(30, max(1, get_ttl_seconds())))
+        try:
+            sweep()
+        except Exception as e:
+            print(f"[PREFETCH] WARNING: Sweep failed: {e}", flush=True)
+
+
+def _reset_after_fork() -> None:
+    # Prefetch runs in the Celery parent; a child forked mid-download must
+    # not inherit its lock (possibly held), executor or bookkeeping.
+    global _lock, _executor, _sweeper
+    _lock = threading.Lock()
+    _executor = None
+    _sweeper = None
+    _inflight.clear()
+    _ready.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        count, outstanding_bytes = _outstanding()
+        return {
+            "enabled": is_enabled(),
+            "window": get_window(),
+            "outstanding": count,
+            "outstanding_bytes": outstanding_bytes,
+            **_stats,
+        }
@@ -0,0 +1,225 @@
+"""
+Header-only probe of job inputs.
+
+Reads the first PROBE_BYTES of the object with a ranged GET and extracts
+format/dimensions/mode/frames (images, via Pillow's lazy open) or
+container/codec/duration/bitrate (audio, via mutagen). Inputs that are too
+large or can't be decoded are rejected before the full download.
+
+Results are cached in Redis per input key together with the ETag they were
+computed for; a conditional ranged GET (304) revalidates them.
+"""
+import hashlib
+import io
+import json
+import os
+from typing import Any, Dict, Optional
+
+PROBE_CACHE_PREFIX = "imagepivot:probe:v1"
+
+_stats: Dict[str, int] = {"probes": 0, "cache_hits": 0, "rejected": 0}
+
+# mutagen info types whose length, absent a Xing/VBRI frame (MP3), is derived
+# from the bytes it scanned, and whose bitrate is the codec's nominal one
+# (frame header / Vorbis identification header).
+_SCANNED_LENGTH_INFOS = ("MPEGInfo", "AACInfo", "OggVorbisInfo")
+
+
+class InputRejected(ValueError):
+    """Raised when a probed input is unsupported or exceeds configured limits."""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_probe_bytes() -> int:
+    """Env: PROBE_BYTES (default: 64 KiB, 0 disables probing)."""
+    return _env_int("PROBE_BYTES", 64 * 1024)
+
+
+def get_probe_retry_bytes() -> int:
+    """Larger range tried once when the header didn't fit in PROBE_BYTES (e.g. big EXIF blocks)."""
+    return _env_int("PROBE_RETRY_BYTES", 1024 * 1024)
+
+
+def get_max_image_pixels() -> int:
+    """Env: PROBE_MAX_IMAGE_PIXELS (default: 100 megapixels)."""
+    return _env_int("PROBE_MAX_IMAGE_PIXELS", 100_000_000)
+
+
+def get_max_audio_seconds() -> int:
+    """Env: PROBE_MAX_AUDIO_SECONDS (default: 4 hours)."""
+    return _env_int("PROBE_MAX_AUDIO_SECONDS", 4 * 3600)
+
+
+def is_enabled() -> bool:
+    return get_probe_bytes() > 0
+
+
+def probe_image(data: bytes) -> Dict[str, Any]:
+    """Read image header fields without decoding pixel data."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            result: Dict[str, Any] = {
+                "format": img.format,
+                "width": img.width,
+                "height": img.height,
+                "mode": img.mode,
+            }
+            try:
+                # Counting GIF/WebP frames seeks through the file and may run
+                # past the probed bytes.
+                result["frames"] = int(getattr(img, "n_frames", 1))
+            except Exception:
+                result["frames"] = None
+            return result
+    except Image.DecompressionBombError as e:
+        raise InputRejected(f"Image too large: {e}")
+    except Exception:
+        return {"format": None}
+
+
+def probe_audio(data: bytes, total_size: int) -> Dict[str, Any]:
+    """
+    Read audio header fields. Duration is exact when the container stores it
+    in the header (FLAC, WAV, MP4, MP3 with a Xing/VBRI frame). For MP3
+    without one, ADTS and Ogg Vorbis it is estimated from the nominal bitrate
+    and total object size; otherwise it is left unknown. mutagen's bitrate
+    for other containers is derived from the probed bytes and is never used.
+    """
+    try:
+        from mutagen import File as MutagenFile
+    except ImportError:
+        return {"container": None}
+
+    try:
+        audio = MutagenFile(io.BytesIO(data))
+    except Exception:
+        audio = None
+    if audio is None or getattr(audio, "info", None) is None:
+        return {"container": None}
+
+    info = audio.info
+    nominal = type(info).__name__ in _SCANNED_LENGTH_INFOS
+    bitrate = int(getattr(info, "bitrate", 0) or 0) if nominal else 0
+    duration = float(getattr(info, "length", 0) or 0)
+    # A length covering no more than about the probed bytes was scanned from them, not read from a header.
+    if bitrate and len(data) < total_size and duration * bitrate / 8 <= 2 * len(data):
+        duration = total_size * 8 / bitrate
+
+    return {
+        "container": type(audio).__name__.lower(),
+        "codec": getattr(info, "codec", None) or getattr(info, "codec_description", None),
+        "durationSeconds": round(duration, 3) if duration else None,
+        "bitrate": bitrate or None,
+        "sampleRate": getattr(info, "sample_rate", None),
+        "channels": getattr(info, "channels", None),
+    }
+
+
+def _inspect(media_type: str, data: bytes, total_size: int) -> Dict[str, Any]:
+    if media_type == "IMAGE":
+        return probe_image(data)
+    return probe_audio(data, total_size)
+
+
+def _identified(media_type: str, result: Dict[str, Any]) -> bool:
+    return bool(result.get("format") if media_type == "IMAGE" else result.get("container"))
+
+
+def _cache_key(input_key: str) -> str:
+    return f"{PROBE_CACHE_PREFIX}:{hashlib.sha256(input_key.encode('utf-8')).hexdigest()}"
+
+
+def _cached(input_key: str) -> Optional[Dict[str, Any]]:
+    from redis_client import get_redis
+
+    try:
+        raw = get_redis().get(_cache_key(input_key))
+    except Exception:
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _remember(input_key: str, result: Dict[str, Any]) -> None:
+    from redis_client import get_redis
+
+    try:
+        get_redis().set(_cache_key(input_key), json.dumps(result), ex=_env_int("PROBE_CACHE_TTL_SECONDS", 86400))
+    except Exception:
+        pass
+
+
+def probe_input(input_key: str, media_type: str) -> Dict[str, Any]:
+    """
+    Probe an input object. The result always includes sizeBytes, contentType
+    and etag; media fields are None when the header couldn't be parsed.
+    """
+    from services.storage import get_storage
+
+    cached = _cached(input_key)
+    probe_bytes = get_probe_bytes()
+
+    ranged = get_storage().get_range(input_key, 0, probe_bytes - 1, if_none_match=cached["etag"] if cached else None)
+    if ranged is None:
+        _stats["cache_hits"] += 1
+        return cached
+
+    data, info = ranged
+    _stats["probes"] += 1
+    result = _inspect(media_type, data, info.size_bytes)
+
+    retry_bytes = get_probe_retry_bytes()
+    if not _identified(media_type, result) and len(data) < info.size_bytes and retry_bytes > probe_bytes:
+        data, info = get_storage().get_range(input_key, 0, retry_bytes - 1)
+        result = _inspect(media_type, data, info.size_bytes)
+
+    result.update({
+        "mediaType": media_type,
+        "sizeBytes": info.size_bytes,
+        "contentType": info.content_type,
+        "etag": info.etag,
+        # Whether the probe saw the whole object; only then is "unidentified" conclusive.
+        "complete": len(data) >= info.size_bytes,
+    })
+    if info.etag:
+        _remember(input_key, result)
+    return result
+
+
+def check_limits(probe: Dict[str, Any]) -> None:
+    """Raise InputRejected for inputs that would fail or blow limits after a full download."""
+    media_type = probe.get("mediaType")
+
+    if not _identified(media_type, probe):
+        # A truncated header (e.g. MP4 with moov at the end) is not proof the
+        # file is bad; only reject when the probe saw every byte.
+        if probe.get("complete"):
+            _stats["rejected"] += 1
+            raise InputRejected(f"Unsupported or corrupt {str(media_type).lower()} input")
+        return
+
+    if media_type == "IMAGE":
+        width, height = probe.get("width") or 0, probe.get("height") or 0
+        if width * height > get_max_image_pixels():
+            _stats["rejected"] += 1
+            raise InputRejected(
+                f"Image dimensions {width}x{height} exceed the limit of {get_max_image_pixels()} pixels"
+            )
+    elif media_type == "AUDIO":
+        duration = probe.get("durationSeconds") or 0
+        if duration > get_max_audio_seconds():
+            _stats["rejected"] += 1
+            raise InputRejected(
+                f"Audio duration {duration:.0f}s exceeds the limit of {get_max_audio_seconds()}s"
+            )
+
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": is_enabled(), **_stats}
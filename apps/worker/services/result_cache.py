@@ -0,0 +1,183 @@
+"""
+Output dedup cache.
+
+Maps (input ETag, featureSlug, normalized params, worker version) to an
+output object that was already produced. A hit is served with a server-side
+copy into the new job's output prefix: no download, decode or encode.
+
+The index lives in Redis under RESULT_CACHE_PREFIX with a TTL, so entries
+age out on their own; stats are kept in a shared hash.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from redis_client import get_redis
+
+RESULT_CACHE_PREFIX = "imagepivot:results:v1"
+RESULT_CACHE_STATS_KEY = f"{RESULT_CACHE_PREFIX}:stats"
+
+
+def get_ttl_seconds() -> int:
+    """Env: RESULT_CACHE_TTL_SECONDS (default: 86400, 0 disables the cache)."""
+    try:
+        return int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+    except ValueError:
+        return 0
+
+
+def is_enabled() -> bool:
+    return get_ttl_seconds() > 0
+
+
+def get_worker_version() -> str:
+    """Bump WORKER_VERSION whenever processing output changes to invalidate old results."""
+    return os.getenv("WORKER_VERSION", "1")
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> str:
+    """Stable JSON for params: sorted keys, None values dropped."""
+    cleaned = {k: v for k, v in (params or {}).items() if v is not None}
+    return json.dumps(cleaned, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def cache_key(input_etag: str, feature_slug: str, params: Optional[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256(
+        "\0".join([input_etag, feature_slug, normalize_params(params), get_worker_version()]).encode("utf-8")
+    ).hexdigest()
+    return f"{RESULT_CACHE_PREFIX}:{digest}"
+
+
+def _incr(field: str) -> None:
+    try:
+        get_redis().hincrby(RESULT_CACHE_STATS_KEY, field, 1)
+    except Exception:
+        pass
+
+
+def lookup(input_etag: str, feature_slug: str, params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    try:
+        raw = get_redis().get(cache_key(input_etag, feature_slug, params))
+    except Exception as e:
+        print(f"[RESULT_CACHE] WARNING: Lookup failed: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+def store(payload: Dict[str, Any], input_etag: str, result: Dict[str, Any]) -> None:
+    """Record a completed job's output so identical jobs can reuse it."""
+    if not is_enabled() or not input_etag or not result.get("outputKey"):
+        return
+
+    entry = {
+        "key": result["outputKey"],
+        "mimeType": result.get("mimeType"),
+        "sizeBytes": result.get("sizeBytes"),
+    }
+    try:
+        get_redis().set(
+            cache_key(input_etag, payload.get("featureSlug", ""), payload.get("params")),
+            json.dumps(entry),
+            ex=get_ttl_seconds(),
+        )
+        _incr("stores")
+    except Exception as e:
+        print(f"[RESULT_CACHE] WARNING: Store failed: {e}")
+
+
+def copy_output(payload: Dict[str, Any], source_key: str, size_bytes: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Server-side copy of an existing output into this job's output prefix.
+
+    Returns:
+        Tuple of (output_key, size_bytes)
+    """
+    from services.storage import get_storage
+
+    output_ext = Path(source_key).suffix or ".tmp"
+    output_key = f"outputs/{payload.get('orgId')}/{payload.get('jobId')}/output{output_ext}"
+    info = get_storage().copy(source_key, output_key, size_bytes=size_bytes)
+    return output_key, info.size_bytes
+
+
+def complete_with_output(payload: Dict[str, Any], output_key: str, mime_type: Optional[str], size_bytes: int) -> Dict[str, Any]:
+    """Post COMPLETED for a job whose output was copied rather than produced."""
+    from api_client import post_job_status
+
+    job_id = payload.get("jobId")
+    post_job_status(
+        job_id=job_id,
+        status="COMPLETED",
+        worker_id=os.getenv("WORKER_ID"),
+        output={
+            "key": output_key,
+            "mimeType": mime_type,
+            "sizeBytes": size_bytes,
+        },
+    )
+    return {
+        "jobId": job_id,
+        "status": "COMPLETED",
+        "outputKey": output_key,
+        "mimeType": mime_type,
+        "sizeBytes": size_bytes,
+    }
+
+
+def serve(payload: Dict[str, Any], input_etag: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Try to complete a job from the cache.
+
+    Returns the task result on a hit (output copied, COMPLETED posted), or
+    None when the job has to be processed normally.
+    """
+    if not is_enabled() or not input_etag:
+        return None
+
+    job_id = payload.get("jobId")
+    feature_slug = payload.get("featureSlug", "")
+    params = payload.get("params")
+
+    cached = lookup(input_etag, feature_slug, params)
+    if cached is None:
+        _incr("misses")
+        return None
+
+    try:
+        output_key, size_bytes = copy_output(payload, cached["key"], size_bytes=cached.get("sizeBytes"))
+    except Exception as e:
+        # Source output expired or was deleted: forget it and recompute.
+        print(f"[RESULT_CACHE] Cached output unavailable ({cached['key']}): {e}")
+        try:
+            get_redis().delete(cache_key(input_etag, feature_slug, params))
+        except Exception:
+            pass
+        _incr("stale")
+        return None
+
+    _incr("hits")
+    print(f"[RESULT_CACHE] Hit for jobId={job_id}: copied {cached['key']} -> {output_key}")
+
+    result = complete_with_output(payload, output_key, cached.get("mimeType"), size_bytes)
+    result["cached"] = True
+    return result
+
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters shared by every worker."""
+    try:
+        counters = get_redis().hgetall(RESULT_CACHE_STATS_KEY)
+    except Exception:
+        counters = {}
+    hits = int(counters.get("hits", 0))
+    misses = int(counters.get("misses", 0))
+    return {
+        "enabled": is_enabled(),
+        "hits": hits,
+        "misses": misses,
+        "stores": int(counters.get("stores", 0)),
+        "stale": int(counters.get("stale", 0)),
+        "hit_rate": (hits / (hits + misses)) if hits + misses else 0.0,
+    }
@@ -0,0 +1,256 @@
+"""
+Single-flight coalescing of identical concurrent jobs.
+
+Jobs with the same input (key + ETag), featureSlug and normalized params
+share one lease in Redis. The first job to take it processes normally;
+jobs arriving while it runs become followers: once the leader is done they
+get a server-side copy of its output and post their own COMPLETED status.
+
+A follower that may be deferred (a Celery task with retries left) doesn't
+wait in its child: it raises memory.JobDeferred and is retried after
+SINGLE_FLIGHT_RETRY_SECONDS, finding the leader's result (kept for
+RESULT_TTL_SECONDS) or its lease on the next attempt. Otherwise (direct
+mode, or out of retries) it polls in place, holding its worker slot, for at
+most the job's soft time limit (services/time_limits.py), the longest the
+leader can run, or SINGLE_FLIGHT_WAIT_SECONDS if shorter.
+
+If the leader fails or disappears (lease released or expired without a
+result), a follower takes the lease and processes it itself; one that gives
+up waiting processes independently.
+
+Env:
+    SINGLE_FLIGHT: enable coalescing (default: true)
+    SINGLE_FLIGHT_LEASE_SECONDS: lease TTL, renewed while the leader runs (default: 120)
+    SINGLE_FLIGHT_WAIT_SECONDS: max time a follower waits in place (default: 600)
+    SINGLE_FLIGHT_RETRY_SECONDS: countdown before a deferred follower retries (default: 10)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from redis_client import get_redis
+from services import memory, result_cache, time_limits
+
+SINGLE_FLIGHT_PREFIX = "imagepivot:singleflight:v1"
+SINGLE_FLIGHT_STATS_KEY = f"{SINGLE_FLIGHT_PREFIX}:stats"
+STAT_FIELDS = ("leaders", "followers", "deferred", "takeovers", "timeouts")
+RESULT_TTL_SECONDS = 300
+POLL_INTERVAL_SECONDS = 0.5
+
+# Only the job holding the lease may renew or release it.
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def is_enabled() -> bool:
+    return os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+def get_lease_seconds() -> int:
+    return max(5, _env_int("SINGLE_FLIGHT_LEASE_SECONDS", 120))
+
+
+def get_wait_seconds(payload: Dict[str, Any]) -> float:
+    """How long a follower polls in place: never past the leader's soft time limit."""
+    wait = _env_int("SINGLE_FLIGHT_WAIT_SECONDS", 600)
+    soft = time_limits.soft_limit(payload)
+    return min(wait, soft) if soft else wait
+
+
+def get_retry_seconds() -> int:
+    # Deferred followers must come back while the leader's result is still kept.
+    return min(max(1, _env_int("SINGLE_FLIGHT_RETRY_SECONDS", 10)), RESULT_TTL_SECONDS // 2)
+
+
+def flight_key(payload: Dict[str, Any], input_etag: Optional[str]) -> str:
+    digest = hashlib.sha256(
+        "\0".join([
+            (payload.get("input") or {}).get("key", ""),
+            input_etag or "",
+            payload.get("featureSlug", ""),
+            result_cache.normalize_params(payload.get("params")),
+            result_cache.get_worker_version(),
+        ]).encode("utf-8")
+    ).hexdigest()
+    return f"{SINGLE_FLIGHT_PREFIX}:{digest}"
+
+
+def _incr(field: str) -> None:
+    try:
+        get_redis().hincrby(SINGLE_FLIGHT_STATS_KEY, field, 1)
+    except Exception:
+        pass
+
+
+class _LeaseRenewer:
+    """Keeps the leader's lease alive while a long job runs."""
+
+    def __init__(self, key: str, owner: str):
+        self._key = key
+        self._owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="single-flight-renew", daemon=True)
+
+    def __enter__(self) -> "_LeaseRenewer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        interval = get_lease_seconds() / 3
+        renew = get_redis().register_script(_RENEW_SCRIPT)
+        while not self._stop.wait(interval):
+            try:
+                renew(keys=[self._key], args=[self._owner, get_lease_seconds()])
+            except Exception as e:
+                print(f"[SINGLE_FLIGHT] WARNING: Lease renewal failed: {e}", flush=True)
+
+
+def _lead(key: str, job_id: str, process: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    redis_client = get_redis()
+    try:
+        with _LeaseRenewer(key, job_id):
+            result = process()
+        if result.get("outputKey"):
+            redis_client.set(
+                f"{key}:result",
+                json.dumps({
+                    "key": result["outputKey"],
+                    "mimeType": result.get("mimeType"),
+                    "sizeBytes": result.get("sizeBytes"),
+                }),
+                ex=RESULT_TTL_SECONDS,
+            )
+        return result
+    finally:
+        try:
+            redis_client.register_script(_RELEASE_SCRIPT)(keys=[key], args=[job_id])
+        except Exception as e:
+            print(f"[SINGLE_FLIGHT] WARNING: Lease release failed: {e}", flush=True)
+
+
+def _wait_for_leader(key: str, deadline: float) -> Optional[Dict[str, Any]]:
+    """The leader's output once it completes; None if it failed, vanished or we timed out."""
+    redis_client = get_redis()
+    while time.time() < deadline:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(f"{key}:result")
+        pipe.exists(key)
+        shared, leased = pipe.execute()
+        if shared:
+            return json.loads(shared)
+        if not leased:
+            return None
+        time.sleep(POLL_INTERVAL_SECONDS)
+    return None
+
+
+def _follow(payload: Dict[str, Any], shared: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Complete this job from the leader's output; None if that output is gone."""
+    job_id = payload.get("jobId", "unknown")
+    try:
+        output_key, size_bytes = result_cache.copy_output(payload, shared["key"], size_bytes=shared.get("sizeBytes"))
+    except Exception as e:
+        print(f"[SINGLE_FLIGHT] Leader output unavailable ({shared['key']}): {e}", flush=True)
+        return None
+    _incr("followers")
+    print(f"[SINGLE_FLIGHT] jobId={job_id} completed from {shared['key']} -> {output_key}", flush=True)
+    result = result_cache.complete_with_output(payload, output_key, shared.get("mimeType"), size_bytes)
+    result["coalesced"] = True
+    return result
+
+
+def run(
+    payload: Dict[str, Any],
+    input_etag: Optional[str],
+    process: Callable[[], Dict[str, Any]],
+    may_defer: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run process() for this job unless an identical job is already running,
+    in which case complete this job from its output once it is done.
+
+    Raises:
+        memory.JobDeferred: an identical job is running and may_defer is set
+    """
+    if not is_enabled():
+        return process()
+
+    job_id = str(payload.get("jobId", "unknown"))
+    key = flight_key(payload, input_etag)
+    deadline = time.time() + get_wait_seconds(payload)
+
+    while True:
+        try:
+            shared_raw = get_redis().get(f"{key}:result")
+            leader = shared_raw is None and get_redis().set(key, job_id, nx=True, ex=get_lease_seconds())
+        except Exception as e:
+            print(f"[SINGLE_FLIGHT] WARNING: Could not take lease, processing without it: {e}", flush=True)
+            return process()
+
+        if shared_raw is not None:
+            # A deferred follower coming back after the leader finished.
+            result = _follow(payload, json.loads(shared_raw))
+            if result is not None:
+                return result
+            get_redis().delete(f"{key}:result")
+            continue
+
+        if leader:
+            _incr("leaders")
+            return _lead(key, job_id, process)
+
+        if may_defer:
+            _incr("deferred")
+            raise memory.JobDeferred(
+                f"identical job {get_redis().get(key)} is in flight for jobId={job_id}",
+                countdown=get_retry_seconds(),
+            )
+
+        print(f"[SINGLE_FLIGHT] Identical job in flight, jobId={job_id} waiting for it", flush=True)
+        shared = _wait_for_leader(key, deadline)
+        if shared is not None:
+            result = _follow(payload, shared)
+            if result is not None:
+                return result
+
+        if time.time() >= deadline:
+            _incr("timeouts")
+            print(f"[SINGLE_FLIGHT] jobId={job_id} gave up waiting, processing independently", flush=True)
+            return process()
+        # Leader failed or vanished: try to take over.
+        _incr("takeovers")
+
+
+def stats() -> Dict[str, Any]:
+    try:
+        counters = get_redis().hgetall(SINGLE_FLIGHT_STATS_KEY)
+    except Exception:
+        counters = {}
+    return {
+        "enabled": is_enabled(),
+        **{field: int(counters.get(field, 0)) for field in STAT_FIELDS},
+    }
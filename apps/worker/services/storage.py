@@ -0,0 +1,404 @@
+"""
+Storage backend used by the worker.
+
+StorageBackend is the interface file handling, caching and probing go
+through. R2StorageBackend delegates to r2_storage; LocalStorageBackend keeps
+objects on the local filesystem (same keys, content types, ETags and ranged
+reads) with optional latency and bandwidth caps, so the worker can be
+benchmarked without a live bucket.
+
+Env:
+    STORAGE_BACKEND: r2 (default) or local
+    LOCAL_STORAGE_DIR: root for the local backend (default: TEMP_DIR/imagepivot-storage)
+    LOCAL_STORAGE_LATENCY_MS: added per request (default: 0)
+    LOCAL_STORAGE_BANDWIDTH_BYTES_PER_SEC: read/write cap (default: 0, unlimited)
+"""
+import abc
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Iterator, Optional, Tuple
+
+import r2_storage
+from r2_storage import ObjectInfo, read_body_into
+
+
+class UploadStream(abc.ABC):
+    """
+    Writable sink returned by StorageBackend.open_upload_stream: write(),
+    close() -> ObjectInfo, abort(), plus .key and .closed.
+    """
+
+
+UploadStream.register(r2_storage.StreamingUpload)
+
+
+class StorageBackend(abc.ABC):
+    """Object storage operations needed by the worker."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def stat(self, key: str) -> ObjectInfo:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open(self, key: str) -> Tuple[ObjectInfo, Any]:
+        """GET an object; returns (info, body). Body has iter_chunks/read/close."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open_if_changed(self, key: str, etag: str) -> Optional[Tuple[ObjectInfo, Any]]:
+        """Conditional GET: None when the object still has etag."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_range(
+        self, key: str, start: int, end: int, if_none_match: Optional[str] = None
+    ) -> Optional[Tuple[bytes, ObjectInfo]]:
+        """Bytes [start, end] plus info for the whole object; None on ETag match."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_body_to_file(self, key: str, info: ObjectInfo, body: Any, local_path: str) -> None:
+        raise NotImplementedError
+
+    def download_file(self, key: str, local_path: str) -> ObjectInfo:
+        info, body = self.open(key)
+        self.save_body_to_file(key, info, body, local_path)
+        return info
+
+    @abc.abstractmethod
+    def upload_file(self, local_path: str, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upload_bytes(self, data: bytes, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open_upload_stream(self, key: str, content_type: Optional[str] = None) -> UploadStream:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def copy(
+        self,
+        src_key: str,
+        dest_key: str,
+        content_type: Optional[str] = None,
+        size_bytes: Optional[int] = None,
+    ) -> ObjectInfo:
+        raise NotImplementedError
+
+
+class R2StorageBackend(StorageBackend):
+    name = "r2"
+
+    def stat(self, key: str) -> ObjectInfo:
+        return r2_storage.stat_object(key)
+
+    def open(self, key: str) -> Tuple[ObjectInfo, Any]:
+        return r2_storage.open_object(key)
+
+    def open_if_changed(self, key: str, etag: str) -> Optional[Tuple[ObjectInfo, Any]]:
+        return r2_storage.open_object_if_changed(key, etag)
+
+    def get_range(
+        self, key: str, start: int, end: int, if_none_match: Optional[str] = None
+    ) -> Optional[Tuple[bytes, ObjectInfo]]:
+        return r2_storage.get_object_range(key, start, end, if_none_match=if_none_match)
+
+    def save_body_to_file(self, key: str, info: ObjectInfo, body: Any, local_path: str) -> None:
+        r2_storage.save_body_to_file(key, info, body, local_path)
+
+    def upload_file(self, local_path: str, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        return r2_storage.upload_file(local_path, key, content_type=content_type)
+
+    def upload_bytes(self, data: bytes, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        return r2_storage.upload_bytes(data, key, content_type=content_type)
+
+    def open_upload_stream(self, key: str, content_type: Optional[str] = None) -> UploadStream:
+        return r2_storage.StreamingUpload(key, content_type=content_type)
+
+    def copy(
+        self,
+        src_key: str,
+        dest_key: str,
+        content_type: Optional[str] = None,
+        size_bytes: Optional[int] = None,
+    ) -> ObjectInfo:
+        return r2_storage.copy_object(src_key, dest_key, content_type=content_type, size_bytes=size_bytes)
+
+
+class _Throttle:
+    """Per-request latency and a bandwidth cap for the local backend."""
+
+    def __init__(self, latency_ms: float, bytes_per_sec: int):
+        self.latency_s = max(0.0, latency_ms) / 1000.0
+        self.bytes_per_sec = max(0, bytes_per_sec)
+
+    def request(self) -> None:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def transfer(self, num_bytes: int) -> None:
+        if self.bytes_per_sec and num_bytes:
+            time.sleep(num_bytes / self.bytes_per_sec)
+
+
+class _LocalBody:
+    """Minimal stand-in for botocore's StreamingBody."""
+
+    def __init__(self, fileobj: BinaryIO, length: int, throttle: _Throttle):
+        self._fileobj = fileobj
+        self._remaining = length
+        self._throttle = throttle
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        while self._remaining > 0:
+            chunk = self._fileobj.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            self._throttle.transfer(len(chunk))
+            yield chunk
+
+    def read(self) -> bytes:
+        return b"".join(self.iter_chunks())
+
+    def close(self) -> None:
+        self._fileobj.close()
+
+
+class _LocalUploadStream(UploadStream):
+    """Local counterpart of r2_storage.StreamingUpload."""
+
+    def __init__(self, backend: "LocalStorageBackend", key: str, content_type: Optional[str]):
+        self.key = key
+        self.content_type = content_type
+        self.size_bytes = 0
+        self.closed = False
+        self._backend = backend
+        self._tmp_path = backend._tmp_path()
+        self._file = open(self._tmp_path, "wb")
+        self._md5 = hashlib.md5()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._backend.throttle.transfer(len(data))
+        self._file.write(data)
+        self._md5.update(data)
+        self.size_bytes += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> ObjectInfo:
+        if self.closed:
+            return self._backend.stat(self.key)
+        self.closed = True
+        self._file.close()
+        self._backend.throttle.request()
+        return self._backend._publish(self._tmp_path, self.key, self.content_type, self._md5.hexdigest())
+
+    def abort(self) -> None:
+        self.closed = True
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Filesystem-backed object store. Objects live at <root>/<key>; content
+    type and ETag (MD5, like a single-part S3 PUT) live in <root>/.meta/<key>.json.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None, latency_ms: float = 0, bytes_per_sec: int = 0):
+        default_root = os.path.join(os.getenv("TEMP_DIR", tempfile.gettempdir()), "imagepivot-storage")
+        self.root = os.path.abspath(root or os.getenv("LOCAL_STORAGE_DIR", default_root))
+        self.throttle = _Throttle(latency_ms, bytes_per_sec)
+        os.makedirs(os.path.join(self.root, ".tmp"), exist_ok=True)
+        self._meta_lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.root, ".meta", f"{key}.json")
+
+    def _tmp_path(self) -> str:
+        return os.path.join(self.root, ".tmp", uuid.uuid4().hex)
+
+    def _not_found(self, key: str) -> FileNotFoundError:
+        return FileNotFoundError(f"NoSuchKey: {key}")
+
+    def _publish(self, tmp_path: str, key: str, content_type: Optional[str], etag: str) -> ObjectInfo:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self._write_meta(key, content_type, etag)
+        return ObjectInfo(os.path.getsize(path), content_type, etag)
+
+    def _write_meta(self, key: str, content_type: Optional[str], etag: str) -> None:
+        meta_path = self._meta_path(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "w") as f:
+            json.dump({"contentType": content_type, "etag": etag}, f)
+        os.replace(tmp_path, meta_path)
+
+    def stat(self, key: str) -> ObjectInfo:
+        self.throttle.request()
+        return self._info(key)
+
+    def _info(self, key: str) -> ObjectInfo:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise self._not_found(key)
+        try:
+            with open(self._meta_path(key), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            # Object dropped in by hand: derive metadata once and remember it.
+            with self._meta_lock:
+                md5 = hashlib.md5()
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        md5.update(chunk)
+                meta = {"contentType": mimetypes.guess_type(key)[0], "etag": md5.hexdigest()}
+                self._write_meta(key, meta["contentType"], meta["etag"])
+        return ObjectInfo(os.path.getsize(path), meta.get("contentType"), meta.get("etag"))
+
+    def open(self, key: str) -> Tuple[ObjectInfo, Any]:
+        self.throttle.request()
+        info = self._info(key)
+        return info, _LocalBody(open(self._path(key), "rb"), info.size_bytes, self.throttle)
+
+    def open_if_changed(self, key: str, etag: str) -> Optional[Tuple[ObjectInfo, Any]]:
+        self.throttle.request()
+        info = self._info(key)
+        if info.etag == etag:
+            return None
+        return info, _LocalBody(open(self._path(key), "rb"), info.size_bytes, self.throttle)
+
+    def get_range(
+        self, key: str, start: int, end: int, if_none_match: Optional[str] = None
+    ) -> Optional[Tuple[bytes, ObjectInfo]]:
+        self.throttle.request()
+        info = self._info(key)
+        if if_none_match and info.etag == if_none_match:
+            return None
+        length = max(0, min(end, info.size_bytes - 1) - start + 1)
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            data = f.read(length)
+        self.throttle.transfer(len(data))
+        return data, info
+
+    def save_body_to_file(self, key: str, info: ObjectInfo, body: Any, local_path: str) -> None:
+        # Like R2: nothing is left at local_path if the read fails.
+        part_path = local_path + ".part"
+        try:
+            with open(part_path, "wb") as f:
+                read_body_into(body, f)
+            os.replace(part_path, local_path)
+        except BaseException:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+
+    def upload_file(self, local_path: str, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        stream = self.open_upload_stream(key, content_type)
+        try:
+            with open(local_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    stream.write(chunk)
+        except Exception:
+            stream.abort()
+            raise
+        return stream.close()
+
+    def upload_bytes(self, data: bytes, key: str, content_type: Optional[str] = None) -> ObjectInfo:
+        stream = self.open_upload_stream(key, content_type)
+        stream.write(data)
+        return stream.close()
+
+    def open_upload_stream(self, key: str, content_type: Optional[str] = None) -> UploadStream:
+        self.throttle.request()
+        return _LocalUploadStream(self, key, content_type)
+
+    def copy(
+        self,
+        src_key: str,
+        dest_key: str,
+        content_type: Optional[str] = None,
+        size_bytes: Optional[int] = None,
+    ) -> ObjectInfo:
+        self.throttle.request()
+        src_info = self._info(src_key)
+        tmp_path = self._tmp_path()
+        shutil.copyfile(self._path(src_key), tmp_path)
+        return self._publish(tmp_path, dest_key, content_type or src_info.content_type, src_info.etag)
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend() -> StorageBackend:
+    name = os.getenv("STORAGE_BACKEND", "r2").lower()
+    if name == "local":
+        try:
+            latency_ms = float(os.getenv("LOCAL_STORAGE_LATENCY_MS", "0"))
+            bytes_per_sec = int(os.getenv("LOCAL_STORAGE_BANDWIDTH_BYTES_PER_SEC", "0"))
+        except ValueError:
+            latency_ms, bytes_per_sec = 0, 0
+        backend = LocalStorageBackend(latency_ms=latency_ms, bytes_per_sec=bytes_per_sec)
+        print(
+            f"[STORAGE] Using local storage backend: root={backend.root}, "
+            f"latencyMs={latency_ms}, bandwidth={bytes_per_sec or 'unlimited'} B/s"
+        )
+        return backend
+    if name != "r2":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {name}")
+    return R2StorageBackend()
+
+
+def get_storage() -> StorageBackend:
+    """Process-wide storage backend selected by STORAGE_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
+
+
+def _reset_after_fork() -> None:
+    # The backend may hold locks taken by a parent thread at fork time.
+    global _backend, _backend_lock
+    _backend = None
+    _backend_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
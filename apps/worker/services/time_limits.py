@@ -0,0 +1,192 @@
+"""
+Per-job soft and hard time limits.
+
+Limits scale with the input: a base per media type plus seconds per MB of
+input, or for audio with a known probed duration, seconds per second of
+audio. Per-feature multipliers cover features that do more passes.
+
+Soft limit: enforced inside the job process with SIGALRM (Celery child or
+direct-mode pool process). When it fires, every child process of the job
+process (ffmpeg/ffprobe started by pydub or by us) is killed first, then
+JobTimeout is raised into the handler, whose usual error path cleans up
+temp files and marks the job FAILED with the timeout as the reason. Once the
+job has sent its final status (COMPLETED, or FAILED from its error path) the
+limit is ignored, so it can't interrupt the handler's cleanup; a timeout
+that escapes before the handler reported is reported by enforce().
+
+Hard limit: passed to Celery as the task's time_limit; the pool kills the
+child if a job is stuck somewhere the soft limit can't interrupt (e.g.
+inside a C extension). Before that happens, JobRequest.on_timeout in
+tasks/process_job.py kills the child's subprocesses and reports the job.
+Direct mode has no hard limit.
+
+Env:
+    JOB_TIME_LIMITS: "false" disables both limits (default: true)
+    JOB_TIME_LIMIT_FACTORS: per-feature multipliers, e.g. "audio.normalize=2"
+"""
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TIMEOUT_STATS_KEY = "imagepivot:timeouts:v1"
+
+# (base seconds, seconds per input MB, seconds per second of audio)
+MEDIA_LIMITS: Dict[str, Tuple[float, float, float]] = {
+    "IMAGE": (60.0, 2.0, 0.0),
+    "AUDIO": (60.0, 10.0, 0.5),
+}
+DEFAULT_FEATURE_FACTORS = "audio.normalize=2"
+HARD_FACTOR = 1.5
+# Time between the soft and hard limit for cleanup and the status callback.
+HARD_GRACE_SECONDS = 30.0
+
+
+class JobTimeout(Exception):
+    """The job ran past its soft time limit."""
+
+
+def is_enabled() -> bool:
+    return os.getenv("JOB_TIME_LIMITS", "true").lower() in ("1", "true", "yes")
+
+
+def get_feature_factors() -> Dict[str, float]:
+    factors: Dict[str, float] = {}
+    for item in os.getenv("JOB_TIME_LIMIT_FACTORS", DEFAULT_FEATURE_FACTORS).split(","):
+        slug, _, factor = item.partition("=")
+        try:
+            factors[slug.strip()] = float(factor)
+        except ValueError:
+            continue
+    return factors
+
+
+def _scaled_limit(payload: Dict[str, Any], use_probe: bool) -> float:
+    base, per_mb, per_audio_second = MEDIA_LIMITS.get(str(payload.get("mediaType", "")).upper(), (300.0, 0.0, 0.0))
+    duration = (payload.get("probe") or {}).get("durationSeconds") if use_probe else None
+    if duration and per_audio_second:
+        limit = base + duration * per_audio_second
+    else:
+        size_mb = int((payload.get("input") or {}).get("sizeBytes") or 0) / (1024 * 1024)
+        limit = base + size_mb * per_mb
+    return limit * get_feature_factors().get(payload.get("featureSlug", ""), 1.0)
+
+
+def hard_limit(payload: Dict[str, Any]) -> Optional[float]:
+    """Hard limit in seconds; known before the probe so it can go on the Celery message."""
+    if not is_enabled():
+        return None
+    return round(_scaled_limit(payload, use_probe=False) * HARD_FACTOR + HARD_GRACE_SECONDS)
+
+
+def soft_limit(payload: Dict[str, Any]) -> Optional[float]:
+    """Soft limit in seconds, from the probed duration when there is one; always below the hard limit."""
+    if not is_enabled():
+        return None
+    return round(min(_scaled_limit(payload, use_probe=True), hard_limit(payload) - HARD_GRACE_SECONDS))
+
+
+def _child_pids(pid: int) -> List[int]:
+    """Every descendant of pid, from the parent field in /proc/<pid>/stat."""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name is in parentheses and may contain spaces.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    found: List[int] = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def kill_children(pid: Optional[int] = None) -> List[int]:
+    """SIGKILL every subprocess of pid (default: this process). Returns the pids killed."""
+    killed = []
+    for child in _child_pids(pid or os.getpid()):
+        try:
+            os.kill(child, signal.SIGKILL)
+            killed.append(child)
+        except OSError:
+            pass
+    return killed
+
+
+def record_timeout(payload: Dict[str, Any], kind: str) -> None:
+    try:
+        from redis_client import get_redis
+
+        get_redis().hincrby(TIMEOUT_STATS_KEY, f"{payload.get('featureSlug', 'unknown')}:{kind}", 1)
+    except Exception as e:
+        print(f"[TIME_LIMIT] WARNING: Could not record timeout: {e}", flush=True)
+
+
+def report_timeout(payload: Dict[str, Any], reason: str) -> None:
+    from api_client import post_job_status
+
+    try:
+        post_job_status(job_id=payload.get("jobId"), status="FAILED", error=reason, worker_id=os.getenv("WORKER_ID"))
+    except Exception as callback_err:
+        print(f"[TIME_LIMIT] ERROR: Failed to update job status: {callback_err}", flush=True)
+
+
+@contextmanager
+def enforce(payload: Dict[str, Any]) -> Iterator[None]:
+    """Raise JobTimeout in this block once the job's soft limit passes."""
+    from api_client import terminal_status_sent
+
+    limit = soft_limit(payload)
+    if not limit or threading.current_thread() is not threading.main_thread() or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    job_id = payload.get("jobId", "unknown")
+    feature_slug = payload.get("featureSlug", "unknown")
+    reason = f"Job timed out after {limit:.0f}s (time limit for {feature_slug})"
+
+    def _on_soft_limit(signum: int, frame: Any) -> None:
+        if terminal_status_sent(job_id):
+            # Already reported; the handler is only cleaning up.
+            return
+        # Kill ffmpeg before the handler's cleanup deletes the files it is using.
+        killed = kill_children()
+        print(f"[TIME_LIMIT] jobId={job_id} hit its {limit:.0f}s soft limit, killed subprocesses {killed}", flush=True)
+        raise JobTimeout(reason)
+
+    previous = signal.signal(signal.SIGALRM, _on_soft_limit)
+    signal.setitimer(signal.ITIMER_REAL, limit)
+    try:
+        yield
+    except JobTimeout:
+        record_timeout(payload, "soft")
+        # Raised before the handler's try block or inside its except block, ahead of its callback.
+        if not terminal_status_sent(job_id):
+            report_timeout(payload, reason)
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def stats() -> Dict[str, int]:
+    """Timeouts by "<featureSlug>:<soft|hard>", shared by every worker."""
+    from redis_client import get_redis
+
+    try:
+        return {field: int(count) for field, count in get_redis().hgetall(TIMEOUT_STATS_KEY).items()}
+    except Exception:
+        return {}
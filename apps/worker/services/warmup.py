@@ -0,0 +1,101 @@
+"""
+Worker process warm-up.
+
+Runs once when a job process starts (Celery's worker_process_init, or the
+direct process pool's initializer) so the first job it handles doesn't pay
+for importing the task modules, Pillow's plugin registration, pydub/mutagen
+and finding and first-loading the ffmpeg/ffprobe binaries.
+
+Which task modules get imported is up to FEATURE_PRELOAD (tasks/registry.py),
+e.g. "image" for a pool that only serves the image queue.
+
+Env:
+    WORKER_WARMUP: run the warm-up (default: true)
+"""
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict
+
+FFMPEG_CHECK_TIMEOUT_SECONDS = 2
+
+_timings: Dict[str, float] = {}
+
+
+def is_enabled() -> bool:
+    return os.getenv("WORKER_WARMUP", "true").lower() in ("1", "true", "yes")
+
+
+def _import_tasks() -> None:
+    import tasks.job_runner  # noqa: F401
+    from tasks import registry
+
+    registry.preload()
+
+
+def _init_pillow() -> None:
+    from PIL import Image
+
+    # preinit() only registers the common formats; init() loads every plugin.
+    Image.init()
+
+
+def _resolve_ffmpeg() -> None:
+    from services.audio_processor import AudioSegment
+
+    ffmpeg = shutil.which("ffmpeg")
+    ffprobe = shutil.which("ffprobe")
+    if AudioSegment is not None and ffmpeg:
+        # pydub looks the encoder up by name; an absolute path skips the PATH search.
+        AudioSegment.converter = ffmpeg
+    # Run each binary once so it and its shared libraries are paged in.
+    for binary in (ffmpeg, ffprobe):
+        if binary:
+            subprocess.run(
+                [binary, "-hide_banner", "-version"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=FFMPEG_CHECK_TIMEOUT_SECONDS,
+                check=False,
+            )
+    if not ffmpeg or not ffprobe:
+        print(f"[WARMUP] WARNING: ffmpeg={ffmpeg}, ffprobe={ffprobe}; audio jobs will fail", flush=True)
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Run every warm-up step, timing each. A failing step is logged and
+    skipped; the job that needs it will hit the same error and report it.
+
+    Returns:
+        Dict of step name -> milliseconds, plus "total"
+    """
+    if not is_enabled():
+        return {}
+
+    from tasks import registry
+
+    media_types = {slug.split(".", 1)[0] for slug in registry.preload_slugs()}
+    steps = [("imports", _import_tasks)]
+    if "image" in media_types:
+        steps.append(("pillow", _init_pillow))
+    if "audio" in media_types:
+        steps.append(("ffmpeg", _resolve_ffmpeg))
+
+    started = time.perf_counter()
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"[WARMUP] WARNING: {name} warm-up failed: {e}", flush=True)
+        _timings[name] = round((time.perf_counter() - step_started) * 1000, 1)
+    _timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+
+    print(f"[WARMUP] Process {os.getpid()} warmed up in {_timings['total']}ms: {_timings}", flush=True)
+    return dict(_timings)
+
+
+def stats() -> Dict[str, float]:
+    return dict(_timings)
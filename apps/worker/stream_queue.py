@@ -0,0 +1,306 @@
+"""
+Redis Streams transport for the job queue.
+
+An alternative to ReliableQueue for running consumers on several nodes. The
+API XADDs each job to a stream and every consumer reads it through one
+consumer group (XREADGROUP), so Redis itself tracks which consumer holds
+which job in per-consumer pending lists (XPENDING / XINFO CONSUMERS).
+
+A job is acknowledged (XACK + XDEL) once it has been handed off, exactly
+like ReliableQueue.ack. Jobs left pending longer than the visibility timeout,
+e.g. by a crashed consumer, are taken over with XAUTOCLAIM by whichever
+consumer's reaper gets there first and processed by it. A restarted consumer
+first replays its own pending entries. As with ReliableQueue, each takeover
+counts as a failed delivery and a job that reaches QUEUE_MAX_DELIVERIES is
+moved to the dead-letter list instead.
+
+Keys (for stream key S):
+    S                 the stream; each entry has one "payload" field
+    S:acked:<jobId>   set after a job was handed off
+    S:deliveries      HASH jobId -> failed deliveries so far
+    S:dead            raw payloads that hit QUEUE_MAX_DELIVERIES
+    S:metrics         HASH of counters
+
+Env:
+    QUEUE_TRANSPORT: "list" (default, ReliableQueue) or "stream"
+    QUEUE_STREAM_GROUP: consumer group name (default: workers)
+    QUEUE_VISIBILITY_TIMEOUT_SECONDS / QUEUE_CONSUMER_ID / QUEUE_MAX_DELIVERIES: as for ReliableQueue
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from reliable_queue import ACKED_TTL_SECONDS, _job_id, default_consumer_id, get_max_deliveries, get_visibility_timeout
+
+JOB_STREAM_KEY_V1 = "imagepivot:jobs:stream:v1"
+PAYLOAD_FIELD = "payload"
+CLAIM_BATCH = 100
+
+
+def get_transport() -> str:
+    return os.getenv("QUEUE_TRANSPORT", "list").lower()
+
+
+def get_group() -> str:
+    return os.getenv("QUEUE_STREAM_GROUP", "workers")
+
+
+class StreamQueue:
+    """Same interface as ReliableQueue, backed by a stream consumer group."""
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        queue_key: str = JOB_STREAM_KEY_V1,
+        consumer_id: Optional[str] = None,
+        on_dead_letter: Optional[Callable[[str], None]] = None,
+    ):
+        self.client = client
+        self.queue_key = queue_key
+        self.group = get_group()
+        self.consumer_id = consumer_id or default_consumer_id()
+        self.on_dead_letter = on_dead_letter
+        self.deliveries_key = f"{queue_key}:deliveries"
+        self.dead_key = f"{queue_key}:dead"
+        self.metrics_key = f"{queue_key}:metrics"
+        # raw payload -> stream entry ids this consumer holds for it
+        self._ids: Dict[str, Deque[str]] = {}
+        self._ids_lock = threading.Lock()
+        # Entries claimed by the reaper or replayed at startup, handed out by pop_batch.
+        self._claimed: Deque[Tuple[str, str]] = deque()
+
+    def _acked_key(self, job_id: str) -> str:
+        return f"{self.queue_key}:acked:{job_id}"
+
+    def _hold(self, entry_id: str, raw: str) -> None:
+        with self._ids_lock:
+            self._ids.setdefault(raw, deque()).append(entry_id)
+
+    def _release(self, raw: str) -> Optional[str]:
+        with self._ids_lock:
+            ids = self._ids.get(raw)
+            if not ids:
+                return None
+            entry_id = ids.popleft()
+            if not ids:
+                del self._ids[raw]
+            return entry_id
+
+    def _entries(self, entries: Iterable[Any]) -> List[Tuple[str, str]]:
+        """(id, raw) pairs; entries deleted from the stream are acked away."""
+        live = []
+        for entry_id, fields in entries:
+            raw = (fields or {}).get(PAYLOAD_FIELD)
+            if raw is None:
+                self.client.xack(self.queue_key, self.group, entry_id)
+                continue
+            live.append((entry_id, raw))
+        return live
+
+    def register(self) -> None:
+        """Create the group if needed and queue up this consumer's own pending entries."""
+        try:
+            self.client.xgroup_create(self.queue_key, self.group, id="0", mkstream=True)
+            print(f"[QUEUE] Created consumer group {self.group} on {self.queue_key}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        # Reading from id 0 returns what this consumer already had and never acked.
+        pending: List[Tuple[str, str]] = []
+        last_id = "0"
+        while True:
+            response = self.client.xreadgroup(self.group, self.consumer_id, {self.queue_key: last_id}, count=CLAIM_BATCH)
+            entries = response[0][1] if response else []
+            if not entries:
+                break
+            last_id = entries[-1][0]
+            pending.extend(self._entries(entries))
+        self._claimed.extend(pending)
+        if pending:
+            self.client.hincrby(self.metrics_key, "recovered", len(pending))
+            print(f"[QUEUE] Replaying {len(pending)} job(s) left pending for {self.consumer_id} by a previous run")
+
+    def heartbeat(self) -> None:
+        # Streams track each consumer's idle time themselves.
+        pass
+
+    def pop_batch(self, timeout: int = 5, max_items: int = 1) -> Tuple[List[str], float]:
+        """Claimed/replayed entries first, then new ones via a blocking XREADGROUP."""
+        entries: List[Tuple[str, str]] = []
+        while self._claimed and len(entries) < max_items:
+            entries.append(self._claimed.popleft())
+
+        if not entries:
+            response = self.client.xreadgroup(
+                self.group, self.consumer_id, {self.queue_key: ">"}, count=max_items, block=timeout * 1000,
+            )
+            if response:
+                entries = self._entries(response[0][1])
+
+        for entry_id, raw in entries:
+            self._hold(entry_id, raw)
+        return [raw for _entry_id, raw in entries], time.monotonic()
+
+    def filter_duplicates(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Drop (and ack) jobs that were already handed off once."""
+        if not jobs:
+            return jobs
+        pipe = self.client.pipeline(transaction=False)
+        for _raw, payload in jobs:
+            pipe.exists(self._acked_key(str(payload.get("jobId"))))
+        seen = pipe.execute()
+
+        fresh = []
+        for (raw, payload), already_acked in zip(jobs, seen):
+            if already_acked:
+                print(f"[QUEUE] Duplicate delivery of jobId={payload.get('jobId')}, dropping it")
+                self.client.hincrby(self.metrics_key, "duplicates", 1)
+                self._remove(raw)
+            else:
+                fresh.append((raw, payload))
+        return fresh
+
+    def ack(self, raw: str, job_id: Optional[str] = None) -> None:
+        """The job has been handed off; forget it and remember that it was."""
+        self.ack_many([(raw, job_id)])
+
+    def ack_many(self, jobs: Iterable[Tuple[str, Optional[str]]]) -> None:
+        """ack() for several (raw, jobId) pairs in one round trip."""
+        pipe = self.client.pipeline(transaction=True)
+        acked = 0
+        for raw, job_id in jobs:
+            job_id = job_id or _job_id(raw)
+            entry_id = self._release(raw)
+            if job_id:
+                pipe.set(self._acked_key(job_id), "1", ex=ACKED_TTL_SECONDS)
+                pipe.hdel(self.deliveries_key, job_id)
+            if entry_id:
+                pipe.xack(self.queue_key, self.group, entry_id)
+                pipe.xdel(self.queue_key, entry_id)
+            acked += 1
+        if acked:
+            pipe.hincrby(self.metrics_key, "acked", acked)
+            pipe.execute()
+
+    def discard(self, raw: str) -> None:
+        """Drop an entry that can never be processed (e.g. invalid JSON)."""
+        self._remove(raw)
+        self.client.hincrby(self.metrics_key, "discarded", 1)
+
+    def _remove(self, raw: str) -> None:
+        entry_id = self._release(raw)
+        if entry_id:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.xack(self.queue_key, self.group, entry_id)
+            pipe.xdel(self.queue_key, entry_id)
+            pipe.execute()
+
+    def requeue(self, raw: str, processing_key: Optional[str] = None, reason: str = "requeued") -> bool:
+        """
+        Give a job back to the group straight away (re-added at the tail)
+        instead of waiting for its entry to time out.
+        """
+        entry_id = self._release(raw)
+        if entry_id is None:
+            return False
+        pipe = self.client.pipeline(transaction=True)
+        pipe.xadd(self.queue_key, {PAYLOAD_FIELD: raw})
+        pipe.xack(self.queue_key, self.group, entry_id)
+        pipe.xdel(self.queue_key, entry_id)
+        pipe.hincrby(self.metrics_key, reason, 1)
+        pipe.execute()
+        return True
+
+    def extend(self, raws: Iterable[str]) -> None:
+        """Reset the idle time of entries this consumer is still working on."""
+        with self._ids_lock:
+            entry_ids = [entry_id for raw in raws for entry_id in self._ids.get(raw, ())]
+        if entry_ids:
+            self.client.xclaim(self.queue_key, self.group, self.consumer_id, 0, entry_ids, justid=True)
+
+    def reap(self) -> int:
+        """
+        Take over entries idle past the visibility timeout, from any consumer,
+        and forget consumers that have gone quiet with nothing pending.
+        """
+        min_idle_ms = get_visibility_timeout() * 1000
+        with self._ids_lock:
+            # Entries already ours (e.g. waiting in _claimed for a free slot) are left alone.
+            known = {entry_id for ids in self._ids.values() for entry_id in ids}
+        known.update(entry_id for entry_id, _raw in list(self._claimed))
+        claimed = 0
+        cursor = "0-0"
+        while True:
+            response = self.client.xautoclaim(
+                self.queue_key, self.group, self.consumer_id, min_idle_ms, start_id=cursor, count=CLAIM_BATCH,
+            )
+            cursor, entries = response[0], response[1]
+            for entry_id, raw in self._entries(entries):
+                if entry_id in known:
+                    continue
+                if self._dead_letter_if_exhausted(entry_id, raw):
+                    continue
+                self._claimed.append((entry_id, raw))
+                claimed += 1
+                print(f"[QUEUE] Claimed jobId={_job_id(raw)} (entry {entry_id}) after {min_idle_ms // 1000}s without ack")
+            if cursor == "0-0":
+                break
+        if claimed:
+            self.client.hincrby(self.metrics_key, "requeued", claimed)
+
+        for consumer in self.client.xinfo_consumers(self.queue_key, self.group):
+            if (
+                consumer["name"] != self.consumer_id
+                and consumer["pending"] == 0
+                and consumer["idle"] > min_idle_ms * 2
+            ):
+                self.client.xgroup_delconsumer(self.queue_key, self.group, consumer["name"])
+        return claimed
+
+    def _dead_letter_if_exhausted(self, entry_id: str, raw: str) -> bool:
+        """Count a lost delivery; at the limit, move the entry to the dead-letter list."""
+        job_id = _job_id(raw)
+        if not job_id or self.client.hincrby(self.deliveries_key, job_id, 1) < get_max_deliveries():
+            return False
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hdel(self.deliveries_key, job_id)
+        pipe.rpush(self.dead_key, raw)
+        pipe.xack(self.queue_key, self.group, entry_id)
+        pipe.xdel(self.queue_key, entry_id)
+        pipe.hincrby(self.metrics_key, "dead_lettered", 1)
+        pipe.execute()
+        print(f"[QUEUE] jobId={job_id} failed {get_max_deliveries()} deliveries, moved to {self.dead_key}")
+        if self.on_dead_letter is not None:
+            self.on_dead_letter(raw)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.client.hgetall(self.metrics_key)
+        group = next((g for g in self.client.xinfo_groups(self.queue_key) if g["name"] == self.group), {})
+        consumers = {
+            c["name"]: {"pending": c["pending"], "idle_ms": c["idle"]}
+            for c in self.client.xinfo_consumers(self.queue_key, self.group)
+        }
+        return {
+            "transport": "stream",
+            "consumer_id": self.consumer_id,
+            "group": self.group,
+            "visibility_timeout": get_visibility_timeout(),
+            "length": self.client.xlen(self.queue_key),
+            "inflight": group.get("pending", 0),
+            "lag": group.get("lag"),
+            "consumers": consumers,
+            "acked": int(counters.get("acked", 0)),
+            "requeued": int(counters.get("requeued", 0)),
+            "recovered": int(counters.get("recovered", 0)),
+            "duplicates": int(counters.get("duplicates", 0)),
+            "drained": int(counters.get("drained", 0)),
+            "discarded": int(counters.get("discarded", 0)),
+            "dead_lettered": int(counters.get("dead_lettered", 0)),
+            "dead": self.client.llen(self.dead_key),
+        }
@@ -19,7 +19,7 @@ from services.audio_processor import (
     get_extension_from_format,
     get_audio_format_from_mime,
 )
-from r2_storage import download_file, head_object
+from services.storage import get_storage
 
 print("[METADATA-MODULE] All imports completed successfully", flush=True)
 sys.stdout.flush()
@@ -140,7 +140,7 @@ def metadata_audio_task(payload: Dict[str, Any]) -> Dict[str, Any]:
             temp_cover_art_path = os.path.join(temp_dir, f"{job_id}_cover{cover_ext}")
             
             try:
-                download_file(cover_art_key, temp_cover_art_path)
+                get_storage().download_file(cover_art_key, temp_cover_art_path)
                 if os.path.exists(temp_cover_art_path):
                     cover_size = os.path.getsize(temp_cover_art_path)
                     print(f"[METADATA]   - Cover art downloaded: {temp_cover_art_path}, size: {cover_size} bytes", flush=True)
@@ -199,6 +199,8 @@ def metadata_audio_task(payload: Dict[str, Any]) -> Dict[str, Any]:
             "jobId": job_id,
             "status": "COMPLETED",
             "outputKey": output_key,
+            "mimeType": output_mime,
+            "sizeBytes": output_size_bytes,
         }
     except Exception as e:
         print(f"[METADATA] ERROR: Job {job_id} failed: {e}", flush=True)
@@ -9,14 +9,17 @@ sys.stderr.flush()
 from api_client import post_job_status
 from services.file_handler import (
     download_input_file,
-    upload_output_file,
+    upload_output,
     cleanup_temp_files,
     get_temp_dir,
+    is_streaming_upload_enabled,
+    open_output_stream,
 )
 from services.audio_processor import (
     trim_audio,
     get_audio_format_from_mime,
     get_extension_from_format,
+    can_stream_output,
 )
 
 print("[TRIM-MODULE] All imports completed successfully", flush=True)
@@ -114,8 +117,11 @@ def trim_audio_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         output_ext = get_extension_from_format(output_format)
         output_mime = f"audio/{output_format}"
         
-        temp_dir = get_temp_dir()
-        temp_output_path = os.path.join(temp_dir, f"{job_id}_output{output_ext}")
+        if is_streaming_upload_enabled() and can_stream_output(output_ext):
+            temp_output_path = open_output_stream(org_id, job_id, output_mime, output_ext)
+        else:
+            temp_dir = get_temp_dir()
+            temp_output_path = os.path.join(temp_dir, f"{job_id}_output{output_ext}")
         
         print(f"[TRIM] Step 4: Trimming audio", flush=True)
         print(f"[TRIM]   - Input: {temp_input_path}", flush=True)
@@ -132,8 +138,8 @@ def trim_audio_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         )
         
         print(f"[TRIM] Step 5: Audio trimmed successfully, uploading to R2...", flush=True)
-        output_key, output_size_bytes = upload_output_file(
-            local_path=temp_output_path,
+        output_key, output_size_bytes = upload_output(
+            output=temp_output_path,
             org_id=org_id,
             job_id=job_id,
             mime_type=output_mime,
@@ -160,6 +166,8 @@ def trim_audio_task(payload: Dict[str, Any]) -> Dict[str, Any]:
             "jobId": job_id,
             "status": "COMPLETED",
             "outputKey": output_key,
+            "mimeType": output_mime,
+            "sizeBytes": output_size_bytes,
         }
     except Exception as e:
         print(f"[TRIM] ========== ERROR ==========", flush=True)
@@ -9,10 +9,11 @@ sys.stderr.flush()
 
 from api_client import post_job_status
 from services.file_handler import (
-    download_input_file,
-    upload_output_file,
+    download_input_source,
+    new_output_target,
+    upload_output,
     cleanup_temp_files,
-    get_temp_dir,
+    source_size_bytes,
 )
 from services.image_processor import (
     convert_image,
@@ -76,15 +77,15 @@ def convert_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         print(f"[CONVERT] Step 1: Status updated successfully", flush=True)
         
         print(f"[CONVERT] Step 2: Downloading input file from key: {input_key}", flush=True)
-        temp_input_path, detected_mime = download_input_file(input_key, job_id)
+        temp_input_path, detected_mime = download_input_source(input_key, job_id)
         mime_type = input_mime or detected_mime
         print(f"[CONVERT] Step 2: Download complete", flush=True)
         print(f"[CONVERT]   - Local path: {temp_input_path}", flush=True)
         print(f"[CONVERT]   - Detected MIME: {detected_mime}", flush=True)
         print(f"[CONVERT]   - Using MIME: {mime_type}", flush=True)
-        print(f"[CONVERT]   - File exists: {os.path.exists(temp_input_path) if temp_input_path else False}", flush=True)
-        if temp_input_path and os.path.exists(temp_input_path):
-            file_size = os.path.getsize(temp_input_path)
+        print(f"[CONVERT]   - In memory: {not isinstance(temp_input_path, str)}", flush=True)
+        if temp_input_path is not None:
+            file_size = source_size_bytes(temp_input_path)
             print(f"[CONVERT]   - File size: {file_size} bytes", flush=True)
         
         print(f"[CONVERT] Step 3: Parsing parameters", flush=True)
@@ -131,8 +132,7 @@ def convert_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         print(f"[CONVERT]   - Output extension: {output_ext}", flush=True)
         print(f"[CONVERT]   - Output MIME: {output_mime}", flush=True)
         
-        temp_dir = get_temp_dir()
-        temp_output_path = os.path.join(temp_dir, f"{job_id}_output{output_ext}")
+        temp_output_path = new_output_target(temp_input_path, job_id, output_ext)
         print(f"[CONVERT]   - Output path: {temp_output_path}", flush=True)
         
         print(f"[CONVERT] Step 4: Starting image conversion", flush=True)
@@ -149,14 +149,12 @@ def convert_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         )
         
         print(f"[CONVERT] Step 4: Conversion complete", flush=True)
-        print(f"[CONVERT]   - Output file exists: {os.path.exists(temp_output_path)}", flush=True)
-        if os.path.exists(temp_output_path):
-            output_file_size = os.path.getsize(temp_output_path)
-            print(f"[CONVERT]   - Output file size: {output_file_size} bytes", flush=True)
+        output_file_size = source_size_bytes(temp_output_path)
+        print(f"[CONVERT]   - Output file size: {output_file_size} bytes", flush=True)
         
         print(f"[CONVERT] Step 5: Uploading to R2", flush=True)
-        output_key, output_size_bytes = upload_output_file(
-            local_path=temp_output_path,
+        output_key, output_size_bytes = upload_output(
+            output=temp_output_path,
             org_id=org_id,
             job_id=job_id,
             mime_type=output_mime,
@@ -186,6 +184,8 @@ def convert_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
             "jobId": job_id,
             "status": "COMPLETED",
             "outputKey": output_key,
+            "mimeType": output_mime,
+            "sizeBytes": output_size_bytes,
         }
     except Exception as e:
         print(f"[CONVERT] ========== ERROR OCCURRED ==========", flush=True)
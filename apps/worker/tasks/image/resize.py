@@ -3,10 +3,10 @@ from typing import Any, Dict
 
 from api_client import post_job_status
 from services.file_handler import (
-    download_input_file,
-    upload_output_file,
+    download_input_source,
+    new_output_target,
+    upload_output,
     cleanup_temp_files,
-    get_temp_dir,
 )
 from services.image_processor import (
     resize_image,
@@ -50,7 +50,7 @@ def resize_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         post_job_status(job_id=job_id, status="PROCESSING", worker_id=worker_id)
         
         print(f"[RESIZE] Downloading input file: key={input_key}")
-        temp_input_path, detected_mime = download_input_file(input_key, job_id)
+        temp_input_path, detected_mime = download_input_source(input_key, job_id)
         mime_type = input_mime or detected_mime
         print(f"[RESIZE] Downloaded to: {temp_input_path}, detected mimeType={detected_mime}")
         
@@ -76,8 +76,7 @@ def resize_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         output_ext = get_extension_from_format(output_format)
         output_mime = f"image/{output_format.lower()}"
         
-        temp_dir = get_temp_dir()
-        temp_output_path = os.path.join(temp_dir, f"{job_id}_output{output_ext}")
+        temp_output_path = new_output_target(temp_input_path, job_id, output_ext)
         
         print(f"[RESIZE] Resizing image: {temp_input_path} -> {temp_output_path}")
         print(f"[RESIZE] Dimensions: width={width}, height={height}, maintainAspect={maintain_aspect}")
@@ -94,8 +93,8 @@ def resize_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
         )
         
         print(f"[RESIZE] Image resized successfully, uploading to R2...")
-        output_key, output_size_bytes = upload_output_file(
-            local_path=temp_output_path,
+        output_key, output_size_bytes = upload_output(
+            output=temp_output_path,
             org_id=org_id,
             job_id=job_id,
             mime_type=output_mime,
@@ -122,6 +121,8 @@ def resize_image_task(payload: Dict[str, Any]) -> Dict[str, Any]:
             "jobId": job_id,
             "status": "COMPLETED",
             "outputKey": output_key,
+            "mimeType": output_mime,
+            "sizeBytes": output_size_bytes,
         }
     except Exception as e:
         print(f"[RESIZE] ERROR: Job {job_id} failed: {e}")
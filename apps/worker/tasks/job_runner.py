@@ -0,0 +1,161 @@
+"""
+Job execution shared by every worker mode: the Celery task in
+tasks/process_job.py and the direct process pool in direct_executor.py.
+Nothing here imports Celery.
+"""
+from typing import Any, Callable, Dict, Optional
+
+
+def _resolve_input_etag(payload: Dict[str, Any]) -> Optional[str]:
+    """ETag of the job's input object, used to key the result cache."""
+    from services.storage import get_storage
+
+    input_key = payload.get("input", {}).get("key")
+    if not input_key:
+        return None
+    try:
+        return get_storage().stat(input_key).etag
+    except Exception as e:
+        print(f"[JOB] WARNING: Could not resolve input ETag for {input_key}: {e}", flush=True)
+        return None
+
+
+def _probe_input(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Header-only probe before the full download. Rejected inputs are marked
+    FAILED here; probe errors other than rejection never fail the job.
+    """
+    import os
+    from api_client import post_job_status
+    from services import probe
+
+    job_id = payload.get("jobId", "unknown")
+    input_key = payload.get("input", {}).get("key")
+    if not probe.is_enabled() or not input_key:
+        return None
+
+    try:
+        result = probe.probe_input(input_key, payload.get("mediaType", "").upper())
+        probe.check_limits(result)
+    except probe.InputRejected as e:
+        print(f"[JOB] Input rejected by probe: jobId={job_id}, reason={e}", flush=True)
+        try:
+            post_job_status(job_id=job_id, status="FAILED", error=str(e), worker_id=os.getenv("WORKER_ID"))
+        except Exception as callback_err:
+            print(f"[JOB] ERROR: Failed to update job status: {callback_err}", flush=True)
+        raise
+    except Exception as e:
+        print(f"[JOB] WARNING: Probe failed for {input_key}, continuing without it: {e}", flush=True)
+        return None
+
+    print(f"[JOB] Probe: {result}", flush=True)
+    payload["probe"] = result
+    return result
+
+
+def _limited(handler: Callable[[Dict[str, Any]], Dict[str, Any]], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the feature handler under the job's soft time limit."""
+    from services import time_limits
+
+    with time_limits.enforce(payload):
+        return handler(payload)
+
+
+def run_job(payload: Dict[str, Any], may_defer: bool = False) -> Dict[str, Any]:
+    """
+    Main job dispatcher that routes jobs to appropriate handlers based on mediaType.
+
+    Args:
+        payload: Job payload from the queue
+        may_defer: Raise memory.JobDeferred instead of running now when the
+            job doesn't fit this process's memory budget (services/memory.py)
+            or an identical job is already running (services/single_flight.py)
+    """
+    import sys
+    import os
+    
+    # Force stdout/stderr to be unbuffered so logs appear immediately
+    sys.stdout.flush()
+    sys.stderr.flush()
+    
+    job_id = payload.get("jobId", "unknown")
+    media_type = payload.get("mediaType", "").upper()
+    feature_slug = payload.get("featureSlug", "unknown")
+    params = payload.get("params", {})
+    
+    print(f"[JOB] ========== PROCESSING JOB ==========", flush=True)
+    print(f"[JOB] Job ID: {job_id}", flush=True)
+    print(f"[JOB] Media Type: {media_type}", flush=True)
+    print(f"[JOB] Feature Slug: {feature_slug}", flush=True)
+    print(f"[JOB] Params: {params}", flush=True)
+    print(f"[JOB] Full payload keys: {list(payload.keys())}", flush=True)
+    print(f"[JOB] ====================================", flush=True)
+    
+    from services import job_metrics, memory
+
+    job_metrics.job_started(payload)
+    job_status = "COMPLETED"
+    try:
+        from services import result_cache, single_flight
+
+        probe_result = _probe_input(payload) if media_type in ("IMAGE", "AUDIO") else None
+        input_etag = probe_result.get("etag") if probe_result else None
+
+        if result_cache.is_enabled() and media_type in ("IMAGE", "AUDIO"):
+            if input_etag is None:
+                input_etag = _resolve_input_etag(payload)
+            cached = result_cache.serve(payload, input_etag)
+            if cached is not None:
+                print(f"[JOB] Job {job_id} served from result cache", flush=True)
+                return cached
+
+        if may_defer:
+            memory.admit(payload)
+
+        if media_type == "IMAGE":
+            print(f"[JOB] Routing to image feature handler: {feature_slug}", flush=True)
+            from tasks.image import route_image_feature
+            with memory.track(payload):
+                result = single_flight.run(payload, input_etag, lambda: _limited(route_image_feature, payload), may_defer=may_defer)
+            print(f"[JOB] Job {job_id} completed successfully", flush=True)
+            result_cache.store(payload, input_etag, result)
+            return result
+        elif media_type == "AUDIO":
+            print(f"[JOB] Routing to audio feature handler: {feature_slug}", flush=True)
+            from tasks.audio import route_audio_feature
+            with memory.track(payload):
+                result = single_flight.run(payload, input_etag, lambda: _limited(route_audio_feature, payload), may_defer=may_defer)
+            print(f"[JOB] Job {job_id} completed successfully", flush=True)
+            result_cache.store(payload, input_etag, result)
+            return result
+        elif media_type == "VIDEO":
+            raise NotImplementedError("Video features not yet implemented")
+        else:
+            raise ValueError(f"Unknown media type: {media_type}")
+    except memory.JobDeferred as e:
+        job_status = "DEFERRED"
+        print(f"[JOB] Job {job_id} deferred: {e}", flush=True)
+        raise
+    except Exception as e:
+        job_status = "FAILED"
+        print(f"[JOB] ========== ERROR ==========", flush=True)
+        print(f"[JOB] Job ID: {job_id}", flush=True)
+        print(f"[JOB] Error Type: {type(e).__name__}", flush=True)
+        print(f"[JOB] Error Message: {str(e)}", flush=True)
+        import traceback
+        print(f"[JOB] Full Traceback:", flush=True)
+        traceback.print_exc(file=sys.stdout)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        print(f"[JOB] ==========================", flush=True)
+        raise
+    finally:
+        from services import deadlines
+
+        if job_status != "DEFERRED":
+            deadlines.record_finish(payload)
+        job_metrics.job_finished(payload, job_status)
+
+
+
+
@@ -1,63 +1,40 @@
 from typing import Any, Dict
 
+from celery.worker.request import Request
+
 from celery_app import celery_app
 
 
-@celery_app.task(name="jobs.process_job")
-def process_job(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Main job dispatcher that routes jobs to appropriate handlers based on mediaType.
-    """
-    import sys
-    import os
-    
-    # Force stdout/stderr to be unbuffered so logs appear immediately
-    sys.stdout.flush()
-    sys.stderr.flush()
-    
-    job_id = payload.get("jobId", "unknown")
-    media_type = payload.get("mediaType", "").upper()
-    feature_slug = payload.get("featureSlug", "unknown")
-    params = payload.get("params", {})
-    
-    print(f"[CELERY] ========== PROCESSING JOB ==========", flush=True)
-    print(f"[CELERY] Job ID: {job_id}", flush=True)
-    print(f"[CELERY] Media Type: {media_type}", flush=True)
-    print(f"[CELERY] Feature Slug: {feature_slug}", flush=True)
-    print(f"[CELERY] Params: {params}", flush=True)
-    print(f"[CELERY] Full payload keys: {list(payload.keys())}", flush=True)
-    print(f"[CELERY] ====================================", flush=True)
-    
-    try:
-        if media_type == "IMAGE":
-            print(f"[CELERY] Routing to image feature handler: {feature_slug}", flush=True)
-            from tasks.image import route_image_feature
-            result = route_image_feature(payload)
-            print(f"[CELERY] Job {job_id} completed successfully", flush=True)
-            return result
-        elif media_type == "AUDIO":
-            print(f"[CELERY] Routing to audio feature handler: {feature_slug}", flush=True)
-            from tasks.audio import route_audio_feature
-            result = route_audio_feature(payload)
-            print(f"[CELERY] Job {job_id} completed successfully", flush=True)
-            return result
-        elif media_type == "VIDEO":
-            raise NotImplementedError("Video features not yet implemented")
-        else:
-            raise ValueError(f"Unknown media type: {media_type}")
-    except Exception as e:
-        print(f"[CELERY] ========== ERROR ==========", flush=True)
-        print(f"[CELERY] Job ID: {job_id}", flush=True)
-        print(f"[CELERY] Error Type: {type(e).__name__}", flush=True)
-        print(f"[CELERY] Error Message: {str(e)}", flush=True)
-        import traceback
-        print(f"[CELERY] Full Traceback:", flush=True)
-        traceback.print_exc(file=sys.stdout)
-        sys.stdout.flush()
-        sys.stderr.flush()
-        print(f"[CELERY] ==========================", flush=True)
-        raise
+class JobRequest(Request):
+    """Reports jobs the pool kills at their hard time limit (see services/time_limits.py)."""
 
+    def on_timeout(self, soft, timeout):
+        if not soft:
+            from services import job_metrics, time_limits
 
+            payload = self.args[0] if self.args else {}
+            # Called before the pool kills the child; its ffmpeg would otherwise outlive it.
+            killed = time_limits.kill_children(self.worker_pid) if self.worker_pid else []
+            print(f"[TIME_LIMIT] jobId={payload.get('jobId', 'unknown')} hit its {timeout:.0f}s hard limit, killed subprocesses {killed}", flush=True)
+            time_limits.record_timeout(payload, "hard")
+            time_limits.report_timeout(payload, f"Job timed out after {timeout:.0f}s (hard time limit for {payload.get('featureSlug', 'unknown')})")
+            job_metrics.job_finished(payload, "FAILED")
+        super().on_timeout(soft, timeout)
 
 
+@celery_app.task(name="jobs.process_job", bind=True, Request=JobRequest)
+def process_job(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Main job dispatcher that routes jobs to appropriate handlers based on mediaType.
+
+    A job this child can't afford memory-wise, or whose identical twin is
+    still running elsewhere, is retried a little later instead of holding the
+    child; after MAX_DEFERRALS it runs (or waits) wherever it lands.
+    """
+    from services import memory
+    from tasks.job_runner import run_job
+
+    try:
+        return run_job(payload, may_defer=self.request.retries < memory.MAX_DEFERRALS)
+    except memory.JobDeferred as e:
+        raise self.retry(exc=e, countdown=e.countdown, max_retries=memory.MAX_DEFERRALS)
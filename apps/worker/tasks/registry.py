@@ -0,0 +1,102 @@
+"""
+featureSlug -> task handler, imported on first use.
+
+Handler modules pull in Pillow, pydub, mutagen and the storage clients, so
+nothing here imports them until a job for that feature runs (or preload()
+asks for it). Processes that never run jobs, like the FastAPI consumer in
+main.py, stay free of all of them.
+
+To add a feature, add its slug with the module and function that handle it.
+
+Env:
+    FEATURE_PRELOAD: what preload() imports: "all" (default), "none", or a
+        comma-separated list of media types ("image", "audio") and/or slugs
+"""
+import importlib
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Handler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+FEATURES: Dict[str, Tuple[str, str]] = {
+    "image.resize": ("tasks.image.resize", "resize_image_task"),
+    "image.compress": ("tasks.image.compress", "compress_image_task"),
+    "image.convert": ("tasks.image.convert", "convert_image_task"),
+    "image.convert-jpg": ("tasks.image.convert", "convert_image_task"),
+    "image.quality": ("tasks.image.quality", "quality_control_task"),
+    "audio.trim": ("tasks.audio.trim", "trim_audio_task"),
+    "audio.convert": ("tasks.audio.convert", "convert_audio_task"),
+    "audio.compress": ("tasks.audio.compress", "compress_audio_task"),
+    "audio.normalize": ("tasks.audio.normalize", "normalize_audio_task"),
+    "audio.metadata": ("tasks.audio.metadata", "metadata_audio_task"),
+}
+
+_handlers: Dict[str, Handler] = {}
+_lock = threading.Lock()
+
+
+def features_for(media_type: str) -> List[str]:
+    prefix = f"{media_type.lower()}."
+    return [slug for slug in FEATURES if slug.startswith(prefix)]
+
+
+def get_handler(feature_slug: str) -> Optional[Handler]:
+    """The handler for a slug, importing its module the first time; None if unknown."""
+    handler = _handlers.get(feature_slug)
+    if handler is not None:
+        return handler
+    target = FEATURES.get(feature_slug)
+    if target is None:
+        return None
+
+    module_name, function_name = target
+    with _lock:
+        if feature_slug not in _handlers:
+            try:
+                module = importlib.import_module(module_name)
+            except Exception as import_err:
+                print(f"[REGISTRY] ERROR importing {module_name} for {feature_slug}: {import_err}", flush=True)
+                raise
+            _handlers[feature_slug] = getattr(module, function_name)
+        return _handlers[feature_slug]
+
+
+def dispatch(media_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the handler for payload's featureSlug, which must belong to media_type."""
+    feature_slug = payload.get("featureSlug", "")
+    handler = get_handler(feature_slug) if feature_slug in features_for(media_type) else None
+    if handler is None:
+        error_msg = f"Unknown {media_type.lower()} feature: {feature_slug}"
+        print(f"[ROUTE] ========== ERROR ==========", flush=True)
+        print(f"[ROUTE] {error_msg}", flush=True)
+        print(f"[ROUTE] Available: {', '.join(features_for(media_type))}", flush=True)
+        print(f"[ROUTE] Payload keys: {list(payload.keys())}", flush=True)
+        print(f"[ROUTE] ==========================", flush=True)
+        raise ValueError(error_msg)
+
+    print(f"[ROUTE] jobId={payload.get('jobId', 'unknown')} {feature_slug} -> {handler.__module__}.{handler.__name__}", flush=True)
+    return handler(payload)
+
+
+def preload_slugs() -> List[str]:
+    setting = os.getenv("FEATURE_PRELOAD", "all").strip().lower()
+    if setting in ("", "none"):
+        return []
+    if setting == "all":
+        return list(FEATURES)
+    slugs: List[str] = []
+    for item in (part.strip() for part in setting.split(",")):
+        slugs.extend(features_for(item) if item in ("image", "audio") else [item])
+    return slugs
+
+
+def preload() -> List[str]:
+    """Import the handlers named by FEATURE_PRELOAD; returns the slugs loaded."""
+    loaded = []
+    for feature_slug in preload_slugs():
+        if get_handler(feature_slug) is not None:
+            loaded.append(feature_slug)
+        else:
+            print(f"[REGISTRY] WARNING: FEATURE_PRELOAD names unknown feature {feature_slug}", flush=True)
+    return loaded
@@ -0,0 +1,127 @@
+"""
+Leak regression test: run thousands of image jobs through run_job in this
+process, on the local storage backend, and check that RSS stays flat.
+
+Needs Redis at REDIS_URL (skipped otherwise), Pillow and Linux /proc.
+A local HTTP server stands in for the API's status endpoint.
+
+    cd apps/worker && python -m pytest tests/test_memory_leak.py
+
+Env:
+    LEAK_TEST_JOBS: jobs to run after warm-up (default: 2000)
+    LEAK_TEST_MAX_GROWTH_MB: allowed RSS growth over those jobs (default: 20)
+"""
+import gc
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+WARMUP_JOBS = 50
+FEATURES = [
+    ("image.resize", {"width": 320}),
+    ("image.compress", {"quality": 60}),
+    ("image.convert", {"format": "webp"}),
+]
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def worker_env(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setenv("TEMP_DIR", str(tmp_path / "tmp"))
+    monkeypatch.setenv("INPUT_CACHE_DIR", str(tmp_path / "input-cache"))
+    monkeypatch.setenv("API_BASE_URL", f"http://127.0.0.1:{server.server_port}/api")
+    monkeypatch.setenv("WORKER_API_KEY", "test")
+    # Every job must really decode and encode, not be served or coalesced.
+    monkeypatch.setenv("RESULT_CACHE_TTL_SECONDS", "0")
+    monkeypatch.setenv("SINGLE_FLIGHT", "false")
+
+    from redis_client import get_redis
+    from services import storage
+
+    try:
+        get_redis().ping()
+    except Exception as e:
+        server.shutdown()
+        pytest.skip(f"Redis not reachable: {e}")
+    monkeypatch.setattr(storage, "_backend", None)
+    yield
+    server.shutdown()
+
+
+def _input_key() -> str:
+    from PIL import Image
+
+    from services.storage import get_storage
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1024, 768), (200, 120, 40)).save(buffer, format="PNG")
+    key = "leak-test/org/input.png"
+    get_storage().upload_bytes(buffer.getvalue(), key, "image/png")
+    return key
+
+
+def _run(i: int, input_key: str) -> None:
+    from tasks.job_runner import run_job
+
+    feature_slug, params = FEATURES[i % len(FEATURES)]
+    # Alternate the in-memory and the temp-file paths.
+    os.environ["INMEMORY_MAX_BYTES"] = "0" if i % 2 else str(5 * 1024 * 1024)
+    run_job({
+        "jobId": f"leak-{i}",
+        "orgId": "leak-test",
+        "mediaType": "IMAGE",
+        "featureSlug": feature_slug,
+        "input": {"key": input_key, "mimeType": "image/png"},
+        "params": params,
+    })
+
+
+def test_rss_stays_flat_over_many_jobs(worker_env, monkeypatch):
+    pytest.importorskip("PIL")
+    from services import memory
+
+    if memory.rss_bytes() is None:
+        pytest.skip("RSS not readable on this platform")
+    # _run flips this per job; monkeypatch puts the original back afterwards.
+    monkeypatch.setenv("INMEMORY_MAX_BYTES", "0")
+
+    jobs = int(os.getenv("LEAK_TEST_JOBS", "2000"))
+    max_growth = int(os.getenv("LEAK_TEST_MAX_GROWTH_MB", "20")) * 1024 * 1024
+    input_key = _input_key()
+
+    # Let caches, imports and allocator arenas settle before the baseline.
+    for i in range(WARMUP_JOBS):
+        _run(i, input_key)
+    gc.collect()
+    baseline = memory.rss_bytes()
+
+    for i in range(WARMUP_JOBS, WARMUP_JOBS + jobs):
+        _run(i, input_key)
+    gc.collect()
+    growth = memory.rss_bytes() - baseline
+
+    assert growth < max_growth, (
+        f"RSS grew {growth / (1024 * 1024):.1f}MB over {jobs} jobs "
+        f"(limit {max_growth // (1024 * 1024)}MB)"
+    )
+    assert not os.listdir(os.environ["TEMP_DIR"]), "jobs left temp files behind"